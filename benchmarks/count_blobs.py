@@ -0,0 +1,50 @@
+import time
+
+import click
+import numpy as np
+from skimage import color, feature, io
+
+from src.logic.count_blobs import DEFAULT_TILE_SIZE, detect_blobs
+
+
+def blob_log_in_box(image, box_min_x, box_max_x, box_min_y, box_max_y, min_sigma, max_sigma, threshold):
+    # What count_blobs used to do, detect blobs in the whole image and filter them to the box
+    blobs = feature.blob_log(image, min_sigma=min_sigma, max_sigma=max_sigma, threshold=threshold)
+    inside = ((box_min_x <= blobs[:, 1]) & (blobs[:, 1] < box_max_x)
+              & (box_min_y <= blobs[:, 0]) & (blobs[:, 0] < box_max_y))
+    return blobs[inside]
+
+
+def measure(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+@click.command()
+@click.option("--input-path", type=click.Path(exists=True), default="sample_data/count_blobs/SEM_1.jpg",
+              help="Path to the input image")
+@click.option("--repeat", type=click.IntRange(min=1), default=4,
+              help="Number of copies of the image along each axis, to make a large image")
+@click.option("--box-fraction", type=float, multiple=True, default=[1.0, 0.25],
+              help="Side of the box centered in the image, as a fraction of the image side")
+@click.option("--tile-size", type=click.IntRange(min=1), default=DEFAULT_TILE_SIZE, help="Size of square tiles")
+@click.option("--n-workers", type=click.IntRange(min=1), multiple=True, default=[1, 4],
+              help="Number of threads searching tiles")
+def benchmark_count_blobs(input_path, repeat, box_fraction, tile_size, n_workers):
+    """Compares blob_log of the whole image with tiled detection, both filtered to the box."""
+    image = np.tile(color.rgb2gray(io.imread(input_path)), (repeat, repeat))
+    print(f"image {image.shape[1]} x {image.shape[0]}")
+    print(f"{'box':>6}{'workers':>9}{'blob_log [s]':>14}{'tiled [s]':>11}{'blobs':>8}{'blob_log blobs':>16}")
+    for fraction in box_fraction:
+        width, height = int(image.shape[1] * fraction), int(image.shape[0] * fraction)
+        min_x, min_y = (image.shape[1] - width) // 2, (image.shape[0] - height) // 2
+        box = (min_x, min_x + width, min_y, min_y + height)
+        expected, blob_log_elapsed = measure(blob_log_in_box, image, *box, 1, 2, 0.01)
+        for n in n_workers:
+            blobs, elapsed = measure(detect_blobs, image, *box, 1, 2, 0.01, tile_size=tile_size, n_workers=n)
+            print(f"{fraction:>6.2f}{n:>9}{blob_log_elapsed:>14.4f}{elapsed:>11.4f}{len(blobs):>8}{len(expected):>16}")
+
+
+if __name__ == '__main__':
+    benchmark_count_blobs()
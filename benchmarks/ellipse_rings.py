@@ -0,0 +1,45 @@
+import time
+
+import click
+import numpy as np
+
+from src.logic.ellipses import inside_ellipse, sum_and_count_inside_ellipses
+
+
+def masked_sums_and_counts(grid_x, grid_y, grid_z, long_radii, radii_ratio):
+    # What print_avg_z_rings used to do, a full grid mask per ellipse
+    sums, counts = [], []
+    for r1 in long_radii:
+        points_inside_ellipse = grid_z[np.broadcast_to(inside_ellipse(grid_x, grid_y, r1, radii_ratio), grid_z.shape)]
+        sums.append(np.sum(points_inside_ellipse))
+        counts.append(points_inside_ellipse.size)
+    return np.array(sums), np.array(counts)
+
+
+@click.command()
+@click.option("--grid-size", "-g", type=int, multiple=True, default=[500, 2000],
+              help="Number of grid points along each axis")
+@click.option("--n-rings", "-n", type=int, multiple=True, default=[20, 200],
+              help="Number of ellipses")
+def benchmark_ellipse_rings(grid_size, n_rings):
+    """Compares ring averaging with a mask per ellipse and with a single pass over the grid."""
+    print(f"{'grid':>6}{'rings':>7}{'masks [s]':>11}{'single pass [s]':>17}")
+    radii_ratio = 1.2
+    for size in grid_size:
+        grid_x = np.mgrid[-1200:1200:(size * 1j)][:, np.newaxis]
+        grid_y = np.mgrid[-1000:1000:(size * 1j)][np.newaxis, :]
+        grid_z = np.random.default_rng(0).normal(size=(size, size))
+        for n in n_rings:
+            long_radii = np.linspace(1200.0 / n, 1200.0, n)
+            start = time.perf_counter()
+            expected_sums, expected_counts = masked_sums_and_counts(grid_x, grid_y, grid_z, long_radii, radii_ratio)
+            masks_elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            sums, counts = sum_and_count_inside_ellipses(grid_x, grid_y, grid_z, long_radii, radii_ratio)
+            elapsed = time.perf_counter() - start
+            assert np.array_equal(expected_counts, counts) and np.allclose(expected_sums, sums)
+            print(f"{size:>6}{n:>7}{masks_elapsed:>11.4f}{elapsed:>17.4f}")
+
+
+if __name__ == '__main__':
+    benchmark_ellipse_rings()
@@ -0,0 +1,49 @@
+import time
+import tracemalloc
+
+import click
+import numpy as np
+
+from src.logic.ellipses import nearest_index
+
+
+def argmin_nearest_index(samples, values):
+    # What step_function used to do, builds a len(samples) x values.shape temporary array
+    return np.argmin(np.abs(samples[:, np.newaxis, np.newaxis] - values), axis=0)
+
+
+def measure(function, samples, values):
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = function(samples, values)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return index, elapsed, peak
+
+
+@click.command()
+@click.option("--n-samples", "-n", type=int, multiple=True, default=[50, 500, 5000],
+              help="Number of samples of the synthetic diameter profile(s)")
+@click.option("--grid-size", type=int, default=500, help="Number of grid points along each axis")
+@click.option("--max-argmin-samples", type=int, default=1000,
+              help="Largest number of samples to run the argmin lookup with, it needs n x grid x grid floats")
+def benchmark_nearest_index(n_samples, grid_size, max_argmin_samples):
+    """Compares the nearest sample lookup of step_function by np.argmin and by np.searchsorted."""
+    print(f"{'samples':>8}{'argmin [s]':>12}{'argmin [MB]':>13}{'bisect [s]':>12}{'bisect [MB]':>13}")
+    for n in n_samples:
+        samples = np.linspace(-1000.0, 1000.0, n)
+        grid_x, grid_y = np.mgrid[-1000:1000:(grid_size * 1j), -800:800:(grid_size * 1j)]
+        values = np.sign(grid_x) * np.sqrt(grid_x ** 2 + grid_y ** 2)
+        index, elapsed, peak = measure(nearest_index, samples, values)
+        if n <= max_argmin_samples:
+            expected, argmin_elapsed, argmin_peak = measure(argmin_nearest_index, samples, values)
+            assert np.array_equal(expected, index)
+            argmin_columns = f"{argmin_elapsed:>12.4f}{argmin_peak / 2 ** 20:>13.1f}"
+        else:
+            argmin_columns = f"{'-':>12}{'-':>13}"
+        print(f"{n:>8}{argmin_columns}{elapsed:>12.4f}{peak / 2 ** 20:>13.1f}")
+
+
+if __name__ == '__main__':
+    benchmark_nearest_index()
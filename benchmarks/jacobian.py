@@ -0,0 +1,63 @@
+import glob
+import os.path as path_utils
+import time
+
+import click
+
+from src.logic.deconvolution import Deconvolver
+from src.logic.deconvolution_batch import load_properties
+from src.logic.jacobian import jacobian_fit_kws, move_off_bounds
+
+SAMPLE_DATA_DIR = path_utils.join(path_utils.dirname(path_utils.realpath(__file__)),
+                                  "..", "sample_data", "deconvolution")
+
+
+@click.command()
+@click.option("--properties-file", "-p",
+              type=click.Path(exists=True),
+              default=path_utils.join(SAMPLE_DATA_DIR, "model.properties"),
+              help="Path to the fitting model properties file")
+@click.option("--input-dir", "-i",
+              type=click.Path(exists=True),
+              default=SAMPLE_DATA_DIR,
+              help="Directory with .dpt signal files")
+@click.option("--method", "-m", "methods",
+              multiple=True,
+              default=["leastsq", "least_squares"],
+              help="Fitting method(s) to compare")
+@click.option("--repeat", type=int, default=3, help="Number of fits of every file, the fastest one is reported")
+def benchmark_jacobian(properties_file, input_dir, methods, repeat):
+    """Compares numeric and analytic jacobians by wall time and number of function evaluations."""
+    deconvolver = Deconvolver()
+    properties = load_properties(properties_file)
+    filenames = sorted(glob.glob(path_utils.join(input_dir, "*.dpt")))
+    print(f"{'method':<15}{'jacobian':<10}{'file':<20}{'nfev':>8}{'chi-square':>14}{'time [s]':>10}")
+    for method in methods:
+        for jacobian in ("numeric", "analytic"):
+            total_time = 0.0
+            total_nfev = 0
+            for filename in filenames:
+                x, signal = deconvolver.read_signal(filename, properties)
+                best_time = None
+                for _ in range(repeat):
+                    composite_model, composite_params = deconvolver.build_model(properties, x, signal)
+                    if jacobian == "analytic" and method == "leastsq":
+                        move_off_bounds(composite_params)
+                    start = time.perf_counter()
+                    result = composite_model.fit(data=signal,
+                                                 x=x,
+                                                 params=composite_params,
+                                                 method=method,
+                                                 fit_kws=jacobian_fit_kws(method, jacobian),
+                                                 calc_covar=False)
+                    elapsed = time.perf_counter() - start
+                    best_time = elapsed if best_time is None else min(best_time, elapsed)
+                total_time = total_time + best_time
+                total_nfev = total_nfev + result.nfev
+                print(f"{method:<15}{jacobian:<10}{path_utils.basename(filename):<20}"
+                      f"{result.nfev:>8}{result.chisqr:>14.6f}{best_time:>10.4f}")
+            print(f"{method:<15}{jacobian:<10}{'total':<20}{total_nfev:>8}{'':>14}{total_time:>10.4f}")
+
+
+if __name__ == '__main__':
+    benchmark_jacobian()
@@ -0,0 +1,51 @@
+import os.path as path_utils
+import shutil
+import tempfile
+import time
+
+import click
+import numpy as np
+
+from src.logic.signal_reader import SignalReader
+
+SEPARATORS = {"comma": ",", "tab": "\t", "space": " "}
+
+
+def write_synthetic_signal(path, n_points, separator, seed=0):
+    x = np.linspace(400.0, 4000.0, n_points)
+    signal = np.random.default_rng(seed).normal(size=n_points)
+    np.savetxt(path, np.column_stack([x, signal]), fmt="%.5f", delimiter=separator)
+
+
+@click.command()
+@click.option("--n-points", "-n", type=int, multiple=True, default=[10_000, 100_000, 1_000_000],
+              help="Number of points of the synthetic signal(s)")
+@click.option("--input-format-separator", default="\\ +|\\t+|,",
+              help="The input_format_separator property, a regular expression")
+@click.option("--repeat", type=int, default=3, help="Number of reads of every file, the fastest one is reported")
+def benchmark_signal_reader(n_points, input_format_separator, repeat):
+    """Compares the regular expression parser with the detected plain separator parser."""
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        print(f"{'points':>10}{'separator':>11}{'regex [s]':>12}{'fast [s]':>12}{'speedup':>9}")
+        for n in n_points:
+            for name, separator in SEPARATORS.items():
+                path = path_utils.join(tmp_dir, f"signal_{n}_{name}.dpt")
+                write_synthetic_signal(path, n, separator)
+                reader = SignalReader(input_format_separator, False)
+                timings = []
+                for read in (reader.read_with_regex, reader.read):
+                    best_time = None
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        read(path)
+                        elapsed = time.perf_counter() - start
+                        best_time = elapsed if best_time is None else min(best_time, elapsed)
+                    timings.append(best_time)
+                print(f"{n:>10}{name:>11}{timings[0]:>12.4f}{timings[1]:>12.4f}{timings[0] / timings[1]:>8.1f}x")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    benchmark_signal_reader()
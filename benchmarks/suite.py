@@ -0,0 +1,200 @@
+import gc
+import json
+import os.path as path_utils
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import click
+import numpy as np
+from scipy import ndimage as ndi
+
+from src.logic.count_blobs import detect_blobs
+from src.logic.deconvolution import Deconvolver
+from src.logic.ellipses import extrapolate
+
+# Sizes of every case, the quick ones are a subset to check that the suite still runs
+DECONVOLUTION_SIZES = {"full": {"n_points": [200, 2000], "n_peaks": [2, 6], "method": ["leastsq", "least_squares"]},
+                       "quick": {"n_points": [200], "n_peaks": [2], "method": ["leastsq"]}}
+ELLIPSE_SIZES = {"full": {"grid": [200, 500, 1000], "n_samples": [40, 400]},
+                 "quick": {"grid": [100], "n_samples": [40]}}
+BLOB_SIZES = {"full": {"size": [256, 1024, 2048]},
+              "quick": {"size": [128]}}
+
+
+def synthetic_signal(n_points, n_peaks, seed=0):
+    """Sum of n_peaks Gaussians with some noise, and the centers and sigmas of the Gaussians."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(1700.0, 1800.0, n_points)
+    centers = np.linspace(1710.0, 1790.0, n_peaks)
+    sigmas = rng.uniform(3.0, 6.0, n_peaks)
+    amplitudes = rng.uniform(1.0, 5.0, n_peaks)
+    signal = sum(Deconvolver.gaussian(x, a, c, s) for a, c, s in zip(amplitudes, centers, sigmas))
+    return x, signal + rng.normal(0.0, 0.001, n_points), centers, sigmas
+
+
+def synthetic_properties(method, centers, sigmas):
+    properties = {"input_format_header": "False",
+                  "input_format_separator": ",",
+                  "method": method,
+                  "n_gauss": str(len(centers)),
+                  "n_lorentz": "0",
+                  "include_background": "False",
+                  "gauss_peak_amp_min_default": "0",
+                  "gauss_peak_amp_max_default": "100"}
+    for i, (center, sigma) in enumerate(zip(centers, sigmas), start=1):
+        properties[f"gauss_peak{i}_mu_min"] = str(center - 1.0)
+        properties[f"gauss_peak{i}_mu_max"] = str(center + 1.0)
+        properties[f"gauss_peak{i}_sigma_min"] = str(sigma * 0.8)
+        properties[f"gauss_peak{i}_sigma_max"] = str(sigma * 1.2)
+    return properties
+
+
+def synthetic_diameter(n_samples, radius):
+    """Dome shaped profile of n_samples (position, value) rows across a diameter."""
+    positions = np.linspace(-radius, radius, n_samples)
+    return np.column_stack([positions, np.sqrt(np.maximum(radius ** 2 - positions ** 2, 0.0))])
+
+
+def synthetic_image(size, seed=0):
+    """Grayscale image of blurred dots of random sizes on a noisy background."""
+    rng = np.random.default_rng(seed)
+    image = np.zeros((size, size))
+    n_dots = size * size // 200
+    image[rng.integers(0, size, n_dots), rng.integers(0, size, n_dots)] = rng.uniform(0.5, 1.0, n_dots)
+    image = ndi.gaussian_filter(image, 1.5) * 10.0
+    return np.clip(image + rng.normal(0.0, 0.02, image.shape), 0.0, 1.0)
+
+
+def deconvolution_cases(sizes, tmp_dir):
+    deconvolver = Deconvolver()
+    for n_points in sizes["n_points"]:
+        for n_peaks in sizes["n_peaks"]:
+            x, signal, centers, sigmas = synthetic_signal(n_points, n_peaks)
+            signal_file = path_utils.join(tmp_dir, f"signal_{n_points}_{n_peaks}.dpt")
+            np.savetxt(signal_file, np.column_stack([x, signal]), delimiter=",")
+            for method in sizes["method"]:
+                properties = synthetic_properties(method, centers, sigmas)
+
+                def run(signal_file=signal_file, properties=properties):
+                    status = deconvolver.deconvolve_single_file(signal_file, "experiment", properties,
+                                                                plot_peaks=False, aggregate=False)
+                    if status["exit_code"] != 0:
+                        raise RuntimeError(status["error_message"])
+
+                yield f"deconvolution/{method}/points={n_points}/peaks={n_peaks}", run
+
+
+def ellipse_cases(sizes):
+    for grid in sizes["grid"]:
+        for n_samples in sizes["n_samples"]:
+            long_diameter = synthetic_diameter(n_samples, 1200.0)
+            short_diameter = synthetic_diameter(n_samples, 1000.0)
+            yield (f"ellipses/grid={grid}/samples={n_samples}",
+                   lambda grid=grid, long_diameter=long_diameter, short_diameter=short_diameter:
+                   extrapolate(long_diameter, short_diameter, grid_x_points=grid, grid_y_points=grid))
+
+
+def blob_cases(sizes):
+    for size in sizes["size"]:
+        image = synthetic_image(size)
+        yield (f"count_blobs/size={size}",
+               lambda image=image: detect_blobs(image, 0, image.shape[1], 0, image.shape[0], 1, 2, 0.01,
+                                                n_workers=1))
+
+
+def measure(run, repeat):
+    """Fastest wall time of repeat runs in seconds, and peak traced memory of another run in bytes."""
+    seconds = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    # Tracing slows allocations down, so memory is measured separately from time
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def run_suite(size, repeat, selected=None):
+    """Results of every benchmark case whose name starts with one of `selected`, by name."""
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        cases = [*deconvolution_cases(DECONVOLUTION_SIZES[size], tmp_dir),
+                 *ellipse_cases(ELLIPSE_SIZES[size]),
+                 *blob_cases(BLOB_SIZES[size])]
+        results = {}
+        for name, run in cases:
+            if selected and not any(name.startswith(s) for s in selected):
+                continue
+            seconds, peak = measure(run, repeat)
+            results[name] = {"seconds": seconds, "peak_memory_bytes": peak}
+            print(f"{name:<50}{seconds:>12.4f}{peak / 2 ** 20:>12.1f}", flush=True)
+        return results
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    """Names of cases, whose time or peak memory grew by more than the tolerance relative to the baseline."""
+    regressions = []
+    print(f"{'case':<50}{'time ratio':>12}{'memory ratio':>14}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<50}{'new':>12}{'new':>14}")
+            continue
+        time_ratio = result["seconds"] / baseline[name]["seconds"]
+        memory_ratio = result["peak_memory_bytes"] / max(1, baseline[name]["peak_memory_bytes"])
+        regressed = time_ratio > 1.0 + time_tolerance or memory_ratio > 1.0 + memory_tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<50}{time_ratio:>12.2f}{memory_ratio:>14.2f}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+@click.command()
+@click.option("--size", type=click.Choice(["full", "quick"]), default="full", help="Sizes of the cases")
+@click.option("--repeat", type=click.IntRange(min=1), default=3,
+              help="Number of runs of every case, the fastest one is reported")
+@click.option("--case", "-k", "cases", multiple=True,
+              help="Run only cases with names starting with this, e.g. ellipses or deconvolution/leastsq")
+@click.option("--save-baseline", type=click.Path(dir_okay=False), help="Path to write the results to as a baseline")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False),
+              help="Path to a baseline to compare the results against")
+@click.option("--time-tolerance", type=float, default=0.25,
+              help="Largest relative growth of time not flagged as a regression")
+@click.option("--memory-tolerance", type=float, default=0.10,
+              help="Largest relative growth of peak memory not flagged as a regression")
+def benchmark_suite(size, repeat, cases, save_baseline, baseline, time_tolerance, memory_tolerance):
+    """Times the hot paths of deconvolution, ellipse extrapolation and blob counting on synthetic data.
+
+    Exits with 1 if a case regressed against the baseline.
+    """
+    print(f"{'case':<50}{'time [s]':>12}{'peak [MB]':>12}")
+    results = run_suite(size, repeat, cases)
+    if save_baseline is not None:
+        with open(save_baseline, "w") as file:
+            json.dump({"python": platform.python_version(),
+                       "numpy": np.__version__,
+                       "machine": platform.machine(),
+                       "results": results}, file, indent=4)
+    if baseline is not None:
+        with open(baseline, "r") as file:
+            regressions = compare(results, json.load(file)["results"], time_tolerance, memory_tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    benchmark_suite()
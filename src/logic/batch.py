@@ -0,0 +1,60 @@
+import glob
+import json
+import os
+import os.path as path_utils
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def find_files(inputs, pattern="*", extensions=None):
+    """Absolute paths of files of `inputs`, which are directories, files or glob patterns of files.
+
+    Files of a directory are those matching the glob `pattern`, and if `extensions` are given,
+    ending with one of them, in any case. Files and glob patterns are taken as they are.
+    """
+    files = []
+    for i in inputs:
+        if path_utils.isdir(i):
+            files.extend(sorted(f for f in glob.glob(path_utils.join(i, pattern))
+                                if extensions is None or path_utils.splitext(f)[1].lower() in extensions))
+        elif path_utils.isfile(i):
+            files.append(i)
+        else:
+            files.extend(sorted(glob.glob(i)))
+    return [path_utils.abspath(f) for f in files]
+
+
+def run_items(function, items, arguments=(), n_workers=None, key="result"):
+    """Yields (index, item, status) tuples of `function(item, *arguments)` as soon as items finish.
+
+    Items run on a pool of n_workers processes (defaults to CPUs), or one after another in this
+    process with a single worker or item. `function` and its arguments must be picklable then.
+    A status is a dict with "exit_code", the result of `function` under `key` and "error_message".
+    """
+    n_workers = max(1, n_workers or os.cpu_count() or 1)
+    if n_workers == 1 or len(items) <= 1:
+        for i, item in enumerate(items):
+            yield i, item, item_status(lambda: function(item, *arguments), key)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(items))) as executor:
+        futures = {executor.submit(function, item, *arguments): i for i, item in enumerate(items)}
+        for future in as_completed(futures):
+            i = futures[future]
+            yield i, items[i], item_status(future.result, key)
+
+
+def item_status(result, key="result"):
+    """Status of calling `result`, with its return value under `key`, or the error it raised."""
+    try:
+        return {"exit_code": 0, key: result(), "error_message": None}
+    except Exception as e:
+        return failure_status(e, key)
+
+
+def failure_status(error, *keys):
+    """Status of a failed item, with `keys` of its results set to None."""
+    return {"exit_code": 1, **{key: None for key in keys}, "error_message": "{message}\n".format(message=str(error))}
+
+
+def print_progress_record(**record):
+    print(json.dumps(record), flush=True)
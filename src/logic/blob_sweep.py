@@ -0,0 +1,161 @@
+import hashlib
+import itertools
+import os
+import os.path as path_utils
+import threading
+from collections import OrderedDict
+
+import click
+import numpy as np
+import pandas as pd
+
+from src.logic.count_blobs import (blobs_in_box, load_image, log_scale_space, log_sigma_list, prune_local_maxima,
+                                   scale_space_local_maxima)
+
+# Bytes of scale spaces kept in memory by default, about three of a 2048 x 2048 image
+DEFAULT_MAX_MEMORY = 2 ** 30
+
+SWEEP_TABLE_COLUMNS = ["min_sigma", "max_sigma", "threshold", "box_min_x", "box_max_x", "box_min_y", "box_max_y",
+                       "count"]
+
+
+def image_hash(image):
+    """Hash of the pixels, shape and type of an image."""
+    digest = hashlib.sha256()
+    digest.update(f"{image.shape}{image.dtype.str}".encode("ascii"))
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+def sigma_list_hash(sigma_list):
+    return hashlib.sha256(np.ascontiguousarray(sigma_list, dtype=np.float64).data).hexdigest()[:16]
+
+
+class ScaleSpaceCache:
+    """Laplacian of Gaussian scale spaces of images, see `log_scale_space`, keyed by image hash and sigmas.
+
+    Scale spaces are kept in memory, least recently used ones are dropped once all take more than
+    max_memory bytes, the latest one is always kept. With a cache_dir they are also saved as
+    <image hash>_<sigmas hash>.npy files there, and memory-mapped from there instead of kept in
+    memory, by this and by later runs.
+    """
+
+    def __init__(self, cache_dir=None, max_memory=DEFAULT_MAX_MEMORY):
+        self.cache_dir = cache_dir
+        self.max_memory = max_memory
+        self.scale_spaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def scale_space(self, image, sigma_list, key=None):
+        """Scale space of the image, `key` is its image hash if already known."""
+        key = (key or image_hash(image), sigma_list_hash(sigma_list))
+        with self.lock:
+            if key in self.scale_spaces:
+                self.hits += 1
+                self.scale_spaces.move_to_end(key)
+                return self.scale_spaces[key]
+        cache_file = None if self.cache_dir is None else path_utils.join(self.cache_dir, "{}_{}.npy".format(*key))
+        if cache_file is not None and path_utils.exists(cache_file):
+            image_cube = np.load(cache_file, mmap_mode="r")
+            hit = True
+        else:
+            image_cube = log_scale_space(image, sigma_list)
+            hit = False
+            if cache_file is not None:
+                # Rename, so that concurrent runs never read a partially written file
+                tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp.npy"
+                np.save(tmp_file, image_cube)
+                os.replace(tmp_file, cache_file)
+                image_cube = np.load(cache_file, mmap_mode="r")
+        with self.lock:
+            self.hits += hit
+            self.misses += not hit
+            self.scale_spaces[key] = image_cube
+            self.scale_spaces.move_to_end(key)
+            while len(self.scale_spaces) > 1 and self.memory() > self.max_memory:
+                self.scale_spaces.popitem(last=False)
+        return image_cube
+
+    def memory(self):
+        """Bytes of scale spaces kept in memory, memory-mapped ones are paged in and out by the system."""
+        return sum(image_cube.nbytes for image_cube in self.scale_spaces.values()
+                   if not isinstance(image_cube, np.memmap))
+
+
+def sweep_blobs(image, sigmas, thresholds, boxes, cache=None, key=None):
+    """Blob counts of every sigma range, threshold and box, as a table with `SWEEP_TABLE_COLUMNS`.
+
+    `sigmas` are (min_sigma, max_sigma) pairs, and `boxes` (min_x, max_x, min_y, max_y) tuples with -1
+    for the width or height of the image. The scale space of a sigma range is computed once for
+    the whole image, and its local maxima once for the lowest threshold, higher thresholds keep
+    the maxima above them. Counts are the same as those of blob_log of the whole image in the box.
+    """
+    cache = cache or ScaleSpaceCache()
+    key = key or image_hash(image)
+    boxes = [(box_min_x, image.shape[1] if box_max_x == -1 else box_max_x,
+              box_min_y, image.shape[0] if box_max_y == -1 else box_max_y)
+             for box_min_x, box_max_x, box_min_y, box_max_y in boxes]
+    rows = []
+    for min_sigma, max_sigma in sigmas:
+        sigma_list = log_sigma_list(min_sigma, max_sigma, image.ndim)
+        image_cube = cache.scale_space(image, sigma_list, key)
+        coordinates, intensities = scale_space_local_maxima(image_cube, min(thresholds))
+        for threshold in thresholds:
+            above = intensities > threshold
+            blobs = prune_local_maxima(coordinates[above], intensities[above], sigma_list)
+            for box in boxes:
+                rows.append([min_sigma, max_sigma, threshold, *box, len(blobs_in_box(blobs, *box))])
+    return pd.DataFrame(rows, columns=SWEEP_TABLE_COLUMNS)
+
+
+def parse_box(box):
+    try:
+        values = tuple(int(v) for v in box.split(","))
+    except ValueError:
+        values = ()
+    if len(values) != 4:
+        raise click.BadParameter(f"Expected min_x,max_x,min_y,max_y integers, got: {box}")
+    return values
+
+
+@click.command()
+@click.option("--input-path", type=click.Path(exists=True), required=True, multiple=True,
+              help="Path to an input image, may be repeated")
+@click.option("--output-path", type=click.Path(), help="Path to the output csv table, printed if not given")
+@click.option("--log-min-sigma", type=float, multiple=True, default=[1], help="Laplacian of Gaussian minimum sigma(s)")
+@click.option("--log-max-sigma", type=float, multiple=True, default=[2], help="Laplacian of Gaussian maximum sigma(s)")
+@click.option("--log-threshold", type=float, multiple=True, default=[0.01, 0.02, 0.05, 0.1, 0.2],
+              help="Laplacian of Gaussian threshold(s)")
+@click.option("--box", "boxes", multiple=True, default=["0,-1,0,-1"],
+              help="Box as min_x,max_x,min_y,max_y, -1 for the image width or height, may be repeated")
+@click.option("--cache-dir", type=click.Path(file_okay=False),
+              help="Directory keeping scale spaces between runs, kept in memory only if not given")
+@click.option("--max-memory-mb", type=click.IntRange(min=0), default=DEFAULT_MAX_MEMORY // 2 ** 20,
+              help="Megabytes of scale spaces kept in memory, least recently used ones are computed again")
+def sweep_blob_counts(input_path, output_path, log_min_sigma, log_max_sigma, log_threshold, boxes, cache_dir,
+                      max_memory_mb):
+    """Counts blobs of every combination of sigmas, thresholds and boxes into a count-vs-threshold table."""
+    boxes = [parse_box(box) for box in boxes]
+    sigmas = [(min_sigma, max_sigma) for min_sigma, max_sigma in itertools.product(log_min_sigma, log_max_sigma)
+              if min_sigma <= max_sigma]
+    if len(sigmas) == 0:
+        raise click.UsageError("No minimum sigma is lower than or equal to a maximum sigma!")
+    cache = ScaleSpaceCache(cache_dir, max_memory_mb * 2 ** 20)
+    tables = []
+    for path in input_path:
+        table = sweep_blobs(load_image(path), sigmas, log_threshold, boxes, cache)
+        table.insert(0, "image", path_utils.abspath(path))
+        tables.append(table)
+    table = pd.concat(tables, ignore_index=True)
+    if output_path is None:
+        click.echo(table.to_string(index=False))
+    else:
+        table.to_csv(path_or_buf=output_path, index=False)
+
+
+if __name__ == '__main__':
+    sweep_blob_counts()
@@ -1,7 +1,21 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import click
-from skimage import feature, color, io
+import numpy as np
+from scipy import ndimage as ndi
+from scipy import spatial
+from skimage import feature, color, io, util
 import matplotlib.pyplot as plt
 
+# Tiles of larger boxes are searched for blobs separately, and in parallel
+DEFAULT_TILE_SIZE = 1024
+
+# Defaults of skimage.feature.blob_log
+LOG_NUM_SIGMA = 10
+LOG_OVERLAP = 0.5
+
 
 @click.command()
 @click.option("--input-path", type=click.Path(exists=True), required=True, help="Path to the input image")
@@ -13,6 +27,9 @@ import matplotlib.pyplot as plt
 @click.option("--log-min-sigma", type=float, default=1, help="Laplacian of Gaussian minimum sigma")
 @click.option("--log-max-sigma", type=float, default=2, help="Laplacian of Gaussian maximum sigma")
 @click.option("--log-threshold", type=float, default=0.01, help="Laplacian of Gaussian threshold")
+@click.option("--tile-size", type=click.IntRange(min=1), default=DEFAULT_TILE_SIZE,
+              help="Size of square tiles of the box, which are searched for blobs separately")
+@click.option("--n-workers", type=click.IntRange(min=1), help="Number of threads searching tiles, defaults to CPUs")
 @click.option('--skip-plotting-results',
               is_flag=True,
               default=False,
@@ -30,33 +47,189 @@ def count_blobs(input_path,
                 log_min_sigma,
                 log_max_sigma,
                 log_threshold,
+                tile_size,
+                n_workers,
                 skip_plotting_results,
                 skip_saving_results):
-    image = color.rgb2gray(io.imread(input_path))
+    image = load_image(input_path)
 
     # Correctly set box boundaries
     box_max_x = image.shape[1] if box_max_x == -1 else box_max_x
     box_max_y = image.shape[0] if box_max_y == -1 else box_max_y
 
-    blobs_log = feature.blob_log(
-        image,
-        min_sigma=log_min_sigma,
-        max_sigma=log_max_sigma,
-        threshold=log_threshold
-    )
+    blobs_in_box = detect_blobs(image,
+                                box_min_x=box_min_x,
+                                box_max_x=box_max_x,
+                                box_min_y=box_min_y,
+                                box_max_y=box_max_y,
+                                min_sigma=log_min_sigma,
+                                max_sigma=log_max_sigma,
+                                threshold=log_threshold,
+                                tile_size=tile_size,
+                                n_workers=n_workers)
 
-    # Compute radii
-    blobs_log[:, 2] = blobs_log[:, 2] * (2 ** 0.5)
+    if not skip_plotting_results or not skip_saving_results:
+        # Display
+        fig, ax = plt.subplots()
+        plot_blobs(ax, image, box_min_x, box_max_x, box_min_y, box_max_y, blobs_in_box)
+
+        if not skip_plotting_results:
+            plt.show()
+        if not skip_saving_results:
+            plt.savefig(output_path)
+
+    print(f"Total blobs found in box: {len(blobs_in_box)}")
+
+
+def detect_blobs(image, box_min_x, box_max_x, box_min_y, box_max_y, min_sigma, max_sigma, threshold,
+                 tile_size=DEFAULT_TILE_SIZE, n_workers=None):
+    """Blobs of a grayscale float image with centers inside the box, as rows of (y, x, radius).
+
+    Same as skimage.feature.blob_log of the whole image, filtered to the box. The whole image is
+    searched for local maxima of the Laplacian of Gaussian, in square tiles of `tile_size` on a
+    pool of n_workers threads, and all of them are pruned before blobs are filtered to the box.
+    blob_log prunes overlapping blobs in the order of a set of pairs of all of them, which differs
+    for any subset of the maxima, so blobs well inside a box may be pruned differently if only
+    the box and its surroundings were searched.
+    """
+    tiles = [(tile_min_y, min(tile_min_y + tile_size, image.shape[0]),
+              tile_min_x, min(tile_min_x + tile_size, image.shape[1]))
+             for tile_min_y in range(0, image.shape[0], tile_size)
+             for tile_min_x in range(0, image.shape[1], tile_size)]
+    sigma_list = log_sigma_list(min_sigma, max_sigma, image.ndim)
+
+    def find_maxima(tile):
+        return find_local_maxima(image, *tile, sigma_list, threshold)
+
+    n_workers = max(1, n_workers or os.cpu_count() or 1)
+    if n_workers == 1 or len(tiles) <= 1:
+        maxima = [find_maxima(tile) for tile in tiles]
+    else:
+        with ThreadPoolExecutor(max_workers=min(n_workers, len(tiles))) as executor:
+            maxima = list(executor.map(find_maxima, tiles))
+    coordinates = np.concatenate([c for c, _ in maxima]) if maxima else np.empty((0, 3), dtype=np.intp)
+    intensities = np.concatenate([i for _, i in maxima]) if maxima else np.empty(0)
+    blobs = prune_local_maxima(coordinates, intensities, sigma_list)
 
     # Filter blobs inside the box
-    blobs_in_box = [
-        (y, x, r)
-        for y, x, r in blobs_log
-        if box_min_x <= x < box_max_x and box_min_y <= y < box_max_y
-    ]
-
-    # Display
-    fig, ax = plt.subplots()
+    return blobs_in_box(blobs, box_min_x, box_max_x, box_min_y, box_max_y)
+
+
+def log_sigma_list(min_sigma, max_sigma, ndim=2):
+    """Sigmas of the scale space of blob_log, one row per scale."""
+    return np.linspace(np.full(ndim, min_sigma, dtype=np.float64),
+                       np.full(ndim, max_sigma, dtype=np.float64),
+                       LOG_NUM_SIGMA)
+
+
+def log_scale_space(image, sigma_list):
+    """Same scale space as blob_log, scale normalized negative Laplacians of Gaussian stacked along the last axis."""
+    image_cube = np.empty(image.shape + (len(sigma_list),), dtype=np.float64)
+    for i, s in enumerate(sigma_list):
+        image_cube[..., i] = -ndi.gaussian_laplace(image, s) * np.mean(s) ** 2
+    return image_cube
+
+
+def scale_space_local_maxima(image_cube, threshold):
+    """Local maxima of a scale space above threshold, as (y, x, sigma index) rows and intensities.
+
+    Local maxima above a higher threshold are those of these with higher intensities.
+    """
+    coordinates = feature.peak_local_max(image_cube,
+                                         threshold_abs=threshold,
+                                         exclude_border=False,
+                                         footprint=np.ones((3,) * image_cube.ndim))
+    return coordinates, image_cube[tuple(coordinates.T)]
+
+
+def prune_local_maxima(coordinates, intensities, sigma_list):
+    """Blobs as rows of (y, x, radius) of local maxima of the scale space, pruned like blob_log prunes them."""
+    if len(coordinates) == 0:
+        return np.empty((0, 3))
+
+    # Order of peak_local_max of the whole image: highest first, then by position
+    order = np.lexsort((coordinates[:, 2], coordinates[:, 1], coordinates[:, 0], -intensities))
+    coordinates = coordinates[order]
+    blobs = np.hstack([coordinates[:, :-1].astype(np.float64), sigma_list[coordinates[:, -1]][:, 0:1]])
+    blobs = prune_blobs(blobs, LOG_OVERLAP)
+
+    # Compute radii
+    blobs[:, 2] = blobs[:, 2] * (2 ** 0.5)
+    return blobs
+
+
+# Pruning of overlapping blobs, exactly as blob_log does it. Adapted to 2D blobs with a single
+# sigma from the private _prune_blobs, _blob_overlap and _compute_disk_overlap of
+# skimage.feature.blob (scikit-image 0.26, BSD-3-Clause), which may change between its releases
+
+
+def prune_blobs(blobs, overlap):
+    """Blobs as rows of (y, x, sigma) without the smaller one of every pair overlapping by more than `overlap`.
+
+    Pairs are pruned in the order of the set of pairs of a k-d tree, like blob_log prunes them.
+    Pruned blobs are marked by a zero sigma, the array is modified in place.
+    """
+    distance = 2 * blobs[:, -1].max() * math.sqrt(2)
+    pairs = np.array(list(spatial.cKDTree(blobs[:, :-1]).query_pairs(distance)))
+    if len(pairs) == 0:
+        return blobs
+    for i, j in pairs:
+        blob1, blob2 = blobs[i], blobs[j]
+        if blob_overlap(blob1, blob2) > overlap:
+            if blob1[-1] > blob2[-1]:
+                blob2[-1] = 0
+            else:
+                blob1[-1] = 0
+    return np.stack([blob for blob in blobs if blob[-1] > 0])
+
+
+def blob_overlap(blob1, blob2):
+    """Fraction of the area of the smaller one of two blobs (y, x, sigma), which the other one overlaps."""
+    if blob1[-1] == blob2[-1] == 0:
+        return 0.0
+    # Coordinates are divided by the larger sigma times sqrt(2), which scales its radius to 1
+    if blob1[-1] > blob2[-1]:
+        max_sigma, r1, r2 = blob1[-1], 1, blob2[-1] / blob1[-1]
+    else:
+        max_sigma, r1, r2 = blob2[-1], blob1[-1] / blob2[-1], 1
+    pos1 = blob1[:2] / (max_sigma * math.sqrt(2))
+    pos2 = blob2[:2] / (max_sigma * math.sqrt(2))
+    d = np.sqrt(np.sum((pos2 - pos1) ** 2))
+    if d > r1 + r2:
+        return 0.0
+    if d <= abs(r1 - r2):
+        return 1.0
+    return disk_overlap(d, r1, r2)
+
+
+def disk_overlap(d, r1, r2):
+    """Fraction of the area of the smaller one of two disks of radii r1 and r2, d apart, which they share."""
+    acos1 = math.acos(np.clip((d ** 2 + r1 ** 2 - r2 ** 2) / (2 * d * r1), -1, 1))
+    acos2 = math.acos(np.clip((d ** 2 + r2 ** 2 - r1 ** 2) / (2 * d * r2), -1, 1))
+    a = -d + r2 + r1
+    b = d - r2 + r1
+    c = d + r2 - r1
+    e = d + r2 + r1
+    area = r1 ** 2 * acos1 + r2 ** 2 * acos2 - 0.5 * math.sqrt(abs(a * b * c * e))
+    return area / (math.pi * (min(r1, r2) ** 2))
+
+
+def blobs_in_box(blobs, box_min_x, box_max_x, box_min_y, box_max_y):
+    inside = ((box_min_x <= blobs[:, 1]) & (blobs[:, 1] < box_max_x)
+              & (box_min_y <= blobs[:, 0]) & (blobs[:, 0] < box_max_y))
+    return blobs[inside]
+
+
+def load_image(path):
+    """Grayscale float image of an RGB(A) or grayscale image file."""
+    image = io.imread(path)
+    if image.ndim == 2:
+        return util.img_as_float(image)
+    return color.rgb2gray(image[..., :3])
+
+
+def plot_blobs(ax, image, box_min_x, box_max_x, box_min_y, box_max_y, blobs):
+    """Draws the image, the box and the blobs of `detect_blobs` on the axes."""
     ax.imshow(image, cmap='gray')
 
     # Draw the box
@@ -71,16 +244,33 @@ def count_blobs(input_path,
     ax.add_patch(rect)
 
     # Draw blobs inside the box
-    for y, x, r in blobs_in_box:
+    for y, x, r in blobs:
         c = plt.Circle((x, y), r, color='red', linewidth=0.5, fill=False)
         ax.add_patch(c)
 
-    if not skip_plotting_results:
-        plt.show()
-    if not skip_saving_results:
-        plt.savefig(output_path)
 
-    print(f"Total blobs found in box: {len(blobs_in_box)}")
+def log_support(max_sigma):
+    """Pixels around a tile, which change its Laplacian of Gaussian values or their local maxima.
+
+    scipy truncates the kernel at 4 sigma, and local maxima compare neighbouring pixels.
+    """
+    return int(4.0 * max_sigma + 0.5) + 1
+
+
+def find_local_maxima(image, min_y, max_y, min_x, max_x, sigma_list, threshold):
+    """Local maxima of the scale space of blob_log inside the tile, as (y, x, sigma index) rows and intensities."""
+    support = log_support(sigma_list.max())
+    region_min_y, region_min_x = max(0, min_y - support), max(0, min_x - support)
+    region = image[region_min_y:min(image.shape[0], max_y + support),
+                   region_min_x:min(image.shape[1], max_x + support)]
+
+    coordinates, intensities = scale_space_local_maxima(log_scale_space(region, sigma_list), threshold)
+    coordinates = coordinates + np.array([region_min_y, region_min_x, 0])
+
+    # Keep maxima inside the tile, the support belongs to other tiles
+    inside = ((min_y <= coordinates[:, 0]) & (coordinates[:, 0] < max_y)
+              & (min_x <= coordinates[:, 1]) & (coordinates[:, 1] < max_x))
+    return coordinates[inside], intensities[inside]
 
 
 if __name__ == '__main__':
@@ -0,0 +1,197 @@
+import os
+import os.path as path_utils
+import sys
+import time
+from datetime import datetime
+
+import click
+import pandas as pd
+from matplotlib.figure import Figure
+
+from src.logic.batch import find_files, print_progress_record, run_items
+from src.logic.count_blobs import DEFAULT_TILE_SIZE, detect_blobs, load_image, plot_blobs
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp")
+
+TABLE_FORMATS = ("csv", "parquet")
+
+IMAGE_TABLE_NAME = "images"
+BLOB_TABLE_NAME = "blobs"
+
+IMAGE_TABLE_COLUMNS = ["image", "exit_code", "error_message", "width", "height", "box_min_x", "box_max_x",
+                       "box_min_y", "box_max_y", "count", "read_seconds", "detect_seconds", "plot_seconds",
+                       "total_seconds"]
+BLOB_TABLE_COLUMNS = ["image", "y", "x", "radius"]
+
+
+def find_images(inputs):
+    """Image files of `inputs`, which are directories, image files or glob patterns of them."""
+    return find_files(inputs, extensions=IMAGE_EXTENSIONS)
+
+
+def count_image_blobs(image_file, box_min_x, box_max_x, box_min_y, box_max_y, min_sigma, max_sigma, threshold,
+                      tile_size, plot_dir=None):
+    """Detects blobs of an image, and draws them into <image name>.png in plot_dir if given.
+
+    Box limits of -1 stand for the width and height of the image. Returns a dict with the box,
+    image size, "blobs" (rows of y, x, radius) and timings in seconds.
+    """
+    # Module level, so that it can be pickled and sent to a worker process
+    start = time.perf_counter()
+    image = load_image(image_file)
+    box_max_x = image.shape[1] if box_max_x == -1 else box_max_x
+    box_max_y = image.shape[0] if box_max_y == -1 else box_max_y
+    read_end = time.perf_counter()
+
+    # Images run in parallel processes, tiles of an image in one thread
+    blobs = detect_blobs(image, box_min_x, box_max_x, box_min_y, box_max_y, min_sigma, max_sigma, threshold,
+                         tile_size=tile_size, n_workers=1)
+    detect_end = time.perf_counter()
+
+    if plot_dir is not None:
+        figure = Figure()
+        plot_blobs(figure.subplots(), image, box_min_x, box_max_x, box_min_y, box_max_y, blobs)
+        name = path_utils.splitext(path_utils.basename(image_file))[0]
+        figure.savefig(path_utils.join(plot_dir, f"{name}.png"))
+    plot_end = time.perf_counter()
+
+    return {"width": image.shape[1],
+            "height": image.shape[0],
+            "box_min_x": box_min_x,
+            "box_max_x": box_max_x,
+            "box_min_y": box_min_y,
+            "box_max_y": box_max_y,
+            "blobs": blobs,
+            "read_seconds": read_end - start,
+            "detect_seconds": detect_end - read_end,
+            "plot_seconds": plot_end - detect_end,
+            "total_seconds": plot_end - start}
+
+
+def count_images_blobs(images, box_min_x=0, box_max_x=-1, box_min_y=0, box_max_y=-1, min_sigma=1, max_sigma=2,
+                       threshold=0.01, tile_size=DEFAULT_TILE_SIZE, plot_dir=None, n_workers=None):
+    """Yields (index, image file, status) tuples as soon as images finish, on a pool of n_workers processes.
+
+    A status is a dict with "exit_code", "result" of `count_image_blobs` and "error_message".
+    """
+    if plot_dir is not None:
+        os.makedirs(plot_dir, exist_ok=True)
+    arguments = (box_min_x, box_max_x, box_min_y, box_max_y, min_sigma, max_sigma, threshold, tile_size, plot_dir)
+    yield from run_items(count_image_blobs, images, arguments, n_workers)
+
+
+def image_table(images, statuses):
+    """One row per image, in the order of images, with its blob count and timings, or its error."""
+    rows = []
+    for i, image_file in enumerate(images):
+        status = statuses.get(i, {"exit_code": None, "result": None, "error_message": None})
+        row = {"image": image_file, "exit_code": status["exit_code"], "error_message": status["error_message"]}
+        if status["result"] is not None:
+            row.update({k: v for k, v in status["result"].items() if k != "blobs"})
+            row["count"] = len(status["result"]["blobs"])
+        rows.append(row)
+    return pd.DataFrame(rows, columns=IMAGE_TABLE_COLUMNS)
+
+
+def blob_table(images, statuses):
+    """One row per blob of every successfully counted image, in the order of images."""
+    tables = []
+    for i, image_file in enumerate(images):
+        status = statuses.get(i)
+        if status is None or status["result"] is None:
+            continue
+        table = pd.DataFrame(status["result"]["blobs"], columns=BLOB_TABLE_COLUMNS[1:])
+        table.insert(0, "image", image_file)
+        tables.append(table)
+    if len(tables) == 0:
+        return pd.DataFrame(columns=BLOB_TABLE_COLUMNS)
+    return pd.concat(tables, ignore_index=True)
+
+
+def save_table(table, output_dir, name, table_format):
+    path = path_utils.join(output_dir, f"{name}.{table_format}")
+    if table_format == "csv":
+        table.to_csv(path_or_buf=path, index=False)
+    elif table_format == "parquet":
+        try:
+            table.to_parquet(path, index=False)
+        except ImportError as e:
+            raise ValueError("Parquet tables require pyarrow, install it or use csv") from e
+    else:
+        raise ValueError(f"Unknown table format: {table_format}, expected one of {', '.join(TABLE_FORMATS)}")
+    return path
+
+
+@click.command()
+@click.option("--input", "-i", "inputs",
+              multiple=True,
+              required=True,
+              help="Directory, image file or glob pattern of image files, may be repeated")
+@click.option("--output-dir", "-o",
+              type=click.Path(file_okay=False),
+              help="Output directory, defaults to experiment_<timestamp> next to the first image")
+@click.option("--box-min-x", type=int, default=0, help="Minimum x-coordinate of the box")
+@click.option("--box-max-x", type=int, default=-1, help="Maximum x-coordinate of the box")
+@click.option("--box-min-y", type=int, default=0, help="Minimum y-coordinate of the box")
+@click.option("--box-max-y", type=int, default=-1, help="Maximum y-coordinate of the box")
+@click.option("--log-min-sigma", type=float, default=1, help="Laplacian of Gaussian minimum sigma")
+@click.option("--log-max-sigma", type=float, default=2, help="Laplacian of Gaussian maximum sigma")
+@click.option("--log-threshold", type=float, default=0.01, help="Laplacian of Gaussian threshold")
+@click.option("--tile-size", type=click.IntRange(min=1), default=DEFAULT_TILE_SIZE,
+              help="Size of square tiles of the box, which are searched for blobs separately")
+@click.option("--table-format", type=click.Choice(TABLE_FORMATS), default="csv", help="Format of the result tables")
+@click.option("--n-workers", type=click.IntRange(min=1), help="Number of worker processes, defaults to CPUs")
+@click.option("--plot-results", is_flag=True, default=False, help="Weather to save a figure of every image")
+def count_blobs_batch(inputs,
+                      output_dir,
+                      box_min_x,
+                      box_max_x,
+                      box_min_y,
+                      box_max_y,
+                      log_min_sigma,
+                      log_max_sigma,
+                      log_threshold,
+                      tile_size,
+                      table_format,
+                      n_workers,
+                      plot_results):
+    images = find_images(inputs)
+    if len(images) == 0:
+        raise click.UsageError("No image(s) selected!")
+    output_dir = output_dir or path_utils.join(path_utils.dirname(images[0]),
+                                               datetime.now().strftime("experiment_%m_%d_%Y__%H_%M_%S"))
+    os.makedirs(output_dir, exist_ok=True)
+
+    print_progress_record(event="started", output_dir=output_dir, n_images=len(images))
+    statuses = {}
+    for i, image_file, status in count_images_blobs(images,
+                                                    box_min_x=box_min_x,
+                                                    box_max_x=box_max_x,
+                                                    box_min_y=box_min_y,
+                                                    box_max_y=box_max_y,
+                                                    min_sigma=log_min_sigma,
+                                                    max_sigma=log_max_sigma,
+                                                    threshold=log_threshold,
+                                                    tile_size=tile_size,
+                                                    plot_dir=output_dir if plot_results else None,
+                                                    n_workers=n_workers):
+        statuses[i] = status
+        print_progress_record(event="image",
+                              index=i,
+                              image=image_file,
+                              exit_code=status["exit_code"],
+                              count=None if status["result"] is None else len(status["result"]["blobs"]),
+                              error_message=status["error_message"],
+                              completed=len(statuses),
+                              n_images=len(images))
+    n_failed = len([status for status in statuses.values() if status["exit_code"] != 0])
+    image_table_file = save_table(image_table(images, statuses), output_dir, IMAGE_TABLE_NAME, table_format)
+    blob_table_file = save_table(blob_table(images, statuses), output_dir, BLOB_TABLE_NAME, table_format)
+    print_progress_record(event="finished", output_dir=output_dir, image_table=image_table_file,
+                          blob_table=blob_table_file, n_images=len(images), n_failed=n_failed)
+    if n_failed > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    count_blobs_batch()
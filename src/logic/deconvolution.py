@@ -1,56 +1,50 @@
+import cProfile
+import functools
 import traceback
 import sys
-import lmfit.lineshapes
-import matplotlib
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
+from lmfit.lineshapes import s2pi, tiny
 from lmfit.models import ConstantModel, GaussianModel, LorentzianModel
 import os
 import os.path as path_utils
-import pandas
+
+from src.logic.fit_template import (FitTemplate, SIGNAL_MAX_X, SIGNAL_MAX_Y, SIGNAL_MIN_X, SIGNAL_MIN_Y,
+                                    is_signal_dependent, resolve_limits)
+from src.logic.fit_output import OUTPUT_FORMATS, output_file_name, write_fit
+from src.logic.fit_plot import PLOT_MODES, render_fit, render_job
+from src.logic.initial_guess import INITIAL_GUESS_MODES
+from src.logic.jacobian import jacobian_fit_kws, move_off_bounds
+from src.logic.multistart import MULTISTART_METHOD, MultistartFitResult, latin_hypercube_starts, run_starts
+from src.logic.peak_index import open_peak_index
+from src.logic.stage_timer import StageTimer, fit_statistics
+from src.logic.windowing import WINDOWING_MODES, fit_windows
+
+# Number of fit templates kept per process, one per distinct set of properties
+FIT_TEMPLATE_CACHE_SIZE = 16
 
 
 class Deconvolver:
 
-    def deconvolve_single_file(self, signal_file_abs_path, experiment_label, properties, plot_peaks=True):
+    def deconvolve_single_file(self, signal_file_abs_path, experiment_label, properties, plot_peaks=True,
+                               aggregate=True, initial_values=None):
         output_dir = None
+        timer = StageTimer()
+        profiler = cProfile.Profile() if self.optional_property_bool(properties.get("profile"), False) else None
         try:
-            input_format_separator = self.optional_property_str(
-                properties.get("input_format_separator"), "\t+")
-            output_format_separator = self.optional_property_str(
-                properties.get("output_format_separator"), "\t")
-            input_format_header = self.optional_property_bool(
-                properties.get("input_format_header"), False)
-            output_format_header = self.optional_property_bool(
-                properties.get("output_format_header"), False)
-            method = self.optional_property_str(
-                properties.get("method"), "differential_evolution")
-            n_gauss = self.optional_property_int(properties.get("n_gauss"), 0)
-            n_lorentz = self.optional_property_int(
-                properties.get("n_lorentz"), 0)
-            include_background = self.optional_property_bool(
-                properties.get("include_background"), False)
-            gauss_peak_amp_min_default = self.optional_property_float(
-                properties.get("gauss_peak_amp_min_default"), 0.0)
-            gauss_peak_amp_max_default = self.optional_property_float(
-                properties.get("gauss_peak_amp_max_default"), 100.0)
-            lorentz_peak_amp_min_default = self.optional_property_float(
-                properties.get("lorentz_peak_amp_min_default"),
-                0.0)
-            lorentz_peak_amp_max_default = self.optional_property_float(
-                properties.get("lorentz_peak_amp_max_default"),
-                100.0)
-            gauss_peak_sigma_min_default = self.optional_property_float(
-                properties.get("gauss_peak_sigma_min_default"), 0.0)
-            gauss_peak_sigma_max_default = self.optional_property_float(
-                properties.get("gauss_peak_sigma_max_default"), 100.0)
-            lorentz_peak_sigma_min_default = self.optional_property_float(
-                properties.get("lorentz_peak_sigma_min_default"),
-                0.0)
-            lorentz_peak_sigma_max_default = self.optional_property_float(
-                properties.get("lorentz_peak_sigma_max_default"),
-                100.0)
+            if profiler is not None:
+                profiler.enable()
+            with timer.stage("build"):
+                template = self.fit_template(properties)
+            output_format_separator = template.output_format_separator
+            input_format_header = template.input_format_header
+            method = template.method
+            jacobian = template.jacobian
+            n_gauss = template.n_gauss
+            n_lorentz = template.n_lorentz
+            include_background = template.include_background
+            output_format = template.output_format
+            plot_mode = template.plot_mode if plot_peaks else "off"
 
             file_directory = path_utils.dirname(signal_file_abs_path)
             file_name_with_extension = path_utils.basename(
@@ -60,77 +54,49 @@ class Deconvolver:
             output_dir = path_utils.join(file_directory, experiment_label)
             path_utils.exists(output_dir) or os.mkdir(output_dir)
 
-            data = pandas.read_csv(filepath_or_buffer=signal_file_abs_path,
-                                   header={True: 0, False: None}[
-                                       input_format_header],
-                                   names=["#Wave", "#Intensity"],
-                                   sep=input_format_separator,
-                                   engine="python")
-
-            x = data["#Wave"].tolist()
-            signal = data["#Intensity"].tolist()
-
-            signal_min_x = min(x)
-            signal_max_x = max(x)
-            signal_min_y = min(signal)
-            signal_max_y = max(signal)
-
-            constant_model = ConstantModel(prefix="bkg_")
-            constant_params = constant_model.make_params(
-                c=dict(
-                    min=signal_min_y,
-                    max=signal_max_y,
-                    vary=include_background,
-                    value=0.0))
-            composite_model = constant_model
-            composite_params = constant_params
-
-            for i in range(n_gauss):
-                new_model = GaussianModel(prefix=f"gauss_peak{i + 1}_")
-                new_params = new_model.make_params(
-                    amplitude=self.determine_limits(properties, f"gauss_peak{i + 1}_amp", gauss_peak_amp_min_default,
-                                                    gauss_peak_amp_max_default),
-                    center=self.determine_limits(
-                        properties, f"gauss_peak{i + 1}_mu", signal_min_x, signal_max_x),
-                    sigma=self.determine_limits(properties, f"gauss_peak{i + 1}_sigma", gauss_peak_sigma_min_default,
-                                                gauss_peak_sigma_max_default))
-                composite_params.update(new_params)
-                composite_model = composite_model + new_model
-
-            for i in range(n_lorentz):
-                new_model = LorentzianModel(prefix=f"lorentz_peak{i + 1}_")
-                new_params = new_model.make_params(
-                    amplitude=self.determine_limits(properties, f"lorentz_peak{i + 1}_amp",
-                                                    lorentz_peak_amp_min_default, lorentz_peak_amp_max_default),
-                    center=self.determine_limits(
-                        properties, f"lorentz_peak{i + 1}_mu", signal_min_x, signal_max_x),
-                    sigma=self.determine_limits(properties, f"lorentz_peak{i + 1}_sigma",
-                                                lorentz_peak_sigma_min_default,
-                                                lorentz_peak_sigma_max_default))
-                composite_params.update(new_params)
-                composite_model = composite_model + new_model
+            with timer.stage("parse"):
+                x, signal = self.read_signal(signal_file_abs_path, properties)
+            with timer.stage("build"):
+                composite_model = template.model
+                composite_params = template.make_params(x, signal)
+                guessed_values = template.initial_values(x, signal, composite_params)
+                if guessed_values is not None:
+                    self.seed_params(composite_params, guessed_values)
+                if initial_values is not None:
+                    self.seed_params(composite_params, initial_values, template.warm_start_span)
 
-            result = composite_model.fit(
-                data=signal,
-                x=x,
-                params=composite_params,
-                method=method)
+                if jacobian == "analytic" and method == "leastsq":
+                    move_off_bounds(composite_params)
+                windows = template.windows(x, signal, composite_params)
+            with timer.stage("fit"):
+                if method == MULTISTART_METHOD:
+                    result = self.fit_multistart(template, properties, x, signal, composite_params)
+                elif windows is None:
+                    result = composite_model.fit(
+                        data=signal,
+                        x=x,
+                        params=composite_params,
+                        method=method,
+                        fit_kws=jacobian_fit_kws(method, jacobian))
+                else:
+                    result = fit_windows(composite_model, composite_params, x, signal, windows,
+                                         method=method,
+                                         fit_kws=jacobian_fit_kws(method, jacobian))
 
             peak_index = 0
-            matplotlib.use("agg")
-            plt.clf()
-            ax = plt.subplot(111)
-            ax.plot(x, signal, label='signal')
-            ax.plot(x, result.best_fit, '--', label='fit')
-
-            fit_df = pd.DataFrame(list(zip(x, result.best_fit)), columns=[
-                "#Wave", "#Intensity"])
-            fit_df.to_csv(
-                path_or_buf=path_utils.join(output_dir,
-                                            file_name_root + ".fit{ex}".format(ex=file_name_extension)),
-                sep=output_format_separator,
-                index=False,
-                header=input_format_header)
+            component_labels = []
+
+            if output_format == "csv":
+                with timer.stage("write"):
+                    fit_df = pd.DataFrame({"#Wave": x, "#Intensity": result.best_fit})
+                    fit_df.to_csv(
+                        path_or_buf=path_utils.join(output_dir,
+                                                    file_name_root + ".fit{ex}".format(ex=file_name_extension)),
+                        sep=output_format_separator,
+                        index=False,
+                        header=input_format_header)
+            with timer.stage("components"):
+                components = self.evaluate_components(x, result.best_values, n_gauss, n_lorentz)
             peaks = self.init_peaks()
             for i in range(n_gauss):
                 amp = result.best_values[f"gauss_peak{i + 1}_amplitude"]
@@ -138,19 +104,18 @@ class Deconvolver:
                 sigma = result.best_values[f"gauss_peak{i + 1}_sigma"]
                 height = 0.3989423 * amp / max(1e-15, sigma)
                 fwhm = 2.3548200 * sigma
-                y = [lmfit.lineshapes.gaussian(
-                    i, amp, center, sigma) for i in x]
-                ax.fill(x, y,
-                        label=f"G{i + 1}: \u0391: {round(amp, 2)}, \u03bc: {round(center, 2)}, \u03c3: {round(sigma, 2)}",
-                        alpha=0.1)
-                peak_df = pd.DataFrame(list(zip(x, y)), columns=[
-                    "#Wave", "#Intensity"])
-                peak_df.to_csv(path_or_buf=path_utils.join(output_dir,
-                                                           file_name_root + ".gauss_peak{n}{ex}".format(n=i + 1,
-                                                                                                        ex=file_name_extension)),
-                               sep=output_format_separator,
-                               index=False,
-                               header=input_format_header)
+                y = components[peak_index]
+                component_labels.append(
+                    f"G{i + 1}: \u0391: {round(amp, 2)}, \u03bc: {round(center, 2)}, \u03c3: {round(sigma, 2)}")
+                if output_format == "csv":
+                    with timer.stage("write"):
+                        peak_df = pd.DataFrame({"#Wave": x, "#Intensity": y})
+                        peak_df.to_csv(path_or_buf=path_utils.join(output_dir,
+                                                                   file_name_root + ".gauss_peak{n}{ex}".format(n=i + 1,
+                                                                                                                ex=file_name_extension)),
+                                       sep=output_format_separator,
+                                       index=False,
+                                       header=input_format_header)
                 self.add_peak(
                     peaks=peaks,
                     index=f"%_{peak_index + 1}",
@@ -169,19 +134,18 @@ class Deconvolver:
                 sigma = result.best_values[f"lorentz_peak{i + 1}_sigma"]
                 height = 0.3183099 * amp / max(1e-15, sigma)
                 fwhm = 2.0 * sigma
-                y = [lmfit.lineshapes.lorentzian(
-                    i, amp, center, sigma) for i in x]
-                ax.fill(x, y,
-                        label=f"L{i + 1}: \u0391: {round(amp, 2)}, \u03bc: {round(center, 2)}, \u03c3: {round(sigma, 2)}",
-                        alpha=0.1)
-                peak_df = pd.DataFrame(list(zip(x, y)), columns=[
-                    "#Wave", "#Intensity"])
-                peak_df.to_csv(path_or_buf=path_utils.join(output_dir,
-                                                           file_name_root + ".lorentz_peak{n}{ex}".format(n=i + 1,
-                                                                                                          ex=file_name_extension)),
-                               sep=output_format_separator,
-                               index=False,
-                               header=input_format_header)
+                y = components[peak_index]
+                component_labels.append(
+                    f"L{i + 1}: \u0391: {round(amp, 2)}, \u03bc: {round(center, 2)}, \u03c3: {round(sigma, 2)}")
+                if output_format == "csv":
+                    with timer.stage("write"):
+                        peak_df = pd.DataFrame({"#Wave": x, "#Intensity": y})
+                        peak_df.to_csv(path_or_buf=path_utils.join(output_dir,
+                                                                   file_name_root + ".lorentz_peak{n}{ex}".format(n=i + 1,
+                                                                                                                  ex=file_name_extension)),
+                                       sep=output_format_separator,
+                                       index=False,
+                                       header=input_format_header)
                 self.add_peak(
                     peaks=peaks,
                     index=f"%_{peak_index + 1}",
@@ -194,51 +158,74 @@ class Deconvolver:
                     file=signal_file_abs_path)
                 peak_index = peak_index + 1
 
+            background = None
+            background_label = None
             if include_background:
                 bkg_c = result.best_values["bkg_c"]
-                y = [bkg_c for _ in x]
-                ax.plot(x, y, '--', label=f"Background: {round(bkg_c, 2)}")
-                peak_df = pd.DataFrame(list(zip(x, y)), columns=[
-                    "#Wave", "#Intensity"])
-                peak_df.to_csv(path_or_buf=path_utils.join(output_dir,
-                                                           file_name_root + ".background{ex}".format(
-                                                               ex=file_name_extension)),
-                               sep=output_format_separator,
-                               index=False,
-                               header=input_format_header)
-            ax.legend(loc="upper center",
-                      bbox_to_anchor=(0.5, -0.05),
-                      fancybox=True,
-                      shadow=True,
-                      ncol=3)
-
-            # TODO this doesnt work in qt
-
-            if plot_peaks:
-                plt.savefig(path_utils.join(output_dir, file_name_root + ".pdf"),
-                            format="pdf",
-                            bbox_inches="tight")
-
-            with open(path_utils.join(output_dir, file_name_root + ".model.txt"), "w") as output:
-                output.writelines(result.fit_report())
-            peaks_df = pd.DataFrame(peaks)
-            peaks_df.to_csv(path_or_buf=path_utils.join(output_dir, file_name_root + ".peaks"),
-                            sep=output_format_separator, index=False)
-            aggregate_peaks_file = path_utils.join(output_dir, "all.peaks")
-            if path_utils.exists(aggregate_peaks_file):
-                existing_peaks_df = pd.read_csv(filepath_or_buffer=aggregate_peaks_file,
-                                                sep=output_format_separator)
-                if signal_file_abs_path not in existing_peaks_df["File"].values:
-                    peaks_df.to_csv(path_or_buf=aggregate_peaks_file, sep=output_format_separator, index=False,
-                                    mode="a",
-                                    header=False)
-            else:
-                peaks_df.to_csv(path_or_buf=aggregate_peaks_file,
-                                sep=output_format_separator, index=False, header=True)
+                background = np.full_like(x, bkg_c)
+                background_label = f"Background: {round(bkg_c, 2)}"
+                if output_format == "csv":
+                    with timer.stage("write"):
+                        peak_df = pd.DataFrame({"#Wave": x, "#Intensity": background})
+                        peak_df.to_csv(path_or_buf=path_utils.join(output_dir,
+                                                                   file_name_root + ".background{ex}".format(
+                                                                       ex=file_name_extension)),
+                                       sep=output_format_separator,
+                                       index=False,
+                                       header=input_format_header)
+            job = None
+            if plot_mode != "off":
+                job = render_job(path=path_utils.join(output_dir, file_name_root + ".pdf"),
+                                 x=x,
+                                 signal=signal,
+                                 fit=result.best_fit,
+                                 components=components,
+                                 component_labels=component_labels,
+                                 background=background,
+                                 background_label=background_label)
+            if plot_mode == "inline":
+                with timer.stage("plot"):
+                    render_fit(**job)
+
+            with timer.stage("write"):
+                if output_format == "csv":
+                    with open(path_utils.join(output_dir, file_name_root + ".model.txt"), "w") as output:
+                        output.writelines(result.fit_report())
+                    peaks_df = pd.DataFrame(peaks)
+                    peaks_df.to_csv(path_or_buf=path_utils.join(output_dir, file_name_root + ".peaks"),
+                                    sep=output_format_separator, index=False)
+                else:
+                    write_fit(path=path_utils.join(output_dir, output_file_name(file_name_root, output_format)),
+                              output_format=output_format,
+                              x=x,
+                              signal=signal,
+                              fit=result.best_fit,
+                              components=components,
+                              component_names=self.component_names(n_gauss, n_lorentz),
+                              peaks=peaks,
+                              fit_report=result.fit_report(),
+                              background=background)
+            if aggregate:
+                with timer.stage("aggregate"):
+                    self.aggregate_peaks(signal_file_abs_path=signal_file_abs_path,
+                                         output_dir=output_dir,
+                                         peaks=peaks,
+                                         properties=properties)
             output = {
                 "exit_code": 0,
-                "output_dir": output_dir
+                "output_dir": output_dir,
+                "peaks": peaks,
+                "best_values": dict(result.best_values),
+                "timings": timer.as_dict(),
+                "fit_statistics": fit_statistics(result)
             }
+            if profiler is not None:
+                profiler.disable()
+                output["profile_file"] = path_utils.join(output_dir, file_name_root + ".prof")
+                profiler.dump_stats(output["profile_file"])
+            if plot_mode == "deferred":
+                # Rendered by the caller, e.g. on the render pool of BatchDeconvolver
+                output["render_job"] = job
             return output
         except Exception as e:
             print(traceback.format_exc(), file=sys.stderr)
@@ -253,14 +240,296 @@ class Deconvolver:
             output = {
                 "exit_code": 1,
                 "output_dir": output_dir,
+                "timings": timer.as_dict(),
                 "error_message": "{message}, see more details: {error_log}\n".format(message=str(e),
                                                                                      error_log=error_log_path)
             }
             return output
         finally:
-            with open(path_utils.join(output_dir, "experiment.properties"), "w") as output:
-                for p in properties:
-                    output.write(self.escape(p) + "=" + self.escape(properties[p]) + "\n")
+            if profiler is not None:
+                profiler.disable()
+            self.save_experiment_properties(output_dir, properties)
+
+    def save_experiment_properties(self, output_dir, properties):
+        with open(path_utils.join(output_dir, "experiment.properties"), "w") as output:
+            for p in properties:
+                output.write(self.escape(p) + "=" + self.escape(properties[p]) + "\n")
+
+    def output_file_names(self, signal_file_abs_path, properties, plot_peaks=True):
+        """Names of the files deconvolve_single_file writes for a signal file, except experiment.properties."""
+        template = self.fit_template(properties)
+        file_name_root, file_name_extension = path_utils.splitext(path_utils.basename(signal_file_abs_path))
+        if template.output_format == "csv":
+            suffixes = [".fit", *[f".gauss_peak{i + 1}" for i in range(template.n_gauss)],
+                        *[f".lorentz_peak{i + 1}" for i in range(template.n_lorentz)],
+                        *([".background"] if template.include_background else [])]
+            names = [file_name_root + suffix + file_name_extension for suffix in suffixes]
+            names.extend([file_name_root + ".model.txt", file_name_root + ".peaks"])
+        else:
+            names = [output_file_name(file_name_root, template.output_format)]
+        if plot_peaks and template.plot_mode != "off":
+            names.append(file_name_root + ".pdf")
+        return names
+
+    def read_signal(self, signal_file_abs_path, properties):
+        return self.fit_template(properties).signal_reader.read(signal_file_abs_path)
+
+    def build_model(self, properties, x, signal):
+        template = self.fit_template(properties)
+        return template.model, template.make_params(x, signal)
+
+    @staticmethod
+    def fit_template(properties):
+        """Returns the template compiled from properties, cached by their content."""
+        return compiled_fit_template(tuple(sorted(properties.items())))
+
+    def compile_template(self, properties):
+        input_format_separator = self.optional_property_str(
+            properties.get("input_format_separator"), "\t+")
+        input_format_header = self.optional_property_bool(
+            properties.get("input_format_header"), False)
+        output_format_separator = self.optional_property_str(
+            properties.get("output_format_separator"), "\t")
+        output_format_header = self.optional_property_bool(
+            properties.get("output_format_header"), False)
+        method = self.optional_property_str(
+            properties.get("method"), "differential_evolution")
+        jacobian = self.optional_property_str(
+            properties.get("jacobian"), "numeric")
+        n_gauss = self.optional_property_int(properties.get("n_gauss"), 0)
+        n_lorentz = self.optional_property_int(
+            properties.get("n_lorentz"), 0)
+        include_background = self.optional_property_bool(
+            properties.get("include_background"), False)
+        warm_start_span = self.optional_property_float(
+            properties.get("warm_start_span"), None)
+        plot_mode = self.optional_property_str(
+            properties.get("plot_mode"), "inline")
+        if plot_mode not in PLOT_MODES:
+            raise ValueError(f"Unknown plot_mode: {plot_mode}, expected one of {', '.join(PLOT_MODES)}")
+        windowing = self.optional_property_str(
+            properties.get("windowing"), "none")
+        if windowing not in WINDOWING_MODES:
+            raise ValueError(f"Unknown windowing: {windowing}, expected one of {', '.join(WINDOWING_MODES)}")
+        if windowing != "none" and include_background:
+            raise ValueError("windowing fits peaks of every window separately, it needs include_background=False")
+        window_margin = self.optional_property_float(
+            properties.get("window_margin"), 3.0)
+        window_threshold = self.optional_property_float(
+            properties.get("window_threshold"), 5.0)
+        window_min_gap = self.optional_property_int(
+            properties.get("window_min_gap"), 5)
+        initial_guess = self.optional_property_str(
+            properties.get("initial_guess"), "none")
+        if initial_guess not in INITIAL_GUESS_MODES:
+            raise ValueError(
+                f"Unknown initial_guess: {initial_guess}, expected one of {', '.join(INITIAL_GUESS_MODES)}")
+        initial_guess_smoothing = self.optional_property_int(
+            properties.get("initial_guess_smoothing"), None)
+        initial_guess_prominence = self.optional_property_float(
+            properties.get("initial_guess_prominence"), 0.05)
+        multistart_method = self.optional_property_str(
+            properties.get("multistart_method"), "least_squares")
+        if multistart_method == MULTISTART_METHOD:
+            raise ValueError(f"multistart_method is the method of every local fit, it can not be {MULTISTART_METHOD}")
+        if method == MULTISTART_METHOD and windowing != "none":
+            raise ValueError(f"{MULTISTART_METHOD} fits all peaks at once, it needs windowing=none")
+        multistart_n_starts = self.optional_property_int(
+            properties.get("multistart_n_starts"), 16)
+        multistart_n_workers = self.optional_property_int(
+            properties.get("multistart_n_workers"), 1)
+        multistart_target_chisqr = self.optional_property_float(
+            properties.get("multistart_target_chisqr"), None)
+        multistart_time_limit = self.optional_property_float(
+            properties.get("multistart_time_limit"), None)
+        multistart_seed = self.optional_property_int(
+            properties.get("multistart_seed"), 0)
+        output_format = self.optional_property_str(
+            properties.get("output_format"), "csv")
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output_format: {output_format}, expected one of {', '.join(OUTPUT_FORMATS)}")
+        gauss_peak_amp_min_default = self.optional_property_float(
+            properties.get("gauss_peak_amp_min_default"), 0.0)
+        gauss_peak_amp_max_default = self.optional_property_float(
+            properties.get("gauss_peak_amp_max_default"), 100.0)
+        lorentz_peak_amp_min_default = self.optional_property_float(
+            properties.get("lorentz_peak_amp_min_default"),
+            0.0)
+        lorentz_peak_amp_max_default = self.optional_property_float(
+            properties.get("lorentz_peak_amp_max_default"),
+            100.0)
+        gauss_peak_sigma_min_default = self.optional_property_float(
+            properties.get("gauss_peak_sigma_min_default"), 0.0)
+        gauss_peak_sigma_max_default = self.optional_property_float(
+            properties.get("gauss_peak_sigma_max_default"), 100.0)
+        lorentz_peak_sigma_min_default = self.optional_property_float(
+            properties.get("lorentz_peak_sigma_min_default"),
+            0.0)
+        lorentz_peak_sigma_max_default = self.optional_property_float(
+            properties.get("lorentz_peak_sigma_max_default"),
+            100.0)
+
+        # Signal dependent limits get placeholder values, filled in by FitTemplate.make_params
+        placeholder_limits = {SIGNAL_MIN_X: 0.0, SIGNAL_MAX_X: 1.0, SIGNAL_MIN_Y: 0.0, SIGNAL_MAX_Y: 1.0}
+        signal_dependent_limits = {}
+
+        constant_model = ConstantModel(prefix="bkg_")
+        constant_limits = {
+            "c": dict(
+                min=SIGNAL_MIN_Y,
+                max=SIGNAL_MAX_Y,
+                vary=include_background,
+                value=0.0)
+        }
+        submodels = [(constant_model, constant_limits)]
+
+        for i in range(n_gauss):
+            submodels.append((GaussianModel(prefix=f"gauss_peak{i + 1}_"), {
+                "amplitude": self.determine_limits(properties, f"gauss_peak{i + 1}_amp", gauss_peak_amp_min_default,
+                                                   gauss_peak_amp_max_default),
+                "center": self.determine_limits(
+                    properties, f"gauss_peak{i + 1}_mu", SIGNAL_MIN_X, SIGNAL_MAX_X),
+                "sigma": self.determine_limits(properties, f"gauss_peak{i + 1}_sigma", gauss_peak_sigma_min_default,
+                                               gauss_peak_sigma_max_default)
+            }))
+
+        for i in range(n_lorentz):
+            submodels.append((LorentzianModel(prefix=f"lorentz_peak{i + 1}_"), {
+                "amplitude": self.determine_limits(properties, f"lorentz_peak{i + 1}_amp",
+                                                   lorentz_peak_amp_min_default, lorentz_peak_amp_max_default),
+                "center": self.determine_limits(
+                    properties, f"lorentz_peak{i + 1}_mu", SIGNAL_MIN_X, SIGNAL_MAX_X),
+                "sigma": self.determine_limits(properties, f"lorentz_peak{i + 1}_sigma",
+                                               lorentz_peak_sigma_min_default,
+                                               lorentz_peak_sigma_max_default)
+            }))
+
+        composite_model = None
+        composite_params = None
+        for new_model, new_limits in submodels:
+            new_params = new_model.make_params(
+                **{name: resolve_limits(limits, placeholder_limits) for name, limits in new_limits.items()})
+            for name, limits in new_limits.items():
+                if is_signal_dependent(limits):
+                    signal_dependent_limits[new_model.prefix + name] = limits
+            if composite_model is None:
+                composite_model = new_model
+                composite_params = new_params
+            else:
+                composite_params.update(new_params)
+                composite_model = composite_model + new_model
+
+        return FitTemplate(input_format_separator=input_format_separator,
+                           input_format_header=input_format_header,
+                           output_format_separator=output_format_separator,
+                           output_format_header=output_format_header,
+                           method=method,
+                           jacobian=jacobian,
+                           n_gauss=n_gauss,
+                           n_lorentz=n_lorentz,
+                           include_background=include_background,
+                           warm_start_span=warm_start_span,
+                           output_format=output_format,
+                           plot_mode=plot_mode,
+                           windowing=windowing,
+                           window_margin=window_margin,
+                           window_threshold=window_threshold,
+                           window_min_gap=window_min_gap,
+                           initial_guess=initial_guess,
+                           initial_guess_smoothing=initial_guess_smoothing,
+                           initial_guess_prominence=initial_guess_prominence,
+                           explicit_values=self.explicit_values(properties, n_gauss, n_lorentz),
+                           multistart_method=multistart_method,
+                           multistart_n_starts=multistart_n_starts,
+                           multistart_n_workers=multistart_n_workers,
+                           multistart_target_chisqr=multistart_target_chisqr,
+                           multistart_time_limit=multistart_time_limit,
+                           multistart_seed=multistart_seed,
+                           model=composite_model,
+                           params=composite_params,
+                           signal_dependent_limits=signal_dependent_limits)
+
+    @staticmethod
+    def fit_multistart(template, properties, x, signal, params):
+        """Local fits from the current values of params and from points of a Latin hypercube within their
+        bounds, see `multistart`, and the best one of them polished into a full result."""
+        starts = latin_hypercube_starts(params, template.multistart_n_starts, template.multistart_seed)
+        solutions = run_starts(fit_from_start, (properties, x, signal, params), starts,
+                               n_workers=template.multistart_n_workers,
+                               target_chisqr=template.multistart_target_chisqr,
+                               time_limit=template.multistart_time_limit)
+        _, best_values, _ = min(solutions, key=lambda solution: solution[0])
+        result = fit_from_values(template, x, signal, params, best_values)
+        return MultistartFitResult(result, solutions, len(starts))
+
+    @staticmethod
+    def explicit_values(properties, n_gauss, n_lorentz):
+        """Names of peak parameters, whose initial values are given in properties."""
+        names = set()
+        for peak_type, n_peaks in (("gauss", n_gauss), ("lorentz", n_lorentz)):
+            for i in range(n_peaks):
+                for parameter, short_name in (("amplitude", "amp"), ("center", "mu"), ("sigma", "sigma")):
+                    if properties.get(f"{peak_type}_peak{i + 1}_{short_name}_value"):
+                        names.add(f"{peak_type}_peak{i + 1}_{parameter}")
+        return frozenset(names)
+
+    @staticmethod
+    def seed_params(params, initial_values, span=None):
+        """Starts varying parameters from `initial_values`, clipped to their bounds.
+
+        If `span` is given, bounds are also narrowed to that fraction of their range, centered
+        at the initial value, which speeds up global methods, e.g. differential_evolution.
+        """
+        for name, param in params.items():
+            if not param.vary or param.expr or name not in initial_values:
+                continue
+            value = min(max(initial_values[name], param.min), param.max)
+            if span is not None:
+                half_width = span * (param.max - param.min) / 2
+                param.set(min=max(param.min, value - half_width), max=min(param.max, value + half_width))
+            param.set(value=value)
+
+    def aggregate_peaks(self, signal_file_abs_path, output_dir, peaks, properties):
+        output_format_separator = self.optional_property_str(
+            properties.get("output_format_separator"), "\t")
+        open_peak_index(output_dir, output_format_separator).add(signal_file_abs_path, peaks)
+
+    @staticmethod
+    def evaluate_components(x, best_values, n_gauss, n_lorentz):
+        """Evaluates all peaks at once, returns a (n_gauss + n_lorentz) x len(x) matrix.
+
+        Gaussian peaks come first, in the same order as they are defined in properties.
+        """
+        gauss = [f"gauss_peak{i + 1}_" for i in range(n_gauss)]
+        lorentz = [f"lorentz_peak{i + 1}_" for i in range(n_lorentz)]
+        x = np.asarray(x, dtype=np.float64)[np.newaxis, :]
+        components = np.empty((n_gauss + n_lorentz, x.shape[1]))
+        if n_gauss > 0:
+            amp, center, sigma = [np.array([[best_values[p + name]] for p in gauss])
+                                  for name in ("amplitude", "center", "sigma")]
+            components[:n_gauss] = Deconvolver.gaussian(x, amp, center, sigma)
+        if n_lorentz > 0:
+            amp, center, sigma = [np.array([[best_values[p + name]] for p in lorentz])
+                                  for name in ("amplitude", "center", "sigma")]
+            components[n_gauss:] = Deconvolver.lorentzian(x, amp, center, sigma)
+        return components
+
+    @staticmethod
+    def component_names(n_gauss, n_lorentz):
+        """Names of the rows of `evaluate_components`, same as the suffixes of their csv files."""
+        return [f"gauss_peak{i + 1}" for i in range(n_gauss)] + [f"lorentz_peak{i + 1}" for i in range(n_lorentz)]
+
+    @staticmethod
+    def gaussian(x, amplitude, center, sigma):
+        # Same as lmfit.lineshapes.gaussian, but broadcasts over arrays of parameters
+        return ((amplitude / np.maximum(tiny, s2pi * sigma))
+                * np.exp(-(1.0 * x - center) ** 2 / np.maximum(tiny, (2 * sigma ** 2))))
+
+    @staticmethod
+    def lorentzian(x, amplitude, center, sigma):
+        # Same as lmfit.lineshapes.lorentzian, but broadcasts over arrays of parameters
+        return ((amplitude / (1 + ((1.0 * x - center) / np.maximum(tiny, sigma)) ** 2))
+                / np.maximum(tiny, (np.pi * sigma)))
 
     def determine_limits(self, properties, parameter_name, parameter_default_min, parameter_default_max):
         limits = {}
@@ -351,3 +620,30 @@ class Deconvolver:
             return default
         else:
             return float(prop)
+
+
+def fit_from_values(template, x, signal, params, values):
+    """Local fit of multistart from the given values of parameters."""
+    params = params.copy()
+    for name, value in values.items():
+        if params[name].vary and not params[name].expr:
+            params[name].set(value=value)
+    if template.jacobian == "analytic" and template.multistart_method == "leastsq":
+        move_off_bounds(params)
+    return template.model.fit(data=signal,
+                              x=x,
+                              params=params,
+                              method=template.multistart_method,
+                              fit_kws=jacobian_fit_kws(template.multistart_method, template.jacobian))
+
+
+def fit_from_start(properties, x, signal, params, start):
+    # Module level, so that it can be pickled and sent to a worker process of multistart.
+    # Models can not be pickled, so workers compile their own template from properties.
+    result = fit_from_values(Deconvolver.fit_template(properties), x, signal, params, start)
+    return result.chisqr, dict(result.best_values), result.nfev
+
+
+@functools.lru_cache(maxsize=FIT_TEMPLATE_CACHE_SIZE)
+def compiled_fit_template(frozen_properties):
+    return Deconvolver().compile_template(dict(frozen_properties))
@@ -0,0 +1,363 @@
+import os
+import os.path as path_utils
+import sys
+import threading
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from contextlib import nullcontext
+from datetime import datetime
+
+import click
+import numpy as np
+from jproperties import Properties
+
+from src.logic.batch import failure_status, find_files, print_progress_record
+from src.logic.deconvolution import Deconvolver
+from src.logic.fit_plot import render_fit
+from src.logic.multistart import disable_parallel_starts
+from src.logic.result_cache import ResultCache, default_cache_dir
+from src.logic.stage_timer import TIMINGS_FILE_NAME, StageTimer, append_timings, total_timings
+
+
+def deconvolve_in_worker(signal_file_abs_path, experiment_label, properties, plot_peaks, initial_values):
+    # Module level, so that it can be pickled and sent to a worker process.
+    # Peaks are aggregated by the parent process, which owns all.peaks.
+    return Deconvolver().deconvolve_single_file(signal_file_abs_path=signal_file_abs_path,
+                                                experiment_label=experiment_label,
+                                                properties=properties,
+                                                plot_peaks=plot_peaks,
+                                                aggregate=False,
+                                                initial_values=initial_values)
+
+
+class BatchDeconvolver:
+    """Deconvolves a list of files on a pool of worker processes.
+
+    The batch remembers which files are already done, so calling `run` again after it
+    has been interrupted resumes the experiment instead of starting it over. Files still being
+    fitted by an interrupted run are left to it, so a resumed run may overlap with it on
+    another thread, and state shared by them is guarded by a lock.
+
+    Files are expected to be a series of similar spectra, so with the `warm_start` property
+    set to "previous" every fit starts from the best fit of the closest preceding finished
+    file, and with "median" from the median of the best fits of up to `warm_start_window`
+    closest finished files. It defaults to "none", i.e. every fit starts from properties.
+    Warm started files are fitted one at a time, in order, whatever `n_workers` is, so that the
+    seed of a file, and so its fit and cache key, do not depend on which files finished first.
+
+    With the `plot_mode` property set to "deferred", plots are rendered on a separate pool of
+    `n_renderers` processes, so that fitting does not wait for pdf files to be written.
+
+    With the `cache` property set to True, results of successful fits are kept in `cache_dir`,
+    up to `cache_max_size_mb`, and files whose contents, properties and initial values did not
+    change since are copied from there instead of being fitted again.
+    """
+
+    def __init__(self, filenames, experiment_label, properties, plot_peaks=True):
+        self.deconvolver = Deconvolver()
+        self.filenames = filenames
+        self.experiment_label = experiment_label
+        self.properties = properties
+        self.plot_peaks = plot_peaks
+        self.n_workers = max(1, self.deconvolver.optional_property_int(
+            properties.get("n_workers"), os.cpu_count() or 1))
+        self.warm_start = self.deconvolver.optional_property_str(properties.get("warm_start"), "none")
+        if self.warm_start not in ("none", "previous", "median"):
+            raise ValueError(f"Unknown warm_start: {self.warm_start}, expected none, previous or median")
+        self.warm_start_window = self.deconvolver.optional_property_int(properties.get("warm_start_window"), 5)
+        if self.warm_start != "none":
+            self.n_workers = 1
+        self.plot_mode = self.deconvolver.fit_template(properties).plot_mode if plot_peaks else "off"
+        self.n_renderers = max(1, self.deconvolver.optional_property_int(properties.get("n_renderers"), 1))
+        self.cache = None
+        if self.deconvolver.optional_property_bool(properties.get("cache"), False):
+            self.cache = ResultCache(
+                cache_dir=self.deconvolver.optional_property_str(properties.get("cache_dir"), default_cache_dir()),
+                max_size=self.deconvolver.optional_property_float(properties.get("cache_max_size_mb"), 1024) * 2 ** 20)
+        self.cache_keys = {}
+        self.timings = {}
+        self.completed = set()
+        self.in_flight = set()
+        self.best_values = {}
+        self.lock = threading.RLock()
+
+    @property
+    def checkpoint(self):
+        # The last index, such that all files up to it (inclusive) are done
+        checkpoint = -1
+        while checkpoint + 1 in self.completed:
+            checkpoint = checkpoint + 1
+        return None if checkpoint < 0 else checkpoint
+
+    def run(self, first_index=0, last_index=None, is_current=lambda: True):
+        """Yields (index, filename, deconvolution status) tuples as soon as files finish.
+
+        New files are only submitted while `is_current()` is true, files already being
+        processed when it turns false are still finished and reported. With plot_mode=deferred
+        files are reported before their plots are rendered, and run returns once all are.
+        """
+        last_index = len(self.filenames) if last_index is None else last_index
+        with self.lock:
+            pending = [i for i in range(first_index, last_index) if i not in self.completed | self.in_flight]
+        self.create_output_dirs(pending)
+        render_executor = ProcessPoolExecutor(max_workers=self.n_renderers) \
+            if self.plot_mode == "deferred" else nullcontext()
+        with render_executor as renderer:
+            renders = {}
+            for i, status in self.fit(pending, is_current):
+                if status.get("exit_code") == 0:
+                    timer = StageTimer(status.get("timings"))
+                    with timer.stage("aggregate"):
+                        self.deconvolver.aggregate_peaks(signal_file_abs_path=self.filenames[i],
+                                                         output_dir=status.get("output_dir"),
+                                                         peaks=status.get("peaks"),
+                                                         properties=self.properties)
+                    status["timings"] = timer.as_dict()
+                self.record_timings(i, status)
+                job = status.pop("render_job", None)
+                if job is not None:
+                    renders[renderer.submit(render_fit, **job)] = (i, job["path"], status)
+                else:
+                    self.store(i, status)
+                self.complete(i, status)
+                yield i, self.filenames[i], status
+            for future in as_completed(renders):
+                i, plot_path, status = renders[future]
+                try:
+                    future.result()
+                    self.store(i, status)
+                except Exception as e:
+                    self.log_render_error(plot_path, e)
+
+    def fit(self, pending, is_current):
+        """Yields (index, deconvolution status) tuples of the pending files as soon as they finish."""
+        if self.n_workers == 1 or len(pending) <= 1:
+            for i in pending:
+                if not is_current():
+                    break
+                if not self.claim(i):
+                    continue
+                initial_values = self.initial_values(i)
+                status = self.load(i, initial_values) or self.deconvolver.deconvolve_single_file(
+                    signal_file_abs_path=self.filenames[i],
+                    experiment_label=self.experiment_label,
+                    properties=self.properties,
+                    plot_peaks=self.plot_peaks,
+                    aggregate=False,
+                    initial_values=initial_values)
+                yield i, status
+            return
+
+        # Files are fitted in parallel already, so starts of multistart fits run one after another
+        with ProcessPoolExecutor(max_workers=min(self.n_workers, len(pending)),
+                                 initializer=disable_parallel_starts) as executor:
+            in_flight = {}
+            pending = list(reversed(pending))
+            while True:
+                # Keep a bounded number of files in flight, so that a pause takes effect quickly
+                while pending and len(in_flight) < 2 * self.n_workers and is_current():
+                    i = pending.pop()
+                    if not self.claim(i):
+                        continue
+                    initial_values = self.initial_values(i)
+                    status = self.load(i, initial_values)
+                    if status is not None:
+                        yield i, status
+                        continue
+                    future = executor.submit(deconvolve_in_worker,
+                                             self.filenames[i],
+                                             self.experiment_label,
+                                             self.properties,
+                                             self.plot_peaks,
+                                             initial_values)
+                    in_flight[future] = i
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = in_flight.pop(future)
+                    try:
+                        status = future.result()
+                    except Exception as e:
+                        status = failure_status(e, "output_dir")
+                    yield i, status
+
+    def claim(self, index):
+        """Marks a file as being fitted, False if it already is, by another run, or is done."""
+        with self.lock:
+            if index in self.completed or index in self.in_flight:
+                return False
+            self.in_flight.add(index)
+            return True
+
+    def load(self, index, initial_values):
+        """Status of a file copied from the cache into its output directory, or None if it is to be fitted."""
+        if self.cache is None:
+            return None
+        try:
+            # Only whether a pdf is written matters, not when it is rendered
+            key = self.cache.key(self.filenames[index], self.properties, self.plot_mode != "off", initial_values)
+        except OSError:
+            # Unreadable files fail in deconvolve_single_file, with the error logged there
+            return None
+        with self.lock:
+            self.cache_keys[index] = key
+        output_dir = path_utils.join(path_utils.dirname(self.filenames[index]), self.experiment_label)
+        timer = StageTimer()
+        with timer.stage("cache"):
+            status = self.cache.load(key, output_dir)
+        if status is not None:
+            self.deconvolver.save_experiment_properties(output_dir, self.properties)
+            status["timings"] = timer.as_dict()
+        return status
+
+    def store(self, index, status):
+        with self.lock:
+            key = self.cache_keys.pop(index, None)
+        if key is None or status.get("exit_code") != 0 or status.get("cached"):
+            return
+        file_names = self.deconvolver.output_file_names(self.filenames[index], self.properties, self.plot_peaks)
+        try:
+            # The running size of the cache is not thread-safe
+            with self.lock:
+                self.cache.store(key, status.get("output_dir"), file_names, status)
+        except OSError as e:
+            # A full or read-only cache must not fail the experiment
+            print("Error caching {file}: {error}".format(file=self.filenames[index], error=e), file=sys.stderr)
+
+    def record_timings(self, index, status):
+        """Appends timings of a file to timings.jsonl of its output directory."""
+        record = {"file": self.filenames[index],
+                  "exit_code": status.get("exit_code"),
+                  "cached": status.get("cached", False),
+                  "timings": status.get("timings"),
+                  "fit_statistics": status.get("fit_statistics"),
+                  "profile_file": status.get("profile_file")}
+        with self.lock:
+            self.timings[index] = record
+        if status.get("output_dir") is not None:
+            append_timings(path_utils.join(status.get("output_dir"), TIMINGS_FILE_NAME), record)
+
+    def timing_summary(self):
+        """Timings of all files done so far summed up by stage, see `stage_timer.total_timings`."""
+        with self.lock:
+            return total_timings(list(self.timings.values()))
+
+    def complete(self, index, status):
+        with self.lock:
+            self.completed.add(index)
+            self.in_flight.discard(index)
+            if status.get("exit_code") == 0:
+                self.best_values[index] = status.get("best_values")
+
+    def initial_values(self, index):
+        with self.lock:
+            return self.warm_start_values(index)
+
+    def warm_start_values(self, index):
+        if self.warm_start == "none" or len(self.best_values) == 0:
+            return None
+        if self.warm_start == "previous":
+            previous = [i for i in self.best_values if i < index]
+            return self.best_values[max(previous)] if previous else None
+        neighbours = sorted(self.best_values, key=lambda i: (abs(i - index), i))[:self.warm_start_window]
+        return {name: float(np.median([self.best_values[i][name] for i in neighbours]))
+                for name in self.best_values[neighbours[0]]}
+
+    @staticmethod
+    def log_render_error(plot_path, error):
+        message = "".join(traceback.format_exception(error))
+        print(message, file=sys.stderr)
+        with open(path_utils.join(path_utils.dirname(plot_path), "error.log"), "a") as error_log:
+            print("ERROR. Error rendering {plot}".format(plot=plot_path), file=error_log)
+            print(message, file=error_log)
+
+    def create_output_dirs(self, indices):
+        # Created up front, otherwise concurrent workers would race to create them
+        for i in indices:
+            output_dir = path_utils.join(path_utils.dirname(self.filenames[i]), self.experiment_label)
+            os.makedirs(output_dir, exist_ok=True)
+
+
+def load_properties(properties_file):
+    properties = Properties()
+    with open(properties_file, "rb") as file:
+        properties.load(file, "utf-8")
+    return properties.properties
+
+
+def find_signal_files(inputs, file_list, pattern):
+    filenames = []
+    if file_list is not None:
+        with open(file_list, "r") as file:
+            for line in file.readlines():
+                stripped_line = line.strip()
+                if len(stripped_line) > 0:
+                    filenames.append(path_utils.abspath(stripped_line))
+    return filenames + find_files(inputs, pattern)
+
+
+@click.command()
+@click.option("--properties-file", "-p",
+              type=click.Path(exists=True),
+              required=True,
+              help="Path to the fitting model properties file")
+@click.option("--file-list", "-f",
+              type=click.Path(exists=True),
+              help="Path to a file listing signal files, one per line")
+@click.option("--input", "-i", "inputs",
+              multiple=True,
+              help="Signal file, directory or glob pattern, may be repeated")
+@click.option("--pattern",
+              default="*.dpt",
+              help="Pattern of signal files in input directories")
+@click.option("--experiment-label", "-e",
+              help="Name of the output directories, defaults to experiment_<timestamp>")
+@click.option("--n-workers",
+              type=int,
+              help="Number of worker processes, overrides the n_workers property")
+@click.option("--skip-plotting-results",
+              is_flag=True,
+              default=False,
+              help="Weather to skip plotting the results")
+def deconvolve(properties_file,
+               file_list,
+               inputs,
+               pattern,
+               experiment_label,
+               n_workers,
+               skip_plotting_results):
+    properties = load_properties(properties_file)
+    if n_workers is not None:
+        properties["n_workers"] = str(n_workers)
+    filenames = find_signal_files(inputs, file_list, pattern)
+    if len(filenames) == 0:
+        raise click.UsageError("No signal file(s) selected!")
+    experiment_label = experiment_label or datetime.now().strftime("experiment_%m_%d_%Y__%H_%M_%S")
+
+    batch = BatchDeconvolver(filenames=filenames,
+                             experiment_label=experiment_label,
+                             properties=properties,
+                             plot_peaks=not skip_plotting_results)
+    print_progress_record(event="started", experiment=experiment_label, n_files=len(filenames))
+    n_failed = 0
+    for i, filename, status in batch.run():
+        if status.get("exit_code") != 0:
+            n_failed = n_failed + 1
+        print_progress_record(event="file",
+                              index=i,
+                              file=filename,
+                              exit_code=status.get("exit_code"),
+                              cached=status.get("cached", False),
+                              output_dir=status.get("output_dir"),
+                              error_message=status.get("error_message"),
+                              completed=len(batch.completed),
+                              n_files=len(filenames))
+    print_progress_record(event="finished", experiment=experiment_label, n_files=len(filenames),
+                          n_failed=n_failed, timings=batch.timing_summary())
+    if n_failed > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    deconvolve()
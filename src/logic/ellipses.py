@@ -1,6 +1,13 @@
+
 import click
 import numpy as np
 from matplotlib import pyplot as plt
+from matplotlib.figure import Figure
+
+from src.logic.grid_matrix import OUTPUT_FORMATS, create_grid_matrix, matrix_file_name, save_matrix
+
+# Grid points evaluated at once, bounds the memory of temporary arrays of step_function
+GRID_CHUNK_POINTS = 2 ** 20
 
 
 @click.command()
@@ -20,6 +27,19 @@ from matplotlib import pyplot as plt
               type=click.Path(exists=False),
               required=True,
               help='Path to the plot file')
+@click.option('--grid-x', 'grid_x_points',
+              type=click.IntRange(min=2),
+              default=500,
+              help='Number of grid points along the long diameter')
+@click.option('--grid-y', 'grid_y_points',
+              type=click.IntRange(min=2),
+              default=500,
+              help='Number of grid points along the short diameter')
+@click.option('--output-format',
+              type=click.Choice(OUTPUT_FORMATS),
+              default='dpt',
+              help='Format of the output file: dpt (tab separated text), npy or raw (memory-mapped float64, '
+                   'with a .json header), npy and raw files get their format as the extension')
 @click.option('--skip-plotting-results',
               is_flag=True,
               default=False,
@@ -36,13 +56,59 @@ def extrapolate_ellipse(long_diameter_file,
                         short_diameter_file,
                         output_file,
                         plot_file,
+                        grid_x_points,
+                        grid_y_points,
+                        output_format,
                         skip_plotting_results,
                         skip_showing_results,
                         skip_printing_rings):
-    # Load the tab-separated values files into NumPy arrays
-    long_diameter = np.loadtxt(long_diameter_file, delimiter='\t')
-    short_diameter = np.loadtxt(short_diameter_file, delimiter='\t')
+    result = extrapolate(long_diameter=load_diameter(long_diameter_file),
+                         short_diameter=load_diameter(short_diameter_file),
+                         grid_x_points=grid_x_points,
+                         grid_y_points=grid_y_points,
+                         output_file=output_file,
+                         output_format=output_format,
+                         compute_rings=not skip_printing_rings)
+
+    if not skip_printing_rings:
+        print(format_avg_z_rings(long_diameter_file, short_diameter_file, result["rings"]), end="")
+
+    if skip_plotting_results and skip_showing_results:
+        return
+
+    # Plot the 2D contour plot, on a pyplot figure only if it is to be shown
+    figure = plt.figure() if not skip_showing_results else Figure()
+    plot_extrapolation(figure, result)
+
+    if not skip_plotting_results:
+        figure.savefig(plot_file)
+
+    if not skip_showing_results:
+        plt.show()
+
+
+def load_diameter(diameter_file):
+    # Tab-separated values, a position and a value per row
+    return np.loadtxt(diameter_file, delimiter='\t')
+
 
+def extrapolate(long_diameter,
+                short_diameter,
+                grid_x_points=500,
+                grid_y_points=500,
+                output_file=None,
+                output_format="dpt",
+                compute_rings=True):
+    """Extrapolates z values of an elliptical cross-section from its long and short diameter profiles.
+
+    `long_diameter` and `short_diameter` are arrays of (position, value) rows. With `output_file`,
+    the grid matrix is also written there, see `grid_matrix.create_grid_matrix`, with the
+    extension of the npy and raw formats, see `grid_matrix.matrix_file_name`.
+
+    Returns a dict with the grid axes "xs" and "ys", z values "grid_z" (rows along x),
+    "radii_ratio", "rings", see `avg_z_rings`, or None without `compute_rings`, and the path
+    of the matrix "output_file", or None without `output_file`.
+    """
     min_long_diameter = np.min(long_diameter[:, 0])
     max_long_diameter = np.max(long_diameter[:, 0])
 
@@ -66,8 +132,8 @@ def extrapolate_ellipse(long_diameter_file,
         y_axis_intersection = np.sign(y_matrix) * r2
 
         # Find the closest values in long_diameter and short_diameter
-        long_idx = np.argmin(np.abs(long_diameter[:, 0, np.newaxis, np.newaxis] - x_axis_intersection), axis=0)
-        short_idx = np.argmin(np.abs(short_diameter[:, 0, np.newaxis, np.newaxis] - y_axis_intersection), axis=0)
+        long_idx = nearest_index(long_diameter[:, 0], x_axis_intersection)
+        short_idx = nearest_index(short_diameter[:, 0], y_axis_intersection)
 
         long_value = long_diameter[long_idx, 1]
         short_value = short_diameter[short_idx, 1]
@@ -83,95 +149,165 @@ def extrapolate_ellipse(long_diameter_file,
 
         return result
 
-    def compute_sum_and_count_inside_ellipse(grid_z, grid_x, grid_y, short_radius, long_radius):
-        # Create a mask for points inside or on the ellipse
-        ellipse_mask = (grid_x / long_radius) ** 2 + (grid_y / short_radius) ** 2 <= 1
-
-        # Filter grid_z using the mask
-        points_inside_ellipse = grid_z[ellipse_mask]
-
-        # Compute the sum and count of the filtered points
-        sum_values = np.sum(points_inside_ellipse)
-        count_values = points_inside_ellipse.size
-
-        return sum_values, count_values
-
-    # Generate a grid of points
-    grid_x, grid_y = np.mgrid[
-                     min_long_diameter:max_long_diameter:(500 * 1j),
-                     min_short_diameter:max_short_diameter:(500 * 1j)
-                     ]
-
-    # Apply the step function to the distances to get the z-values
-    grid_z = step_function(grid_x, grid_y)
-
-    if not skip_printing_rings:
-        print_avg_z_rings(compute_sum_and_count_inside_ellipse, grid_x, grid_y, grid_z, long_diameter,
-                          long_diameter_file,
-                          radii_ratio, short_diameter_file)
-
-    # Create a 2D matrix to store the data
-    matrix = np.zeros((grid_y.shape[0] + 1, grid_x.shape[1] + 1))
-
-    # Fill the first row with X values and the first column with Y values
-    matrix[0, 1:] = grid_x[:, 0]
-    matrix[1:, 0] = grid_y[0, :]
-
-    # Fill the remaining cells with Z values
-    matrix[1:, 1:] = grid_z
-
-    # Save the matrix to a .dpt file
-    np.savetxt(output_file, matrix, delimiter='\t')
-
-    plt.contourf(grid_x, grid_y, grid_z, cmap='viridis')
-    plt.colorbar(label='Z')
-    plt.xlabel('X')
-    plt.ylabel('Y')
-    plt.title('Visualization based on cross-section data')
-
-    # Plot the 2D contour plot
-    if not skip_plotting_results:
-        plt.savefig(plot_file)
-        plt.close()
-
-    if not skip_showing_results:
-        plt.show()
-
-
-def print_avg_z_rings(compute_sum_and_count_inside_ellipse,
-                      grid_x,
-                      grid_y,
-                      grid_z,
-                      long_diameter,
-                      long_diameter_file,
-                      radii_ratio,
-                      short_diameter_file):
-    print(f"{long_diameter_file} {short_diameter_file}")
-    print("")
+    # Generate a grid of points, as a column of x and a row of y values, which broadcast to the grid
+    xs = np.mgrid[min_long_diameter:max_long_diameter:(grid_x_points * 1j)]
+    ys = np.mgrid[min_short_diameter:max_short_diameter:(grid_y_points * 1j)]
+    grid_x = xs[:, np.newaxis]
+    grid_y = ys[np.newaxis, :]
+
+    # Apply the step function to the distances to get the z-values, a chunk of rows at a time,
+    # straight into the output matrix
+    if output_file is not None:
+        output_file = matrix_file_name(output_file, output_format)
+        matrix = create_grid_matrix(output_file, output_format, xs, ys)
+        grid_z = matrix[1:, 1:]
+    else:
+        grid_z = np.empty((len(xs), len(ys)))
+    chunk_rows = max(1, GRID_CHUNK_POINTS // len(ys))
+    for start in range(0, len(xs), chunk_rows):
+        grid_z[start:start + chunk_rows] = step_function(grid_x[start:start + chunk_rows], grid_y)
+
+    if output_file is not None:
+        save_matrix(output_file, output_format, matrix)
+
+    rings = avg_z_rings(grid_x, grid_y, grid_z, long_diameter, radii_ratio) if compute_rings else None
+    return {"xs": xs, "ys": ys, "grid_z": grid_z, "radii_ratio": radii_ratio, "rings": rings,
+            "output_file": output_file}
+
+
+def plot_extrapolation(figure, result):
+    """Draws a contour plot of the result of `extrapolate` on a matplotlib figure."""
+    ax = figure.add_subplot(111)
+    contour = ax.contourf(result["xs"], result["ys"], result["grid_z"].T, cmap='viridis')
+    figure.colorbar(contour, ax=ax, label='Z')
+    ax.set_xlabel('X')
+    ax.set_ylabel('Y')
+    ax.set_title('Visualization based on cross-section data')
+
+
+def nearest_index(samples, values):
+    """Index of the sample closest to each value, an array shaped like `values`.
+
+    Same as np.argmin(np.abs(samples[:, np.newaxis] - values), axis=0), including ties, which
+    go to the first sample, but looks values up by bisection of the sorted samples instead of
+    building a len(samples) x values.size temporary array.
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    flat_values = values.ravel()
+    if np.isnan(samples).any():
+        return brute_force_nearest_index(samples, flat_values).reshape(values.shape)
+
+    # Equal samples are one candidate, represented by the first of them
+    unique_samples, first_index = np.unique(samples, return_index=True)
+    n = len(unique_samples)
+    right = np.searchsorted(unique_samples, flat_values)
+    left = right - 1
+
+    def distance(positions):
+        valid = (positions >= 0) & (positions < n)
+        d = np.abs(unique_samples[np.clip(positions, 0, n - 1)] - flat_values)
+        return np.where(valid, d, np.inf)
+
+    left_distance = distance(left)
+    right_distance = distance(right)
+    best_distance = np.minimum(left_distance, right_distance)
+    index = np.where(right_distance == best_distance, first_index[np.clip(right, 0, n - 1)], len(samples))
+    index = np.where(left_distance == best_distance,
+                     np.minimum(index, first_index[np.clip(left, 0, n - 1)]), index)
+
+    # Rounding may make further samples exactly as close, rare enough to resolve one by one
+    unresolved = (~np.isfinite(best_distance)
+                  | (distance(left - 1) == best_distance)
+                  | (distance(right + 1) == best_distance))
+    if unresolved.any():
+        index[unresolved] = brute_force_nearest_index(samples, flat_values[unresolved])
+    return index.reshape(values.shape)
+
+
+def brute_force_nearest_index(samples, values):
+    return np.array([np.argmin(np.abs(samples - value)) for value in values], dtype=np.intp)
+
+
+def format_avg_z_rings(long_diameter_file, short_diameter_file, rings):
+    lines = [f"{long_diameter_file} {short_diameter_file}", ""]
+    for ring in rings:
+        label = "Ellipse" if ring["ring"] == 0 else "Ring"
+        lines.append(f"{label} r1={ring['r1']:.2f} r2={ring['r2']:.2f}: avg z: {ring['avg_z']:.2f}")
+    return "".join(line + "\n" for line in lines)
+
+
+def avg_z_rings(grid_x, grid_y, grid_z, long_diameter, radii_ratio):
+    """Average z of the ellipse of the first positive row of long_diameter, and of the rings between
+    ellipses of the consecutive rows.
+
+    Returns a list of dicts with keys "ring", "r1", "r2", "sum_z", "count_z" and "avg_z".
+    """
     rows = [row for row in long_diameter if row[0] > 0 and row[1] > 0]
+    long_radii = np.array([row[0] for row in rows], dtype=np.float64)
+    sums, counts = sum_and_count_inside_ellipses(grid_x, grid_y, grid_z, long_radii, radii_ratio)
 
-    # Initialize dynamic programming table
-    sums = [0] * len(rows)
-    counts = [0] * len(rows)
-
-    for i in range(len(rows)):
-        row = rows[i]
-        r1 = row[0]
-        r2 = r1 / radii_ratio
-        sums[i], counts[i] = compute_sum_and_count_inside_ellipse(grid_z, grid_x, grid_y, r1, r2)
-
+    rings = []
     for i in range(len(rows)):
-        row = rows[i]
-        r1 = row[0]
+        r1 = long_radii[i]
         r2 = r1 / radii_ratio
         if i == 0:
             sum_z = sums[i]
             count_z = counts[i]
-            print(f"Ellipse r1={r1:.2f} r2={r2:.2f}: avg z: {sum_z / count_z:.2f}")
         else:
             sum_z = sums[i] - sums[i - 1]
             count_z = counts[i] - counts[i - 1]
-            print(f"Ring r1={r1:.2f} r2={r2:.2f}: avg z: {sum_z / count_z:.2f}")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avg_z = sum_z / count_z
+        rings.append({"ring": i, "r1": r1, "r2": r2, "sum_z": sum_z, "count_z": count_z, "avg_z": avg_z})
+    return rings
+
+
+def inside_ellipse(grid_x, grid_y, long_radius, radii_ratio):
+    # Mask of points inside or on the ellipse with radii long_radius and long_radius / radii_ratio
+    return (grid_x / (long_radius / radii_ratio)) ** 2 + (grid_y / long_radius) ** 2 <= 1
+
+
+def sum_and_count_inside_ellipses(grid_x, grid_y, grid_z, long_radii, radii_ratio, tolerance=1e-9):
+    """Sums and counts of grid_z inside or on each of the concentric ellipses, in one pass over the grid.
+
+    Every grid point falls into the smallest ellipse containing it, which is a bin of its
+    elliptical radius sqrt((radii_ratio * x) ** 2 + y ** 2) among the sorted long radii.
+    Cumulative sums of the bins give the ellipses. Points within `tolerance` of a boundary are
+    tested against every ellipse, like `inside_ellipse` does, so rounding never moves a point.
+    """
+    long_radii = np.asarray(long_radii, dtype=np.float64)
+    radii = np.unique(long_radii)
+    n = len(radii)
+    bin_sums = np.zeros(n + 1)
+    bin_counts = np.zeros(n + 1, dtype=np.int64)
+    boundary_sums = np.zeros(n)
+    boundary_counts = np.zeros(n, dtype=np.int64)
+    grid_x, grid_y = np.asarray(grid_x, dtype=np.float64), np.asarray(grid_y, dtype=np.float64)
+    grid_z = np.asarray(grid_z, dtype=np.float64)
+    chunk_rows = max(1, GRID_CHUNK_POINTS // grid_z.shape[1])
+    for start in range(0, grid_z.shape[0], chunk_rows):
+        x, y, z = np.broadcast_arrays(grid_x[start:start + chunk_rows], grid_y, grid_z[start:start + chunk_rows])
+        x, y, z = x.ravel(), y.ravel(), z.ravel()
+        radius = np.sqrt((radii_ratio * x) ** 2 + y ** 2)
+        bins = np.searchsorted(radii, radius, side="left")
+        near = np.zeros(radius.shape, dtype=bool)
+        for neighbour in (bins - 1, bins):
+            valid = (neighbour >= 0) & (neighbour < n)
+            edge = radii[np.clip(neighbour, 0, max(n - 1, 0))] if n > 0 else radius
+            near |= valid & (np.abs(radius - edge) <= tolerance * np.abs(edge))
+        near |= ~np.isfinite(radius)
+        bin_sums += np.bincount(bins[~near], weights=z[~near], minlength=n + 1)
+        bin_counts += np.bincount(bins[~near], minlength=n + 1)
+        if near.any():
+            inside = inside_ellipse(x[near, np.newaxis], y[near, np.newaxis], radii, radii_ratio)
+            boundary_sums += np.where(inside, z[near, np.newaxis], 0.0).sum(axis=0)
+            boundary_counts += inside.sum(axis=0)
+
+    ellipse_sums = np.cumsum(bin_sums)[:n] + boundary_sums
+    ellipse_counts = np.cumsum(bin_counts)[:n] + boundary_counts
+    index = np.searchsorted(radii, long_radii)
+    return ellipse_sums[index], ellipse_counts[index]
 
 
 if __name__ == '__main__':
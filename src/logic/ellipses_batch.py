@@ -0,0 +1,172 @@
+import os
+import os.path as path_utils
+import sys
+from datetime import datetime
+
+import click
+import pandas as pd
+from matplotlib.figure import Figure
+
+from src.logic.batch import find_files, print_progress_record, run_items
+from src.logic.ellipses import extrapolate, load_diameter, plot_extrapolation
+from src.logic.grid_matrix import OUTPUT_FORMATS
+
+RING_TABLE_FILE_NAME = "rings.tsv"
+
+
+def find_diameter_pairs(inputs=(), manifest=None, long_suffix="_long", short_suffix="_short", extension=".tsv"):
+    """Pairs of long and short diameter files, as dicts with "name", "long diameter" and "short diameter".
+
+    `inputs` are directories, long diameter files or glob patterns of them. Every long diameter
+    file <name><long_suffix><extension> is paired with <name><short_suffix><extension> next to it,
+    a missing short diameter file raises ValueError. Lines of a `manifest` list a long and a short
+    diameter file separated by a tab, and optionally a name, relative paths are relative to the
+    manifest.
+    """
+    pairs = []
+    if manifest is not None:
+        manifest_dir = path_utils.dirname(path_utils.abspath(manifest))
+        with open(manifest, "r") as file:
+            for line in file.readlines():
+                fields = [field.strip() for field in line.strip().split("\t")]
+                if len(fields[0]) == 0:
+                    continue
+                if len(fields) < 2:
+                    raise ValueError(f"Expected a long and a short diameter file in manifest line: {line.strip()}")
+                long_file, short_file = [path_utils.join(manifest_dir, f) for f in fields[:2]]
+                name = fields[2] if len(fields) > 2 else pair_name(long_file, long_suffix, extension)
+                pairs.append(diameter_pair(name, long_file, short_file))
+
+    for long_file in find_files(inputs, f"*{long_suffix}{extension}"):
+        name = pair_name(long_file, long_suffix, extension)
+        short_file = path_utils.join(path_utils.dirname(long_file), f"{name}{short_suffix}{extension}")
+        if not path_utils.isfile(short_file):
+            raise ValueError(f"No short diameter file {short_file} for {long_file}")
+        pairs.append(diameter_pair(name, long_file, short_file))
+    return pairs
+
+
+def pair_name(long_file, long_suffix, extension):
+    name = path_utils.basename(long_file)
+    name = name[:-len(extension)] if extension and name.endswith(extension) else path_utils.splitext(name)[0]
+    return name[:-len(long_suffix)] if long_suffix and name.endswith(long_suffix) else name
+
+
+def diameter_pair(name, long_file, short_file):
+    return {"name": name,
+            "long diameter": path_utils.abspath(long_file),
+            "short diameter": path_utils.abspath(short_file)}
+
+
+def extrapolate_pair(pair, output_dir, grid_x_points, grid_y_points, output_format, plot):
+    """Extrapolates a pair into <name>.<output_format> and <name>.png in output_dir, returns its rings."""
+    # Module level, so that it can be pickled and sent to a worker process
+    result = extrapolate(long_diameter=load_diameter(pair["long diameter"]),
+                         short_diameter=load_diameter(pair["short diameter"]),
+                         grid_x_points=grid_x_points,
+                         grid_y_points=grid_y_points,
+                         output_file=path_utils.join(output_dir, f"{pair['name']}.{output_format}"),
+                         output_format=output_format)
+    if plot:
+        figure = Figure()
+        plot_extrapolation(figure, result)
+        figure.savefig(path_utils.join(output_dir, f"{pair['name']}.png"))
+    return result["rings"]
+
+
+def extrapolate_pairs(pairs, output_dir, grid_x_points=500, grid_y_points=500, output_format="dpt", plot=True,
+                      n_workers=None):
+    """Yields (index, pair, status) tuples as soon as pairs finish, on a pool of n_workers processes.
+
+    A status is a dict with "exit_code", "rings" and "error_message".
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    arguments = (output_dir, grid_x_points, grid_y_points, output_format, plot)
+    yield from run_items(extrapolate_pair, pairs, arguments, n_workers, key="rings")
+
+
+def ring_table(pairs, statuses):
+    """One row per ring of every successfully extrapolated pair, in the order of pairs."""
+    rows = []
+    for i, pair in enumerate(pairs):
+        status = statuses.get(i)
+        if status is None or status.get("exit_code") != 0:
+            continue
+        for ring in status["rings"]:
+            rows.append({"name": pair["name"],
+                         "long diameter": pair["long diameter"],
+                         "short diameter": pair["short diameter"],
+                         **ring})
+    return pd.DataFrame(rows, columns=["name", "long diameter", "short diameter", "ring", "r1", "r2", "sum_z",
+                                       "count_z", "avg_z"])
+
+
+def save_ring_table(output_dir, pairs, statuses):
+    path = path_utils.join(output_dir, RING_TABLE_FILE_NAME)
+    ring_table(pairs, statuses).to_csv(path_or_buf=path, sep="\t", index=False)
+    return path
+
+
+@click.command()
+@click.option("--input", "-i", "inputs",
+              multiple=True,
+              help="Directory, long diameter file or glob pattern of long diameter files, may be repeated")
+@click.option("--manifest", "-m",
+              type=click.Path(exists=True),
+              help="Path to a file listing a long and a short diameter file (and a name) per line, tab separated")
+@click.option("--long-suffix", default="_long", help="Suffix of long diameter file names")
+@click.option("--short-suffix", default="_short", help="Suffix of short diameter file names")
+@click.option("--extension", default=".tsv", help="Extension of diameter files")
+@click.option("--output-dir", "-o",
+              type=click.Path(file_okay=False),
+              help="Output directory, defaults to experiment_<timestamp> next to the first long diameter file")
+@click.option("--grid-x", "grid_x_points", type=click.IntRange(min=2), default=500,
+              help="Number of grid points along the long diameter")
+@click.option("--grid-y", "grid_y_points", type=click.IntRange(min=2), default=500,
+              help="Number of grid points along the short diameter")
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default="dpt",
+              help="Format of the grid matrix files")
+@click.option("--n-workers", type=click.IntRange(min=1), help="Number of worker processes, defaults to CPUs")
+@click.option("--skip-plotting-results", is_flag=True, default=False, help="Weather to skip plotting the results")
+def extrapolate_ellipses(inputs,
+                         manifest,
+                         long_suffix,
+                         short_suffix,
+                         extension,
+                         output_dir,
+                         grid_x_points,
+                         grid_y_points,
+                         output_format,
+                         n_workers,
+                         skip_plotting_results):
+    try:
+        pairs = find_diameter_pairs(inputs, manifest, long_suffix, short_suffix, extension)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    if len(pairs) == 0:
+        raise click.UsageError("No diameter file pair(s) selected!")
+    output_dir = output_dir or path_utils.join(path_utils.dirname(pairs[0]["long diameter"]),
+                                               datetime.now().strftime("experiment_%m_%d_%Y__%H_%M_%S"))
+
+    print_progress_record(event="started", output_dir=output_dir, n_pairs=len(pairs))
+    statuses = {}
+    for i, pair, status in extrapolate_pairs(pairs, output_dir, grid_x_points, grid_y_points, output_format,
+                                             not skip_plotting_results, n_workers):
+        statuses[i] = status
+        print_progress_record(event="pair",
+                              index=i,
+                              name=pair["name"],
+                              exit_code=status["exit_code"],
+                              error_message=status["error_message"],
+                              completed=len(statuses),
+                              n_pairs=len(pairs))
+    n_failed = len([status for status in statuses.values() if status["exit_code"] != 0])
+    ring_table_file = save_ring_table(output_dir, pairs, statuses)
+    print_progress_record(event="finished", output_dir=output_dir, ring_table=ring_table_file, n_pairs=len(pairs),
+                          n_failed=n_failed)
+    if n_failed > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    extrapolate_ellipses()
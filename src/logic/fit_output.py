@@ -0,0 +1,118 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+OUTPUT_FORMATS = ("csv", "npz", "parquet")
+
+# Parquet files keep everything, which is not a column, in the schema metadata under this key
+PARQUET_METADATA_KEY = b"deconvolution"
+
+
+def output_file_name(file_name_root, output_format):
+    """Name of the single file holding the fit of a signal file, for the binary formats."""
+    if output_format not in ("npz", "parquet"):
+        raise ValueError(f"Unknown binary output format: {output_format}, expected npz or parquet")
+    return f"{file_name_root}.{output_format}"
+
+
+def write_fit(path, output_format, x, signal, fit, components, component_names, peaks, fit_report,
+              background=None):
+    """Writes a fit into a single file, which `load_fit` reads back.
+
+    `components` is a len(component_names) x len(x) matrix of the fitted peaks, and `peaks` the
+    peak table, as built by `Deconvolver.init_peaks`.
+    """
+    if output_format == "npz":
+        write_npz(path, x, signal, fit, components, component_names, peaks, fit_report, background)
+    elif output_format == "parquet":
+        write_parquet(path, x, signal, fit, components, component_names, peaks, fit_report, background)
+    else:
+        raise ValueError(f"Unknown binary output format: {output_format}, expected npz or parquet")
+
+
+def write_npz(path, x, signal, fit, components, component_names, peaks, fit_report, background=None):
+    arrays = {
+        "x": np.asarray(x, dtype=np.float64),
+        "signal": np.asarray(signal, dtype=np.float64),
+        "fit": np.asarray(fit, dtype=np.float64),
+        "components": np.asarray(components, dtype=np.float64).reshape(len(component_names), len(x)),
+        "component_names": np.array(component_names, dtype=str),
+        "peaks": np.array(json.dumps(peaks)),
+        "fit_report": np.array(fit_report)
+    }
+    if background is not None:
+        arrays["background"] = np.asarray(background, dtype=np.float64)
+    # np.savez appends .npz to names without it, write through a file object to keep the name
+    with open(path, "wb") as output:
+        np.savez_compressed(output, **arrays)
+
+
+def write_parquet(path, x, signal, fit, components, component_names, peaks, fit_report, background=None):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ValueError("output_format=parquet requires pyarrow, install it or use npz") from e
+    columns = {"x": x, "signal": signal, "fit": fit}
+    if background is not None:
+        columns["background"] = background
+    for name, component in zip(component_names, components):
+        columns[name] = component
+    table = pyarrow.table({name: np.asarray(column, dtype=np.float64) for name, column in columns.items()})
+    metadata = {
+        "component_names": list(component_names),
+        "peaks": peaks,
+        "fit_report": fit_report
+    }
+    table = table.replace_schema_metadata({PARQUET_METADATA_KEY: json.dumps(metadata)})
+    pyarrow.parquet.write_table(table, path)
+
+
+def load_fit(path):
+    """Reads a fit written by `write_fit`, the format is taken from the file extension.
+
+    Returns a dict with arrays "x", "signal", "fit", "components", "background" (None without
+    a fitted background), the list "component_names", the "peaks" DataFrame and "fit_report".
+    """
+    if path.endswith(".npz"):
+        return load_npz(path)
+    if path.endswith(".parquet"):
+        return load_parquet(path)
+    raise ValueError(f"Unknown fit file: {path}, expected a .npz or .parquet file")
+
+
+def load_npz(path):
+    with np.load(path, allow_pickle=False) as data:
+        return {
+            "x": data["x"],
+            "signal": data["signal"],
+            "fit": data["fit"],
+            "components": data["components"],
+            "component_names": data["component_names"].tolist(),
+            "background": data["background"] if "background" in data else None,
+            "peaks": pd.DataFrame(json.loads(data["peaks"].item())),
+            "fit_report": data["fit_report"].item()
+        }
+
+
+def load_parquet(path):
+    try:
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ValueError("Reading parquet files requires pyarrow") from e
+    table = pyarrow.parquet.read_table(path)
+    metadata = json.loads(table.schema.metadata[PARQUET_METADATA_KEY])
+    component_names = metadata["component_names"]
+    column = lambda name: table.column(name).to_numpy()
+    return {
+        "x": column("x"),
+        "signal": column("signal"),
+        "fit": column("fit"),
+        "components": np.array([column(name) for name in component_names]).reshape(len(component_names),
+                                                                                     table.num_rows),
+        "component_names": component_names,
+        "background": column("background") if "background" in table.column_names else None,
+        "peaks": pd.DataFrame(metadata["peaks"]),
+        "fit_report": metadata["fit_report"]
+    }
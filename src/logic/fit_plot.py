@@ -0,0 +1,39 @@
+from matplotlib.figure import Figure
+
+PLOT_MODES = ("inline", "deferred", "off")
+
+
+def render_job(path, x, signal, fit, components, component_labels, background=None, background_label=None):
+    """Everything `render_fit` needs to plot a fit, small enough to be sent to a renderer process."""
+    return {
+        "path": path,
+        "x": x,
+        "signal": signal,
+        "fit": fit,
+        "components": components,
+        "component_labels": component_labels,
+        "background": background,
+        "background_label": background_label
+    }
+
+
+def render_fit(path, x, signal, fit, components, component_labels, background=None, background_label=None):
+    """Plots the signal, the fit and its components into a pdf file.
+
+    Uses its own Figure instead of the global pyplot state, so it is safe to call from any
+    thread or process.
+    """
+    figure = Figure()
+    ax = figure.add_subplot(111)
+    ax.plot(x, signal, label='signal')
+    ax.plot(x, fit, '--', label='fit')
+    for component, label in zip(components, component_labels):
+        ax.fill(x, component, label=label, alpha=0.1)
+    if background is not None:
+        ax.plot(x, background, '--', label=background_label)
+    ax.legend(loc="upper center",
+              bbox_to_anchor=(0.5, -0.05),
+              fancybox=True,
+              shadow=True,
+              ncol=3)
+    figure.savefig(path, format="pdf", bbox_inches="tight")
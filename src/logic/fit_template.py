@@ -0,0 +1,120 @@
+import numpy as np
+
+from src.logic.initial_guess import guess_values
+from src.logic.signal_reader import SignalReader
+from src.logic.windowing import auto_windows, bound_windows, peak_prefixes
+
+# Placeholders of limits, which depend on the signal and are only known once a file is read
+SIGNAL_MIN_X = "signal_min_x"
+SIGNAL_MAX_X = "signal_max_x"
+SIGNAL_MIN_Y = "signal_min_y"
+SIGNAL_MAX_Y = "signal_max_y"
+
+
+class FitTemplate:
+    """Fitting setup compiled once from properties, see `Deconvolver.fit_template`.
+
+    Holds the typed properties, the composite model, its parameters and the signal reader.
+    Files of a batch share the template, and only clone its parameters to fill in the signal
+    dependent limits.
+    """
+
+    def __init__(self,
+                 input_format_separator,
+                 input_format_header,
+                 output_format_separator,
+                 output_format_header,
+                 method,
+                 jacobian,
+                 n_gauss,
+                 n_lorentz,
+                 include_background,
+                 warm_start_span,
+                 output_format,
+                 plot_mode,
+                 windowing,
+                 window_margin,
+                 window_threshold,
+                 window_min_gap,
+                 initial_guess,
+                 initial_guess_smoothing,
+                 initial_guess_prominence,
+                 explicit_values,
+                 multistart_method,
+                 multistart_n_starts,
+                 multistart_n_workers,
+                 multistart_target_chisqr,
+                 multistart_time_limit,
+                 multistart_seed,
+                 model,
+                 params,
+                 signal_dependent_limits):
+        self.input_format_separator = input_format_separator
+        self.input_format_header = input_format_header
+        self.output_format_separator = output_format_separator
+        self.output_format_header = output_format_header
+        self.method = method
+        self.jacobian = jacobian
+        self.n_gauss = n_gauss
+        self.n_lorentz = n_lorentz
+        self.include_background = include_background
+        self.warm_start_span = warm_start_span
+        self.output_format = output_format
+        self.plot_mode = plot_mode
+        self.windowing = windowing
+        self.window_margin = window_margin
+        self.window_threshold = window_threshold
+        self.window_min_gap = window_min_gap
+        self.initial_guess = initial_guess
+        self.initial_guess_smoothing = initial_guess_smoothing
+        self.initial_guess_prominence = initial_guess_prominence
+        self.explicit_values = explicit_values
+        self.multistart_method = multistart_method
+        self.multistart_n_starts = multistart_n_starts
+        self.multistart_n_workers = multistart_n_workers
+        self.multistart_target_chisqr = multistart_target_chisqr
+        self.multistart_time_limit = multistart_time_limit
+        self.multistart_seed = multistart_seed
+        self.model = model
+        self.params = params
+        self.signal_dependent_limits = signal_dependent_limits
+        self.signal_reader = SignalReader(input_format_separator, input_format_header)
+
+    def make_params(self, x, signal):
+        """Returns a copy of the parameters, with limits of the given signal."""
+        signal_limits = {
+            SIGNAL_MIN_X: np.min(x),
+            SIGNAL_MAX_X: np.max(x),
+            SIGNAL_MIN_Y: np.min(signal),
+            SIGNAL_MAX_Y: np.max(signal)
+        }
+        params = self.params.copy()
+        for name, limits in self.signal_dependent_limits.items():
+            params[name].set(**resolve_limits(limits, signal_limits))
+        return params
+
+    def windows(self, x, signal, params):
+        """Windows of peaks fitted separately, see `windowing`, or None to fit all peaks at once."""
+        prefixes = peak_prefixes(self.n_gauss, self.n_lorentz)
+        if self.windowing == "bounds":
+            return bound_windows(params, prefixes, self.window_margin)
+        if self.windowing == "auto":
+            return auto_windows(x, signal, params, prefixes, self.window_threshold, self.window_min_gap)
+        return None
+
+    def initial_values(self, x, signal, params):
+        """Initial values estimated from peaks of the signal, see `initial_guess`, or None to start
+        from the values of the properties."""
+        if self.initial_guess == "auto":
+            return guess_values(x, signal, params, self.n_gauss, self.n_lorentz, self.initial_guess_smoothing,
+                                self.initial_guess_prominence, skip=self.explicit_values)
+        return None
+
+
+def resolve_limits(limits, signal_limits):
+    return {key: signal_limits.get(value, value) if isinstance(value, str) else value
+            for key, value in limits.items()}
+
+
+def is_signal_dependent(limits):
+    return any(isinstance(value, str) for value in limits.values())
@@ -0,0 +1,95 @@
+import json
+import os
+
+import numpy as np
+
+OUTPUT_FORMATS = ("dpt", "npy", "raw")
+
+# First bytes of every npy file
+NPY_MAGIC = b"\x93NUMPY"
+
+
+def create_grid_matrix(output_file, output_format, xs, ys):
+    """Matrix of a grid, a header row and a header column of coordinates, and z values in the rest.
+
+    Row i of the z values goes along y at the i-th x value, i.e. matrix[1 + i, 1 + j] is z at
+    (xs[i], ys[j]), and the top left corner is 0. npy and raw matrices have x values in the header
+    column and y values in the header row, whatever the shape of the grid. dpt matrices keep the
+    layout of the original .dpt files, which have x values in the header row and y values in the
+    header column, for square grids, and the layout of npy and raw matrices for other grids, which
+    the original .dpt files did not support.
+
+    For npy and raw formats the matrix is memory-mapped from output_file, so filling in z values
+    writes them out, and for dpt it lives in memory, until `save_matrix` writes it as text.
+    """
+    matrix = create_matrix(output_file, output_format, (len(xs) + 1, len(ys) + 1))
+    header_row, header_column = (xs, ys) if output_format == "dpt" and len(xs) == len(ys) else (ys, xs)
+    matrix[0, 0] = 0.0
+    matrix[0, 1:] = header_row
+    matrix[1:, 0] = header_column
+    return matrix
+
+
+def matrix_file_name(output_file, output_format):
+    """output_file with the extension of npy and raw formats, text formats keep any extension."""
+    if output_format == "dpt":
+        return output_file
+    root, extension = os.path.splitext(output_file)
+    return output_file if extension == f".{output_format}" else f"{root}.{output_format}"
+
+
+def create_matrix(output_file, output_format, shape):
+    if output_format == "dpt":
+        return np.empty(shape)
+    if output_format == "npy":
+        return np.lib.format.open_memmap(output_file, mode="w+", dtype=np.float64, shape=shape)
+    if output_format == "raw":
+        with open(raw_header_file(output_file), "w") as header:
+            json.dump({"shape": list(shape), "dtype": np.dtype(np.float64).str, "order": "C"}, header)
+        return np.memmap(output_file, mode="w+", dtype=np.float64, shape=shape)
+    raise ValueError(f"Unknown output format: {output_format}, expected one of {', '.join(OUTPUT_FORMATS)}")
+
+
+def save_matrix(output_file, output_format, matrix):
+    """Writes a matrix created by `create_matrix` to output_file."""
+    if output_format == "dpt":
+        np.savetxt(output_file, matrix, delimiter="\t")
+    else:
+        matrix.flush()
+
+
+def raw_header_file(path):
+    return path + ".json"
+
+
+def sniff_format(path):
+    """Format of a matrix written by `save_matrix`: npy by its magic bytes, raw by its .json header, or dpt."""
+    with open(path, "rb") as file:
+        if file.read(len(NPY_MAGIC)) == NPY_MAGIC:
+            return "npy"
+    return "raw" if os.path.exists(raw_header_file(path)) else "dpt"
+
+
+def load_matrix(path, mmap_mode="r"):
+    """Reads a matrix written by `save_matrix`, with the format taken from the contents of the file.
+
+    npy files, recognized by their magic bytes, and raw files, by their .json header, are
+    memory-mapped with `mmap_mode`, anything else is parsed as tab separated text.
+    """
+    matrix_format = sniff_format(path)
+    if matrix_format == "npy":
+        return np.load(path, mmap_mode=mmap_mode)
+    if matrix_format == "raw":
+        with open(raw_header_file(path), "r") as header_file:
+            header = json.load(header_file)
+        return np.memmap(path, mode=mmap_mode or "r", dtype=np.dtype(header["dtype"]), shape=tuple(header["shape"]),
+                         order=header["order"])
+    return np.loadtxt(path, delimiter="\t", ndmin=2)
+
+
+def load_grid(path, mmap_mode="r"):
+    """Reads a grid matrix, see `create_grid_matrix`, returns x values, y values and z values."""
+    matrix = load_matrix(path, mmap_mode)
+    if sniff_format(path) == "dpt" and matrix.shape[0] == matrix.shape[1]:
+        return matrix[0, 1:], matrix[1:, 0], matrix[1:, 1:]
+    return matrix[1:, 0], matrix[0, 1:], matrix[1:, 1:]
@@ -0,0 +1,120 @@
+import numpy as np
+from lmfit.lineshapes import gaussian, lorentzian
+from scipy.optimize import nnls
+from scipy.signal import find_peaks, savgol_filter
+
+from src.logic.windowing import parameter_range, peak_prefixes
+
+INITIAL_GUESS_MODES = ("none", "auto")
+
+# Order of the polynomials smoothing the signal, and its derivative
+SMOOTHING_ORDER = 3
+
+
+def smoothing_window(ys, prominence):
+    """Full width at half maximum in points of the narrowest peak more prominent than `prominence` times
+    the range of the signal, smoothing over more points would merge close peaks, over fewer keeps noise."""
+    indices, properties = find_peaks(ys, prominence=prominence * (np.max(ys) - np.min(ys)), width=1.0)
+    if len(indices) == 0:
+        return SMOOTHING_ORDER + 2
+    return max(SMOOTHING_ORDER + 2, int(np.min(properties["widths"])))
+
+
+def smoothed_signal(x, signal, window=None, prominence=0.05):
+    """Signal sorted by x, smoothed by a Savitzky-Golay filter of `window` points, and its second derivative.
+
+    The window defaults to `smoothing_window`.
+    """
+    order = np.argsort(x, kind="stable")
+    xs, ys = np.asarray(x, dtype=np.float64)[order], np.asarray(signal, dtype=np.float64)[order]
+    if len(xs) < 3:
+        return xs, ys, np.zeros_like(ys)
+    if window is None:
+        window = smoothing_window(ys, prominence)
+    # The window is odd, longer than the order of the polynomials and not longer than the signal
+    window = min(window, len(xs) if len(xs) % 2 == 1 else len(xs) - 1)
+    window = window if window % 2 == 1 else window - 1
+    if window <= SMOOTHING_ORDER:
+        return xs, ys, np.zeros_like(ys)
+    delta = (xs[-1] - xs[0]) / (len(xs) - 1)
+    smooth = savgol_filter(ys, window, SMOOTHING_ORDER)
+    second_derivative = savgol_filter(ys, window, SMOOTHING_ORDER, deriv=2, delta=delta)
+    return xs, smooth, second_derivative
+
+
+def detect_peaks(x, signal, window, prominence):
+    """Candidate peaks at minima of the smoothed second derivative, which also finds shoulders of peaks.
+
+    Minima deeper than `prominence` times the deepest one are candidates. The inflection points
+    around a candidate, where the second derivative crosses zero, are its half width apart, which
+    is sigma of a Gaussian. Returns the smoothed baseline and (center, height, half_width) arrays
+    of candidates, deepest first, heights are above the baseline.
+    """
+    xs, smooth, second_derivative = smoothed_signal(x, signal, window, prominence)
+    baseline = np.min(smooth)
+    curvature = -second_derivative
+    if np.max(curvature) <= 0:
+        return baseline, np.empty(0), np.empty(0), np.empty(0)
+    indices, _ = find_peaks(curvature, height=0.0, prominence=prominence * np.max(curvature))
+    indices = indices[np.argsort(-curvature[indices], kind="stable")]
+
+    # Points, where the curvature is not negative, bound the inflection points
+    flat = np.flatnonzero(curvature <= 0.0)
+    half_widths = np.empty(len(indices))
+    for k, i in enumerate(indices):
+        position = np.searchsorted(flat, i)
+        left = zero_crossing(xs, curvature, flat[position - 1]) if position > 0 else xs[0]
+        right = zero_crossing(xs, curvature, flat[position] - 1) if position < len(flat) else xs[-1]
+        half_widths[k] = (right - left) / 2
+    return baseline, xs[indices], smooth[indices] - baseline, half_widths
+
+
+def zero_crossing(xs, values, i):
+    """x, where values cross zero between points i and i + 1, interpolated linearly."""
+    step = values[i] - values[i + 1]
+    fraction = values[i] / step if step != 0 else 0.5
+    return xs[i] + fraction * (xs[i + 1] - xs[i])
+
+
+def guess_values(x, signal, params, n_gauss, n_lorentz, window, prominence, skip=()):
+    """Initial values of peaks estimated from candidates of `detect_peaks`, by parameter name.
+
+    Peaks with the narrowest center bounds pick first, each the deepest candidate within its
+    center bounds, which no other peak picked. A peak without one is centered in its bounds.
+    Sigmas are clipped to their bounds, and amplitudes of all peaks with these centers and sigmas
+    are fitted to the signal above its baseline by non-negative linear least squares, which
+    splits the height of overlapping peaks between them. Names in `skip` are left out, e.g.
+    parameters with values given in properties.
+    """
+    baseline, centers, heights, half_widths = detect_peaks(x, signal, window, prominence)
+    prefixes = peak_prefixes(n_gauss, n_lorentz)
+    ranges = {prefix: parameter_range(params[prefix + "center"]) for prefix in prefixes}
+    shapes = {}
+    taken = np.zeros(len(centers), dtype=bool)
+    for prefix in sorted(prefixes, key=lambda p: ranges[p][1] - ranges[p][0]):
+        center_min, center_max = ranges[prefix]
+        inside = np.flatnonzero(~taken & (centers >= center_min) & (centers <= center_max))
+        sigma_min, sigma_max = parameter_range(params[prefix + "sigma"])
+        if len(inside) > 0:
+            taken[inside[0]] = True
+            center = centers[inside[0]]
+            # Inflection points of a Lorentzian are at sigma / sqrt(3) from its center
+            sigma = half_widths[inside[0]] * (1.0 if prefix.startswith("gauss") else np.sqrt(3.0))
+        elif np.isfinite(center_min) and np.isfinite(center_max):
+            center = (center_min + center_max) / 2
+            sigma = (sigma_min + sigma_max) / 2 if np.isfinite(sigma_max) else sigma_min
+        else:
+            continue
+        shapes[prefix] = (float(center), float(min(max(sigma, sigma_min), sigma_max)))
+
+    values = {"bkg_c": float(baseline)}
+    if len(shapes) > 0:
+        x = np.asarray(x, dtype=np.float64)
+        basis = np.column_stack([(gaussian if prefix.startswith("gauss") else lorentzian)(x, 1.0, center, sigma)
+                                 for prefix, (center, sigma) in shapes.items()])
+        amplitudes, _ = nnls(basis, np.asarray(signal, dtype=np.float64) - baseline)
+        for (prefix, (center, sigma)), amplitude in zip(shapes.items(), amplitudes):
+            values[prefix + "center"] = center
+            values[prefix + "sigma"] = sigma
+            values[prefix + "amplitude"] = float(amplitude)
+    return {name: value for name, value in values.items() if name not in skip}
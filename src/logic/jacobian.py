@@ -0,0 +1,91 @@
+import re
+
+import numpy as np
+from lmfit.lineshapes import s2pi, tiny
+
+PEAK_PARAMETER_NAME = re.compile(r"^(gauss|lorentz)_peak\d+_(amplitude|center|sigma)$")
+
+ANALYTIC_JACOBIAN_METHODS = ("leastsq", "least_squares")
+
+
+def sum_of_peaks_jacobian(params, data, weights, x=None, **kwargs):
+    """Closed-form Jacobian of the residual (data - model) * weights of the composite model.
+
+    The model is a sum of a constant background ("bkg_c"), Gaussian and Lorentzian peaks, as
+    built by `Deconvolver.build_model`. Returns a len(x) x n_varying_parameters matrix, with
+    columns in the order lmfit passes the varying parameters to the minimizer.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    values = params.valuesdict()
+    names = [name for name, param in params.items() if param.vary and not param.expr]
+    jacobian = np.empty((len(x), len(names)))
+    for column, name in enumerate(names):
+        if name == "bkg_c":
+            jacobian[:, column] = 1.0
+            continue
+        match = PEAK_PARAMETER_NAME.match(name)
+        if match is None:
+            raise ValueError(f"No analytic derivative of parameter {name}")
+        peak_type, parameter = match.groups()
+        prefix = name[:-len(parameter)]
+        amplitude = values[prefix + "amplitude"]
+        center = values[prefix + "center"]
+        sigma = values[prefix + "sigma"]
+        if peak_type == "gauss":
+            jacobian[:, column] = gaussian_derivative(x, amplitude, center, sigma, parameter)
+        else:
+            jacobian[:, column] = lorentzian_derivative(x, amplitude, center, sigma, parameter)
+
+    # The residual is data - model, hence the sign
+    jacobian = -jacobian
+    if weights is not None:
+        jacobian = jacobian * np.asarray(weights, dtype=np.float64)[:, np.newaxis]
+    return jacobian
+
+
+def gaussian_derivative(x, amplitude, center, sigma, parameter):
+    sigma = max(tiny, sigma)
+    shape = np.exp(-(x - center) ** 2 / max(tiny, 2 * sigma ** 2)) / max(tiny, s2pi * sigma)
+    if parameter == "amplitude":
+        return shape
+    if parameter == "center":
+        return amplitude * shape * (x - center) / sigma ** 2
+    return amplitude * shape * ((x - center) ** 2 / sigma ** 3 - 1.0 / sigma)
+
+
+def lorentzian_derivative(x, amplitude, center, sigma, parameter):
+    sigma = max(tiny, sigma)
+    squared_distance = (x - center) ** 2
+    denominator = sigma ** 2 + squared_distance
+    if parameter == "amplitude":
+        return sigma / (np.pi * denominator)
+    if parameter == "center":
+        return amplitude * 2.0 * sigma * (x - center) / (np.pi * denominator ** 2)
+    return amplitude * (squared_distance - sigma ** 2) / (np.pi * denominator ** 2)
+
+
+def move_off_bounds(params, fraction=1e-6):
+    """Moves initial values sitting exactly on a bound slightly inside.
+
+    leastsq maps bounded parameters with a sine, whose gradient vanishes at the bounds, so a
+    fit starting there with an exact jacobian would never move. Finite differences hide it.
+    """
+    for param in params.values():
+        if param.vary and not param.expr and np.isfinite(param.min) and np.isfinite(param.max):
+            margin = fraction * (param.max - param.min)
+            param.value = min(max(param.value, param.min + margin), param.max - margin)
+
+
+def jacobian_fit_kws(method, jacobian):
+    """Returns the keyword arguments of `Model.fit`, which make the minimizer use `jacobian`.
+
+    `jacobian` is either "numeric" (finite differences, the default) or "analytic".
+    """
+    if jacobian == "numeric":
+        return {}
+    if jacobian != "analytic":
+        raise ValueError(f"Unknown jacobian: {jacobian}, expected numeric or analytic")
+    if method not in ANALYTIC_JACOBIAN_METHODS:
+        raise ValueError(f"Analytic jacobian is only supported by {', '.join(ANALYTIC_JACOBIAN_METHODS)}, "
+                         f"not by {method}")
+    return {"Dfun": sum_of_peaks_jacobian}
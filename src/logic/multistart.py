@@ -0,0 +1,154 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+from scipy.stats import qmc
+
+MULTISTART_METHOD = "multistart"
+
+# Starts with chi-square within this fraction of the best one found the same minimum
+SAME_MINIMUM_TOLERANCE = 0.01
+
+# Process pool shared by all multistarts of this process, see `starts_executor`
+shared_executor = None
+shared_executor_workers = None
+shared_executor_lock = threading.Lock()
+
+# False in processes, which already run in parallel with others, see `disable_parallel_starts`
+parallel_starts = True
+
+
+def disable_parallel_starts():
+    """Runs starts of every multistart of this process one after another, whatever n_workers is.
+
+    Initializer of worker processes of a batch, which fit files in parallel already, so that
+    every one of them does not start a pool of its own.
+    """
+    global parallel_starts
+    parallel_starts = False
+
+
+def starts_executor(n_workers):
+    """Process pool of n_workers processes, created by the first multistart and reused by later ones.
+
+    A multistart with a different number of workers replaces it, the replaced pool exits once
+    starts submitted to it finished.
+    """
+    global shared_executor, shared_executor_workers
+    with shared_executor_lock:
+        if shared_executor is None or shared_executor_workers != n_workers:
+            if shared_executor is not None:
+                shared_executor.shutdown(wait=False)
+            shared_executor = ProcessPoolExecutor(max_workers=n_workers)
+            shared_executor_workers = n_workers
+        return shared_executor
+
+
+def latin_hypercube_starts(params, n_starts, seed):
+    """Values of varying parameters to start local fits from, by parameter name.
+
+    The first start are the current values, e.g. from an initial guess or a warm start, the
+    other ones are points of a Latin hypercube within the bounds of the parameters, which
+    spreads them over the range of every parameter. Parameters with infinite bounds keep
+    their current values.
+    """
+    varying = {name: param for name, param in params.items() if param.vary and not param.expr}
+    starts = [{name: param.value for name, param in varying.items()}]
+    sampled = [name for name, param in varying.items() if np.isfinite(param.min) and np.isfinite(param.max)]
+    if n_starts <= 1 or len(sampled) == 0:
+        return starts[:max(1, n_starts)]
+    lows = np.array([varying[name].min for name in sampled])
+    highs = np.array([varying[name].max for name in sampled])
+    points = lows + qmc.LatinHypercube(d=len(sampled), seed=seed).random(n_starts - 1) * (highs - lows)
+    for point in points:
+        start = dict(starts[0])
+        start.update({name: float(value) for name, value in zip(sampled, point)})
+        starts.append(start)
+    return starts
+
+
+def run_starts(fit_start, args, starts, n_workers=1, target_chisqr=None, time_limit=None):
+    """Solutions (chisqr, best_values, nfev) of `fit_start(*args, start)` for starts, in the order they finished.
+
+    Stops early once a solution reaches target_chisqr, or time_limit seconds passed, but only
+    after at least one start finished. With more than one worker starts run on the process pool
+    of `starts_executor`, `fit_start` and its arguments must be picklable then. When it stops,
+    starts not started yet are cancelled, and it waits for the running ones, so that none of
+    them keeps a worker busy once it returns. Starts run one after another in this process
+    with a single worker or start, or after `disable_parallel_starts`.
+    """
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    solutions = []
+
+    def should_stop():
+        if target_chisqr is not None and min(chisqr for chisqr, _, _ in solutions) <= target_chisqr:
+            return True
+        return deadline is not None and time.monotonic() >= deadline
+
+    if n_workers == 1 or len(starts) <= 1 or not parallel_starts:
+        for start in starts:
+            solutions.append(fit_start(*args, start))
+            if should_stop():
+                break
+        return solutions
+
+    executor = starts_executor(n_workers)
+    pending = {executor.submit(fit_start, *args, start) for start in starts}
+    try:
+        while pending:
+            timeout = None if deadline is None or not solutions else max(0.0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            solutions.extend(future.result() for future in done)
+            if not done or should_stop():
+                break
+    finally:
+        for future in pending:
+            future.cancel()
+        wait(pending)
+    return solutions
+
+
+class MultistartFitResult:
+    """Best of the local fits of a multistart, with the attributes of lmfit's ModelResult that deconvolution uses.
+
+    `result` is the fit polished from the best solution, its report is followed by the spread
+    of the solutions of all starts.
+    """
+
+    def __init__(self, result, solutions, n_starts):
+        self.result = result
+        self.solutions = sorted(solutions, key=lambda solution: solution[0])
+        self.params = result.params
+        self.best_values = result.best_values
+        self.best_fit = result.best_fit
+        self.chisqr = result.chisqr
+        self.nfev = result.nfev + sum(nfev for _, _, nfev in solutions)
+        self.n_starts = len(solutions)
+        self.n_planned_starts = n_starts
+
+    def n_same_minimum(self):
+        """Number of starts, whose chi-square is within `SAME_MINIMUM_TOLERANCE` of the best one."""
+        best = self.solutions[0][0]
+        return sum(1 for chisqr, _, _ in self.solutions if chisqr <= best * (1.0 + SAME_MINIMUM_TOLERANCE))
+
+    def spread(self):
+        """(min, max, standard deviation) of the best values of every varying parameter over all starts."""
+        names = [name for name, param in self.params.items() if param.vary and not param.expr]
+        spread = {}
+        for name in names:
+            values = np.array([best_values[name] for _, best_values, _ in self.solutions])
+            spread[name] = (float(np.min(values)), float(np.max(values)), float(np.std(values)))
+        return spread
+
+    def fit_report(self):
+        chisqrs = np.array([chisqr for chisqr, _, _ in self.solutions])
+        lines = ["[[Multistart]]",
+                 f"    starts finished:   {self.n_starts} of {self.n_planned_starts}",
+                 f"    chi-square:        best {chisqrs[0]:.7g}, median {np.median(chisqrs):.7g}, "
+                 f"worst {chisqrs[-1]:.7g}",
+                 f"    same minimum:      {self.n_same_minimum()} of {self.n_starts} starts",
+                 "[[Spread of best values over starts]]"]
+        for name, (low, high, std) in self.spread().items():
+            lines.append(f"    {name + ':':<24}{low:.7g} to {high:.7g} (std {std:.7g})")
+        return self.result.fit_report() + "\n" + "\n".join(lines)
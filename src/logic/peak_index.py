@@ -0,0 +1,57 @@
+import os.path as path_utils
+import threading
+
+import pandas as pd
+
+AGGREGATE_PEAKS_FILE_NAME = "all.peaks"
+
+_peak_indexes = {}
+_peak_indexes_lock = threading.Lock()
+
+
+class PeakIndex:
+    """Peaks of all files of an experiment, kept in an append-only all.peaks file.
+
+    The file is read once, when the index is opened, to learn which signal files it already
+    holds. Afterwards, checking a file is a set lookup, and adding one appends its peaks
+    only. Writers in the same process are serialized by a lock.
+    """
+
+    def __init__(self, output_dir, separator):
+        self.path = path_utils.join(output_dir, AGGREGATE_PEAKS_FILE_NAME)
+        self.separator = separator
+        self.lock = threading.Lock()
+        self.files = self.read_files()
+
+    def read_files(self):
+        if not path_utils.exists(self.path):
+            return set()
+        return set(pd.read_csv(filepath_or_buffer=self.path, sep=self.separator, usecols=["File"])["File"])
+
+    def __contains__(self, signal_file_abs_path):
+        with self.lock:
+            return signal_file_abs_path in self.files
+
+    def add(self, signal_file_abs_path, peaks):
+        """Appends peaks of a signal file, unless the index already holds it. Returns whether it did."""
+        with self.lock:
+            if not path_utils.exists(self.path):
+                # Removed since it was read, e.g. a rerun of the experiment
+                self.files = set()
+            if signal_file_abs_path in self.files:
+                return False
+            header = len(self.files) == 0
+            pd.DataFrame(peaks).to_csv(path_or_buf=self.path, sep=self.separator, index=False,
+                                       mode="w" if header else "a",
+                                       header=header)
+            self.files.add(signal_file_abs_path)
+            return True
+
+
+def open_peak_index(output_dir, separator):
+    """Returns the index of all.peaks in `output_dir`, shared by all callers in this process."""
+    key = (path_utils.abspath(output_dir), separator)
+    with _peak_indexes_lock:
+        if key not in _peak_indexes:
+            _peak_indexes[key] = PeakIndex(output_dir, separator)
+        return _peak_indexes[key]
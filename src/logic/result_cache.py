@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import os.path as path_utils
+import shutil
+import uuid
+
+# Bump when fits of the same inputs change, so that older entries are not used any more
+CACHE_VERSION = 2
+
+# Properties, which change how files are scheduled, but not their fits. plot_mode decides whether
+# a pdf is written as well, which is a part of the key on its own, see `ResultCache.key`
+SCHEDULING_PROPERTIES = ("n_workers", "n_renderers", "plot_mode", "cache", "cache_dir", "cache_max_size_mb")
+
+STATUS_FILE_NAME = "status.json"
+
+# Eviction frees entries down to this fraction of the size limit, so that the cache is not
+# scanned again on the very next store
+EVICTION_TARGET = 0.9
+
+
+def default_cache_dir():
+    return path_utils.join(path_utils.expanduser("~"), ".cache", "deconvolution")
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(2 ** 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def normalized_properties(properties):
+    """Properties with surrounding whitespace stripped, without `SCHEDULING_PROPERTIES`, sorted by name."""
+    normalized = {str(name).strip(): str(value).strip() for name, value in properties.items()}
+    return dict(sorted((name, value) for name, value in normalized.items() if name not in SCHEDULING_PROPERTIES))
+
+
+class ResultCache:
+    """Fit results on disk, keyed by signal file contents and normalized fit properties.
+
+    An entry is a directory with the output files of a fit and the status of
+    `Deconvolver.deconvolve_single_file`. Output files and peaks name the signal file, so its
+    path is a part of the key as well. Entries are evicted least recently used first, once all
+    take more than max_size bytes, down to `EVICTION_TARGET` of it.
+
+    The total size is scanned once, on the first store, and then kept up to date by stores and
+    evictions of this instance. Entries stored by other processes are only counted once the
+    limit is crossed, and the cache is scanned again.
+    """
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.total_size = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, signal_file_abs_path, properties, plot_peaks, initial_values=None):
+        """Key of the fit of a signal file, `plot_peaks` tells whether its pdf is written."""
+        fields = {"version": CACHE_VERSION,
+                  "signal": file_hash(signal_file_abs_path),
+                  "file": path_utils.abspath(signal_file_abs_path),
+                  "properties": normalized_properties(properties),
+                  "plot_peaks": plot_peaks,
+                  "initial_values": initial_values}
+        return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def entry_dir(self, key):
+        return path_utils.join(self.cache_dir, key[:2], key)
+
+    def load(self, key, output_dir):
+        """Copies the output files of an entry into output_dir and returns its status, or None if there is none."""
+        entry_dir = self.entry_dir(key)
+        status_file = path_utils.join(entry_dir, STATUS_FILE_NAME)
+        try:
+            with open(status_file, "r") as file:
+                status = json.load(file)
+            for name in status["files"]:
+                shutil.copyfile(path_utils.join(entry_dir, name), path_utils.join(output_dir, name))
+            # Modification time of the status file is the last use of an entry
+            os.utime(status_file)
+        except (OSError, ValueError, KeyError):
+            return None
+        return {"exit_code": 0,
+                "output_dir": output_dir,
+                "peaks": status["peaks"],
+                "best_values": status["best_values"],
+                "cached": True}
+
+    def store(self, key, output_dir, file_names, status):
+        """Copies the output files of a successful fit into an entry, and evicts entries over the size limit."""
+        entry_dir = self.entry_dir(key)
+        tmp_dir = path_utils.join(self.cache_dir, f"tmp_{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        try:
+            for name in file_names:
+                shutil.copyfile(path_utils.join(output_dir, name), path_utils.join(tmp_dir, name))
+            with open(path_utils.join(tmp_dir, STATUS_FILE_NAME), "w") as file:
+                json.dump({"files": list(file_names),
+                           "peaks": status["peaks"],
+                           "best_values": status["best_values"]}, file)
+            if self.total_size is None:
+                self.total_size = self.size()
+            os.makedirs(path_utils.dirname(entry_dir), exist_ok=True)
+            replaced_size = directory_size(entry_dir)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.total_size = self.total_size + directory_size(entry_dir) - replaced_size
+        if self.total_size > self.max_size:
+            self.evict(keep=key)
+
+    def entries(self):
+        """(last use, size, directory) of every entry."""
+        entries = []
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = path_utils.join(self.cache_dir, prefix)
+            if len(prefix) != 2 or not path_utils.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = path_utils.join(prefix_dir, key)
+                try:
+                    last_use = os.stat(path_utils.join(entry_dir, STATUS_FILE_NAME)).st_mtime
+                except OSError:
+                    continue
+                size = directory_size(entry_dir)
+                entries.append((last_use, size, entry_dir))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        keep_dir = None if keep is None else self.entry_dir(keep)
+        for _, size, entry_dir in entries:
+            if total <= EVICTION_TARGET * self.max_size:
+                break
+            if entry_dir == keep_dir:
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total = total - size
+        self.total_size = total
+
+
+def directory_size(directory):
+    """Bytes taken by the files of a directory, 0 if it does not exist."""
+    try:
+        return sum(entry.stat().st_size for entry in os.scandir(directory))
+    except OSError:
+        return 0
@@ -0,0 +1,73 @@
+import re
+from itertools import islice
+
+import numpy as np
+import pandas
+
+# Plain separators np.loadtxt can split on, None stands for any whitespace
+FAST_SEPARATORS = {
+    ",": lambda line: line.split(","),
+    "\t": lambda line: line.split("\t"),
+    None: lambda line: line.split()
+}
+
+DETECTION_LINES = 20
+
+
+class SignalReader:
+    """Reads two column, numeric signal files into contiguous float64 arrays.
+
+    The `input_format_separator` property is a regular expression, which forces pandas into its
+    slow, pure Python parser. The reader checks on the first file it reads, whether the
+    expression only ever matches a plain separator, and then parses all files with np.loadtxt.
+    Files, which can not be parsed that way, fall back to the regular expression.
+    """
+
+    def __init__(self, separator, header):
+        self.separator = separator
+        self.header = header
+        self.detected = False
+        self.fast_separator = None
+        self.fast = False
+
+    def read(self, signal_file_abs_path):
+        if not self.detected:
+            self.detect(signal_file_abs_path)
+        if self.fast:
+            try:
+                data = np.loadtxt(signal_file_abs_path,
+                                  delimiter=self.fast_separator,
+                                  skiprows=1 if self.header else 0,
+                                  comments=None,
+                                  dtype=np.float64,
+                                  ndmin=2)
+                if data.shape[1] == 2:
+                    return np.ascontiguousarray(data[:, 0]), np.ascontiguousarray(data[:, 1])
+            except ValueError:
+                pass
+        return self.read_with_regex(signal_file_abs_path)
+
+    def read_with_regex(self, signal_file_abs_path):
+        data = pandas.read_csv(filepath_or_buffer=signal_file_abs_path,
+                               header={True: 0, False: None}[self.header],
+                               names=["#Wave", "#Intensity"],
+                               sep=self.separator,
+                               engine="python")
+        return data["#Wave"].to_numpy(dtype=np.float64), data["#Intensity"].to_numpy(dtype=np.float64)
+
+    def detect(self, signal_file_abs_path):
+        with open(signal_file_abs_path, "r") as file:
+            lines = [line.rstrip("\r\n") for line in islice(file, DETECTION_LINES + 1)]
+        lines = [line for line in lines[1 if self.header else 0:] if len(line.strip()) > 0]
+        self.detected = True
+        self.fast = False
+        if len(lines) == 0:
+            return
+        # Like pandas, single character separators are not regular expressions
+        pattern = re.compile(re.escape(self.separator) if len(self.separator) == 1 else self.separator)
+        fields = [pattern.split(line) for line in lines]
+        for separator, split in FAST_SEPARATORS.items():
+            if all(len(f) == 2 and f == split(line) for f, line in zip(fields, lines)):
+                self.fast_separator = separator
+                self.fast = True
+                return
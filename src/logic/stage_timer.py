@@ -0,0 +1,71 @@
+import json
+import time
+from contextlib import contextmanager
+
+TIMINGS_FILE_NAME = "timings.jsonl"
+
+
+class StageTimer:
+    """Wall and CPU seconds of named stages, a stage timed more than once adds up."""
+
+    def __init__(self, timings=None):
+        self.timings = {name: dict(timing) for name, timing in (timings or {}).items()}
+
+    @contextmanager
+    def stage(self, name):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall_start, time.process_time() - cpu_start)
+
+    def add(self, name, wall, cpu):
+        timing = self.timings.setdefault(name, {"wall": 0.0, "cpu": 0.0})
+        timing["wall"] = timing["wall"] + wall
+        timing["cpu"] = timing["cpu"] + cpu
+
+    def as_dict(self):
+        return {name: dict(timing) for name, timing in self.timings.items()}
+
+
+def fit_statistics(result):
+    """Number of function evaluations, and of jacobian evaluations, iterations, windows and starts if reported."""
+    statistics = {"nfev": int(result.nfev)}
+    for name in ("njev", "nit", "n_windows", "n_starts"):
+        value = getattr(result, name, None)
+        if value is not None:
+            statistics[name] = int(value)
+    return statistics
+
+
+def append_timings(path, record):
+    with open(path, "a") as file:
+        file.write(json.dumps(record) + "\n")
+
+
+def total_timings(statuses):
+    """Timings of statuses summed up by stage, with the number of files and of function evaluations."""
+    totals = StageTimer()
+    n_files, nfev = 0, 0
+    for status in statuses:
+        timings = status.get("timings")
+        if timings is None:
+            continue
+        n_files = n_files + 1
+        nfev = nfev + (status.get("fit_statistics") or {}).get("nfev", 0)
+        for name, timing in timings.items():
+            totals.add(name, timing["wall"], timing["cpu"])
+    return {"n_files": n_files, "nfev": nfev, "timings": totals.as_dict()}
+
+
+def format_total_timings(totals):
+    """One line per stage, slowest first, with its share of all wall time."""
+    timings = totals["timings"]
+    total_wall = sum(timing["wall"] for timing in timings.values())
+    lines = ["timings of {n} file(s), {nfev} function evaluations:".format(n=totals["n_files"],
+                                                                          nfev=totals["nfev"])]
+    for name, timing in sorted(timings.items(), key=lambda item: -item[1]["wall"]):
+        share = 100.0 * timing["wall"] / total_wall if total_wall > 0 else 0.0
+        lines.append("{name:<12}{wall:>10.3f} s wall{cpu:>10.3f} s cpu{share:>7.1f}%".format(
+            name=name, wall=timing["wall"], cpu=timing["cpu"], share=share))
+    return "\n".join(lines)
@@ -0,0 +1,155 @@
+import numpy as np
+
+WINDOWING_MODES = ("none", "bounds", "auto")
+
+# Scale of the median absolute deviation, which makes it estimate the standard deviation of normal noise
+MAD_SCALE = 1.4826
+
+
+def peak_prefixes(n_gauss, n_lorentz):
+    """Prefixes of the peak parameters, in the order of `Deconvolver.evaluate_components`."""
+    return [f"gauss_peak{i + 1}_" for i in range(n_gauss)] + [f"lorentz_peak{i + 1}_" for i in range(n_lorentz)]
+
+
+def parameter_range(param):
+    """Lowest and highest value a parameter can take in a fit."""
+    if param.vary and not param.expr:
+        return param.min, param.max
+    return param.value, param.value
+
+
+def bound_windows(params, prefixes, margin):
+    """Windows of peaks, whose center bounds widened by `margin` times their largest sigma overlap.
+
+    Returns (x_min, x_max, prefixes) tuples sorted by x_min, see `partition`.
+    """
+    intervals = []
+    for prefix in prefixes:
+        center_min, center_max = parameter_range(params[prefix + "center"])
+        sigma_max = parameter_range(params[prefix + "sigma"])[1]
+        intervals.append((center_min - margin * sigma_max, center_max + margin * sigma_max, [prefix]))
+    return merge_intervals(intervals)
+
+
+def auto_windows(x, signal, params, prefixes, threshold, min_gap):
+    """Windows of peaks, split at gaps of the signal where it stays at its baseline.
+
+    Points above the median by more than `threshold` times the noise (scaled median absolute
+    deviation) are signal, and runs of fewer than `min_gap` points between them do not split.
+    Every peak goes to the runs of signal its center bounds overlap, or the closest one, and runs
+    sharing a peak are merged. Returns (x_min, x_max, prefixes) tuples sorted by x_min.
+    """
+    order = np.argsort(x, kind="stable")
+    xs, ys = np.asarray(x, dtype=np.float64)[order], np.asarray(signal, dtype=np.float64)[order]
+    baseline = np.median(ys)
+    noise = MAD_SCALE * np.median(np.abs(ys - baseline))
+    runs = signal_runs(ys > baseline + threshold * noise, min_gap)
+    if len(runs) == 0:
+        return merge_intervals([(-np.inf, np.inf, list(prefixes))])
+
+    segments = [(xs[start], xs[stop - 1]) for start, stop in runs]
+    intervals = []
+    for prefix in prefixes:
+        center_min, center_max = parameter_range(params[prefix + "center"])
+        overlapping = [(lo, hi) for lo, hi in segments if lo <= center_max and center_min <= hi]
+        if len(overlapping) == 0:
+            overlapping = [min(segments, key=lambda s: max(s[0] - center_max, center_min - s[1]))]
+        intervals.append((min(lo for lo, _ in overlapping), max(hi for _, hi in overlapping), [prefix]))
+    return merge_intervals(intervals)
+
+
+def signal_runs(is_signal, min_gap):
+    """(start, stop) indices of runs of True, which are joined across fewer than min_gap False values."""
+    edges = np.diff(np.concatenate([[0], is_signal.astype(np.int8), [0]]))
+    starts, stops = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    runs = []
+    for start, stop in zip(starts, stops):
+        if runs and start - runs[-1][1] < min_gap:
+            runs[-1] = (runs[-1][0], stop)
+        else:
+            runs.append((start, stop))
+    return runs
+
+
+def merge_intervals(intervals):
+    """Merges overlapping (x_min, x_max, prefixes) intervals, keeping prefixes in their original order."""
+    merged = []
+    for lo, hi, prefixes in sorted(intervals, key=lambda interval: interval[0]):
+        if merged and lo <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi), merged[-1][2] + prefixes)
+        else:
+            merged.append((lo, hi, list(prefixes)))
+    order = {prefix: i for i, prefix in enumerate(p for _, _, prefixes in intervals for p in prefixes)}
+    return [(lo, hi, sorted(prefixes, key=order.get)) for lo, hi, prefixes in merged]
+
+
+def partition(x, windows):
+    """Index of the window of every point, the x axis is cut half way between neighbouring windows."""
+    cuts = np.array([(windows[i][1] + windows[i + 1][0]) / 2 for i in range(len(windows) - 1)])
+    return np.searchsorted(cuts, x, side="right")
+
+
+def subset_params(params, prefixes):
+    """Copy of the parameters whose names start with one of the prefixes."""
+    subset = params.copy()
+    for name in list(subset):
+        if not name.startswith(tuple(prefixes)):
+            del subset[name]
+    return subset
+
+
+class WindowedFitResult:
+    """Fits of windows stitched together, with the attributes of lmfit's ModelResult that deconvolution uses."""
+
+    def __init__(self, model, params, x, windows, results):
+        self.windows = windows
+        self.results = results
+        self.params = params.copy()
+        for result in results:
+            for name, param in result.params.items():
+                self.params[name].set(value=param.value)
+                self.params[name].stderr = param.stderr
+        self.best_values = self.params.valuesdict()
+        self.best_fit = model.eval(params=self.params, x=x)
+        self.nfev = sum(result.nfev for result in results)
+        self.njev = self.total("njev")
+        self.nit = self.total("nit")
+        self.n_windows = len(windows)
+
+    def total(self, name):
+        values = [getattr(result, name, None) for result in self.results]
+        return None if any(value is None for value in values) else sum(values)
+
+    def fit_report(self):
+        reports = []
+        for i, ((x_min, x_max, prefixes), result) in enumerate(zip(self.windows, self.results)):
+            reports.append("[[Window {n} of {total}: {x_min} to {x_max}, peaks: {peaks}]]\n{report}".format(
+                n=i + 1, total=len(self.windows), x_min=x_min, x_max=x_max,
+                peaks=", ".join(prefix.rstrip("_") for prefix in prefixes), report=result.fit_report()))
+        return "\n".join(reports)
+
+
+def fit_windows(model, params, x, signal, windows, background_prefix="bkg_", **fit_kwargs):
+    """Fits the peaks of every window to the signal in its part of the x axis, see `partition`.
+
+    `model` is the composite model of a background and all peaks, its components are fitted
+    separately for every window, with the background held at its value.
+    """
+    x = np.asarray(x)
+    signal = np.asarray(signal)
+    window_index = partition(x, windows)
+    components = {component.prefix: component for component in model.components}
+    results = []
+    for i, (_, _, prefixes) in enumerate(windows):
+        in_window = window_index == i
+        if not np.any(in_window):
+            raise ValueError("No points of the signal in the window of peaks {peaks}".format(
+                peaks=", ".join(prefix.rstrip("_") for prefix in prefixes)))
+        window_model = components[background_prefix]
+        for prefix in prefixes:
+            window_model = window_model + components[prefix]
+        window_params = subset_params(params, [background_prefix, *prefixes])
+        window_params[background_prefix + "c"].set(vary=False)
+        results.append(window_model.fit(data=signal[in_window], x=x[in_window], params=window_params,
+                                        **fit_kwargs))
+    return WindowedFitResult(model, params, x, windows, results)
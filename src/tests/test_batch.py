@@ -0,0 +1,44 @@
+import os.path as path_utils
+import shutil
+import tempfile
+import unittest
+
+from src.logic.batch import find_files, run_items
+
+
+def square(x, offset):
+    if x < 0:
+        raise ValueError(f"negative {x}")
+    return x * x + offset
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for name in ["b.TSV", "a.tsv", "c.txt"]:
+            with open(path_utils.join(self.tmp_dir, name), "w") as file:
+                file.write("1\t2\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_find_files(self):
+        def paths(*names):
+            return [path_utils.join(self.tmp_dir, name) for name in names]
+
+        self.assertEqual(paths("a.tsv", "b.TSV", "c.txt"), find_files([self.tmp_dir]))
+        self.assertEqual(paths("a.tsv"), find_files([self.tmp_dir], "*.tsv"))
+        self.assertEqual(paths("a.tsv", "b.TSV"), find_files([self.tmp_dir], extensions=(".tsv",)))
+        self.assertEqual(paths("c.txt", "a.tsv"), find_files(paths("c.txt") + [path_utils.join(self.tmp_dir, "a*")]))
+
+    def test_run_items(self):
+        for n_workers in [1, 2]:
+            statuses = {i: status for i, _, status in run_items(square, [1, -2, 3], (1,), n_workers, key="square")}
+            self.assertEqual({"exit_code": 0, "square": 2, "error_message": None}, statuses[0])
+            self.assertEqual({"exit_code": 1, "square": None, "error_message": "negative -2\n"}, statuses[1])
+            self.assertEqual(10, statuses[2]["square"])
+
+
+if __name__ == '__main__':
+    unittest.main()
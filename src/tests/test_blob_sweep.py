@@ -0,0 +1,102 @@
+import os
+import os.path as path_utils
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from click.testing import CliRunner
+from skimage import feature
+
+from src.logic.blob_sweep import ScaleSpaceCache, sweep_blob_counts, sweep_blobs
+from src.logic.count_blobs import load_image, log_sigma_list
+
+SAMPLE_DATA_DIR = path_utils.join(path_utils.dirname(path_utils.realpath(__file__)),
+                                  "..", "..", "sample_data", "count_blobs")
+
+
+class BlobSweepTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.image = load_image(path_utils.join(SAMPLE_DATA_DIR, "SEM_1.jpg"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_same_counts_as_blob_log(self):
+        boxes = [(0, -1, 0, -1), (50, 200, 40, 250), (0, 90, 200, -1)]
+        thresholds = [0.01, 0.05, 0.1]
+        table = sweep_blobs(self.image, [(1, 2), (2, 6)], thresholds, boxes)
+        self.assertEqual(2 * len(thresholds) * len(boxes), len(table))
+        for row in table.itertuples():
+            blobs = feature.blob_log(self.image, min_sigma=row.min_sigma, max_sigma=row.max_sigma,
+                                     threshold=row.threshold)
+            inside = ((row.box_min_x <= blobs[:, 1]) & (blobs[:, 1] < row.box_max_x)
+                      & (row.box_min_y <= blobs[:, 0]) & (blobs[:, 0] < row.box_max_y))
+            self.assertEqual(np.count_nonzero(inside), row.count)
+
+    def test_scale_space_cache(self):
+        cache_dir = path_utils.join(self.tmp_dir, "cache")
+        cache = ScaleSpaceCache(cache_dir)
+        sweep_blobs(self.image, [(1, 2)], [0.05, 0.1], [(0, -1, 0, -1)], cache)
+        sweep_blobs(self.image, [(1, 2), (1, 3)], [0.2], [(0, -1, 0, -1)], cache)
+        self.assertEqual((1, 2), (cache.hits, cache.misses))
+        self.assertEqual(2, len(os.listdir(cache_dir)))
+
+        # Another run memory-maps the saved scale spaces
+        other_cache = ScaleSpaceCache(cache_dir)
+        sigma_list = log_sigma_list(1, 3)
+        image_cube = other_cache.scale_space(self.image, sigma_list)
+        self.assertEqual((1, 0), (other_cache.hits, other_cache.misses))
+        np.testing.assert_array_equal(cache.scale_space(self.image, sigma_list), image_cube)
+
+    def test_scale_space_cache_memory(self):
+        sigma_lists = [log_sigma_list(1, 2), log_sigma_list(1, 3), log_sigma_list(2, 3)]
+        one = ScaleSpaceCache().scale_space(self.image, sigma_lists[0]).nbytes
+        cache = ScaleSpaceCache(max_memory=2 * one)
+        for sigma_list in sigma_lists:
+            cache.scale_space(self.image, sigma_list)
+        # The least recently used scale space is dropped, the latest one is kept even if it is too large
+        self.assertEqual(2, len(cache.scale_spaces))
+        self.assertLessEqual(cache.memory(), 2 * one)
+        cache.scale_space(self.image, sigma_lists[0])
+        self.assertEqual((0, 4), (cache.hits, cache.misses))
+        cache = ScaleSpaceCache(max_memory=0)
+        cache.scale_space(self.image, sigma_lists[0])
+        self.assertEqual(1, len(cache.scale_spaces))
+
+        # Saved scale spaces are memory-mapped, and do not count
+        cache = ScaleSpaceCache(path_utils.join(self.tmp_dir, "cache"), max_memory=0)
+        for sigma_list in sigma_lists:
+            self.assertIsInstance(cache.scale_space(self.image, sigma_list), np.memmap)
+        self.assertEqual(3, len(cache.scale_spaces))
+        self.assertEqual(0, cache.memory())
+
+    def test_sweep_blob_counts_command(self):
+        output_path = path_utils.join(self.tmp_dir, "sweep.csv")
+        result = CliRunner().invoke(sweep_blob_counts, [
+            "--input-path", path_utils.join(SAMPLE_DATA_DIR, "SEM_1.jpg"),
+            "--input-path", path_utils.join(SAMPLE_DATA_DIR, "SEM_2.jpg"),
+            "--output-path", output_path,
+            "--log-threshold", "0.05",
+            "--log-threshold", "0.1",
+            "--box", "0,-1,0,-1",
+            "--box", "50,200,40,250"
+        ])
+        self.assertEqual(0, result.exit_code, result.output)
+        table = pd.read_csv(output_path)
+        self.assertEqual(8, len(table))
+        self.assertEqual(["image", "min_sigma", "max_sigma", "threshold", "box_min_x", "box_max_x", "box_min_y",
+                          "box_max_y", "count"], list(table.columns))
+        self.assertTrue((table["box_max_x"] > 0).all())
+
+    def test_invalid_box(self):
+        result = CliRunner().invoke(sweep_blob_counts, ["--input-path", path_utils.join(SAMPLE_DATA_DIR, "SEM_1.jpg"),
+                                                        "--box", "0,10,0"])
+        self.assertEqual(2, result.exit_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os.path as path_utils
+import unittest
+
+import numpy as np
+from click.testing import CliRunner
+from skimage import color, feature, io
+
+from src.logic.count_blobs import count_blobs, detect_blobs, prune_blobs
+
+SAMPLE_DATA_DIR = path_utils.join(path_utils.dirname(path_utils.realpath(__file__)),
+                                  "..", "..", "sample_data", "count_blobs")
+
+
+def load_image(name):
+    return color.rgb2gray(io.imread(path_utils.join(SAMPLE_DATA_DIR, name)))
+
+
+def blob_log_in_box(image, box_min_x, box_max_x, box_min_y, box_max_y, min_sigma, max_sigma, threshold):
+    # What count_blobs used to do, detect blobs in the whole image and filter them to the box
+    blobs = feature.blob_log(image, min_sigma=min_sigma, max_sigma=max_sigma, threshold=threshold)
+    blobs[:, 2] = blobs[:, 2] * (2 ** 0.5)
+    inside = ((box_min_x <= blobs[:, 1]) & (blobs[:, 1] < box_max_x)
+              & (box_min_y <= blobs[:, 0]) & (blobs[:, 0] < box_max_y))
+    return blobs[inside]
+
+
+def sorted_rows(blobs):
+    return blobs[np.lexsort(blobs.T[::-1])]
+
+
+class DetectBlobsTest(unittest.TestCase):
+
+    def test_whole_image_same_as_blob_log(self):
+        for name in ["SEM_1.jpg", "SEM_2.jpg"]:
+            image = load_image(name)
+            box = (0, image.shape[1], 0, image.shape[0])
+            for min_sigma, max_sigma, threshold in [(1, 2, 0.01), (1, 4, 0.05), (2, 6, 0.01), (0.5, 1.5, 0.1)]:
+                expected = sorted_rows(blob_log_in_box(image, *box, min_sigma, max_sigma, threshold))
+                for tile_size in [1024, 64, 37]:
+                    blobs = detect_blobs(image, *box, min_sigma, max_sigma, threshold, tile_size=tile_size,
+                                         n_workers=2)
+                    np.testing.assert_array_equal(expected, sorted_rows(blobs))
+
+    def test_box_same_as_blob_log(self):
+        image = load_image("SEM_1.jpg")
+        # Pruning blob (101, 72) depends on maxima outside of the first box
+        boxes = [(50, 200, 30, 180)]
+        rng = np.random.default_rng(0)
+        for _ in range(10):
+            min_x, min_y = rng.integers(0, image.shape[1] - 20), rng.integers(0, image.shape[0] - 20)
+            max_x, max_y = rng.integers(min_x + 10, image.shape[1]), rng.integers(min_y + 10, image.shape[0])
+            boxes.append((min_x, max_x, min_y, max_y))
+        for box in boxes:
+            expected = sorted_rows(blob_log_in_box(image, *box, 1, 2, 0.01))
+            for tile_size in [1024, 64]:
+                blobs = detect_blobs(image, *box, 1, 2, 0.01, tile_size=tile_size, n_workers=2)
+                np.testing.assert_array_equal(expected, sorted_rows(blobs))
+
+    def test_tiles_do_not_change_blobs_in_box(self):
+        image = load_image("SEM_1.jpg")
+        box = (50, 200, 40, 250)
+        expected = sorted_rows(detect_blobs(image, *box, 1, 2, 0.05, tile_size=1024, n_workers=1))
+        self.assertGreater(len(expected), 0)
+        for tile_size in [100, 64, 17]:
+            blobs = detect_blobs(image, *box, 1, 2, 0.05, tile_size=tile_size, n_workers=3)
+            np.testing.assert_array_equal(expected, sorted_rows(blobs))
+
+    def test_box_without_blobs(self):
+        image = np.zeros((40, 50))
+        self.assertEqual((0, 3), detect_blobs(image, 10, 20, 10, 20, 1, 2, 0.01).shape)
+
+    def test_prune_blobs(self):
+        blobs = np.array([[10.0, 10.0, 2.0], [10.0, 11.0, 1.5], [30.0, 30.0, 1.0], [30.0, 36.0, 1.0]])
+        # The smaller of the overlapping pair is pruned, blobs farther apart are kept
+        np.testing.assert_array_equal([[10.0, 10.0, 2.0], [30.0, 30.0, 1.0], [30.0, 36.0, 1.0]],
+                                      sorted_rows(prune_blobs(blobs, 0.5)))
+
+    def test_count_blobs(self):
+        image = load_image("SEM_2.jpg")
+        expected = blob_log_in_box(image, 0, image.shape[1], 0, image.shape[0], 1, 2, 0.01)
+        result = CliRunner().invoke(count_blobs, ["--input-path", path_utils.join(SAMPLE_DATA_DIR, "SEM_2.jpg"),
+                                                  "--tile-size", "100",
+                                                  "--skip-plotting-results",
+                                                  "--skip-saving-results"])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn(f"Total blobs found in box: {len(expected)}", result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
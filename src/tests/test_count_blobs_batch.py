@@ -0,0 +1,76 @@
+import json
+import os
+import os.path as path_utils
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+from click.testing import CliRunner
+
+from src.logic.count_blobs import detect_blobs, load_image
+from src.logic.count_blobs_batch import count_blobs_batch, find_images
+
+SAMPLE_DATA_DIR = path_utils.join(path_utils.dirname(path_utils.realpath(__file__)),
+                                  "..", "..", "sample_data", "count_blobs")
+
+
+class CountBlobsBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for name in os.listdir(SAMPLE_DATA_DIR):
+            shutil.copy(path_utils.join(SAMPLE_DATA_DIR, name), self.tmp_dir)
+        with open(path_utils.join(self.tmp_dir, "notes.txt"), "w") as file:
+            file.write("not an image\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_find_images(self):
+        expected = [path_utils.join(self.tmp_dir, name) for name in ["SEM_1.jpg", "SEM_2.jpg"]]
+        self.assertEqual(expected, find_images([self.tmp_dir]))
+        self.assertEqual(expected[1:], find_images([path_utils.join(self.tmp_dir, "*_2.jpg")]))
+
+    def test_count_blobs_batch_command(self):
+        output_dir = path_utils.join(self.tmp_dir, "experiment")
+        result = CliRunner().invoke(count_blobs_batch, [
+            "--input", self.tmp_dir,
+            "--output-dir", output_dir,
+            "--box-min-x", "50",
+            "--box-max-x", "200",
+            "--n-workers", "2"
+        ])
+        self.assertEqual(0, result.exit_code, result.output)
+        records = [json.loads(line) for line in result.stdout.splitlines()]
+        self.assertEqual(0, records[-1]["n_failed"])
+        self.assertEqual(["blobs.csv", "images.csv"], sorted(os.listdir(output_dir)))
+
+        images = pd.read_csv(path_utils.join(output_dir, "images.csv"))
+        blobs = pd.read_csv(path_utils.join(output_dir, "blobs.csv"))
+        for row in images.itertuples():
+            image = load_image(row.image)
+            expected = detect_blobs(image, 50, 200, 0, image.shape[0], 1, 2, 0.01)
+            self.assertEqual(len(expected), row.count)
+            self.assertEqual(image.shape[0], row.box_max_y)
+            self.assertEqual(len(expected), len(blobs[blobs["image"] == row.image]))
+            self.assertGreaterEqual(row.total_seconds, row.detect_seconds)
+
+    def test_count_blobs_batch_with_plots_and_failures(self):
+        output_dir = path_utils.join(self.tmp_dir, "experiment")
+        result = CliRunner().invoke(count_blobs_batch, [
+            "--input", path_utils.join(self.tmp_dir, "SEM_1.jpg"),
+            "--input", path_utils.join(self.tmp_dir, "notes.txt"),
+            "--output-dir", output_dir,
+            "--n-workers", "1",
+            "--plot-results"
+        ])
+        self.assertEqual(1, result.exit_code, result.output)
+        self.assertEqual(["SEM_1.png", "blobs.csv", "images.csv"], sorted(os.listdir(output_dir)))
+        images = pd.read_csv(path_utils.join(output_dir, "images.csv"))
+        self.assertEqual([0, 1], images["exit_code"].tolist())
+        self.assertTrue(pd.isna(images["count"][1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
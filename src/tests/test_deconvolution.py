@@ -1,5 +1,8 @@
 import unittest
 
+import lmfit
+import lmfit.lineshapes
+import numpy as np
 from jproperties import Properties
 
 from src.logic.deconvolution import Deconvolver
@@ -44,6 +47,33 @@ class DeconvolverTest(unittest.TestCase):
         for key in peaks.keys():
             self.assertEqual(1, len(peaks[key]))
 
+    def test_evaluate_components(self):
+        x = np.linspace(0.0, 10.0, 101)
+        best_values = {
+            "gauss_peak1_amplitude": 1.0, "gauss_peak1_center": 3.0, "gauss_peak1_sigma": 0.5,
+            "gauss_peak2_amplitude": 2.0, "gauss_peak2_center": 6.0, "gauss_peak2_sigma": 1.5,
+            "lorentz_peak1_amplitude": 3.0, "lorentz_peak1_center": 8.0, "lorentz_peak1_sigma": 0.0
+        }
+        components = self.d.evaluate_components(x, best_values, 2, 1)
+        self.assertEqual((3, len(x)), components.shape)
+        np.testing.assert_allclose(lmfit.lineshapes.gaussian(x, 2.0, 6.0, 1.5), components[1], rtol=1e-14)
+        np.testing.assert_allclose(lmfit.lineshapes.lorentzian(x, 3.0, 8.0, 0.0), components[2], rtol=1e-14)
+
+    def test_seed_params(self):
+        params = lmfit.Parameters()
+        params.add("a", value=0.0, min=0.0, max=10.0)
+        params.add("b", value=0.0, min=0.0, max=10.0)
+        params.add("c", value=1.0, vary=False)
+        params.add("d", value=0.0, min=0.0, max=10.0)
+        self.d.seed_params(params, {"a": 5.0, "b": 20.0, "c": 2.0})
+        self.assertEqual(5.0, params["a"].value)
+        self.assertEqual(10.0, params["b"].value)
+        self.assertEqual(1.0, params["c"].value)
+        self.assertEqual(0.0, params["d"].value)
+        self.d.seed_params(params, {"a": 5.0, "b": 10.0}, span=0.2)
+        self.assertEqual((4.0, 6.0), (params["a"].min, params["a"].max))
+        self.assertEqual((9.0, 10.0), (params["b"].min, params["b"].max))
+
     def test_optional_property_str(self):
         self.assertEqual(
             "default", self.d.optional_property_str(None, "default"))
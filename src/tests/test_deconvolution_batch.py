@@ -0,0 +1,251 @@
+import json
+import os
+import os.path as path_utils
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+from click.testing import CliRunner
+from jproperties import Properties
+
+from src.logic.deconvolution_batch import BatchDeconvolver, deconvolve
+from src.logic.fit_output import load_fit
+
+SAMPLE_DATA_DIR = path_utils.join(path_utils.dirname(path_utils.realpath(__file__)),
+                                  "..", "..", "sample_data", "deconvolution")
+
+
+class BatchDeconvolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filenames = []
+        for name in sorted(os.listdir(SAMPLE_DATA_DIR)):
+            if name.endswith(".dpt"):
+                shutil.copy(path_utils.join(SAMPLE_DATA_DIR, name), self.tmp_dir)
+                self.filenames.append(path_utils.join(self.tmp_dir, name))
+        p = Properties()
+        with open(path_utils.join(SAMPLE_DATA_DIR, "model.properties"), "rb") as file:
+            p.load(file, "utf-8")
+        self.properties = p.properties
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_checkpoint(self):
+        batch = BatchDeconvolver(filenames=self.filenames, experiment_label="experiment", properties={})
+        self.assertIsNone(batch.checkpoint)
+        batch.completed.update([1, 2])
+        self.assertIsNone(batch.checkpoint)
+        batch.completed.add(0)
+        self.assertEqual(2, batch.checkpoint)
+
+    def test_run_in_parallel(self):
+        self.properties["n_workers"] = "2"
+        batch = BatchDeconvolver(filenames=self.filenames, experiment_label="experiment",
+                                 properties=self.properties)
+        results = list(batch.run())
+        self.assertEqual(len(self.filenames), len(results))
+        for _, _, status in results:
+            self.assertEqual(0, status.get("exit_code"))
+        self.assertEqual(len(self.filenames) - 1, batch.checkpoint)
+        all_peaks = pd.read_csv(path_utils.join(self.tmp_dir, "experiment", "all.peaks"), sep="\t")
+        self.assertEqual(sorted(self.filenames), sorted(all_peaks["File"].unique()))
+        self.assertEqual(6 * len(self.filenames), len(all_peaks))
+
+    def test_run_resumes_after_pause(self):
+        self.properties["n_workers"] = "1"
+        batch = BatchDeconvolver(filenames=self.filenames, experiment_label="experiment",
+                                 properties=self.properties)
+        results = list(batch.run(is_current=lambda: len(batch.completed) < 2))
+        self.assertEqual([0, 1], [i for i, _, _ in results])
+        results = list(batch.run(first_index=batch.checkpoint + 1))
+        self.assertEqual(list(range(2, len(self.filenames))), [i for i, _, _ in results])
+
+    def test_resume_while_paused_run_finishes(self):
+        self.properties["n_workers"] = "2"
+        self.properties["method"] = "least_squares"
+        batch = BatchDeconvolver(filenames=self.filenames, experiment_label="experiment",
+                                 properties=self.properties, plot_peaks=False)
+        # Pause once the first file finishes, with more files still being fitted
+        paused = batch.run(is_current=lambda: len(batch.completed) < 1)
+        first = [next(paused)]
+        in_flight = set(batch.in_flight)
+        self.assertTrue(in_flight)
+        resumed = list(batch.run())
+        first.extend(paused)
+        self.assertEqual(in_flight, {i for i, _, _ in first[1:]})
+        # Every file is fitted exactly once, by one of the runs
+        self.assertEqual(sorted(range(len(self.filenames))), sorted(i for i, _, _ in first + resumed))
+        self.assertEqual(set(), batch.in_flight)
+        all_peaks = pd.read_csv(path_utils.join(self.tmp_dir, "experiment", "all.peaks"), sep="\t")
+        self.assertEqual(6 * len(self.filenames), len(all_peaks))
+
+    def test_initial_values(self):
+        batch = BatchDeconvolver(filenames=self.filenames, experiment_label="experiment",
+                                 properties={"warm_start": "previous"})
+        self.assertIsNone(batch.initial_values(0))
+        batch.complete(0, {"exit_code": 0, "best_values": {"a": 1.0}})
+        batch.complete(1, {"exit_code": 1})
+        batch.complete(3, {"exit_code": 0, "best_values": {"a": 4.0}})
+        self.assertEqual({"a": 1.0}, batch.initial_values(2))
+        self.assertEqual({"a": 4.0}, batch.initial_values(4))
+        batch.warm_start = "median"
+        batch.warm_start_window = 3
+        batch.complete(4, {"exit_code": 0, "best_values": {"a": 10.0}})
+        self.assertEqual({"a": 4.0}, batch.initial_values(2))
+
+    def test_run_with_warm_start(self):
+        self.properties["n_workers"] = "4"
+        self.properties["method"] = "least_squares"
+        self.properties["warm_start"] = "previous"
+        best_values = []
+        for label in ("first", "second"):
+            batch = BatchDeconvolver(filenames=self.filenames, experiment_label=label,
+                                     properties=self.properties, plot_peaks=False)
+            # Seeds come from the files before, which are fitted first
+            self.assertEqual(1, batch.n_workers)
+            results = list(batch.run())
+            self.assertEqual(list(range(len(self.filenames))), [i for i, _, _ in results])
+            for _, _, status in results:
+                self.assertEqual(0, status.get("exit_code"))
+            best_values.append(batch.best_values)
+        self.assertEqual(best_values[0], best_values[1])
+
+    def test_run_with_npz_output(self):
+        self.properties["n_workers"] = "1"
+        self.properties["method"] = "least_squares"
+        self.properties["output_format"] = "npz"
+        batch = BatchDeconvolver(filenames=self.filenames[:2], experiment_label="experiment",
+                                 properties=self.properties, plot_peaks=False)
+        for _, filename, status in batch.run():
+            self.assertEqual(0, status.get("exit_code"))
+            root = path_utils.splitext(path_utils.basename(filename))[0]
+            fit = load_fit(path_utils.join(self.tmp_dir, "experiment", root + ".npz"))
+            self.assertEqual((6, len(fit["x"])), fit["components"].shape)
+            self.assertEqual(status["peaks"]["File"], fit["peaks"]["File"].tolist())
+        output_files = sorted(os.listdir(path_utils.join(self.tmp_dir, "experiment")))
+        self.assertEqual(["all.peaks", "experiment.properties", "signal_01.npz", "signal_02.npz", "timings.jsonl"],
+                         output_files)
+
+    def test_run_with_deferred_plots(self):
+        self.properties["n_workers"] = "1"
+        self.properties["method"] = "least_squares"
+        self.properties["plot_mode"] = "deferred"
+        batch = BatchDeconvolver(filenames=self.filenames[:2], experiment_label="experiment",
+                                 properties=self.properties)
+        for _, _, status in batch.run():
+            self.assertEqual(0, status.get("exit_code"))
+            self.assertNotIn("render_job", status)
+        for name in ("signal_01.pdf", "signal_02.pdf"):
+            self.assertTrue(path_utils.exists(path_utils.join(self.tmp_dir, "experiment", name)))
+
+    def test_run_without_plots(self):
+        self.properties["n_workers"] = "1"
+        self.properties["method"] = "least_squares"
+        self.properties["plot_mode"] = "deferred"
+        batch = BatchDeconvolver(filenames=self.filenames[:1], experiment_label="experiment",
+                                 properties=self.properties, plot_peaks=False)
+        self.assertEqual("off", batch.plot_mode)
+        list(batch.run())
+        self.assertFalse(path_utils.exists(path_utils.join(self.tmp_dir, "experiment", "signal_01.pdf")))
+
+    def test_run_with_cache(self):
+        self.properties["n_workers"] = "2"
+        self.properties["method"] = "least_squares"
+        self.properties["cache"] = "True"
+        self.properties["cache_dir"] = path_utils.join(self.tmp_dir, "cache")
+        filenames = self.filenames[:3]
+        first = BatchDeconvolver(filenames=filenames, experiment_label="first", properties=self.properties)
+        self.assertFalse(any(status.get("cached") for _, _, status in first.run()))
+
+        # Changed signal files and scheduling properties
+        with open(filenames[2], "a") as file:
+            file.write("1699.0,0.0\n")
+        self.properties["n_workers"] = "1"
+        second = BatchDeconvolver(filenames=filenames, experiment_label="second", properties=self.properties)
+        cached = {i: status.get("cached", False) for i, _, status in second.run()}
+        self.assertEqual({0: True, 1: True, 2: False}, cached)
+        first_dir, second_dir = [path_utils.join(self.tmp_dir, label) for label in ("first", "second")]
+        self.assertEqual(sorted(os.listdir(first_dir)), sorted(os.listdir(second_dir)))
+        for name in ("signal_01.fit.dpt", "signal_02.peaks", "signal_01.pdf"):
+            with open(path_utils.join(first_dir, name), "rb") as a, open(path_utils.join(second_dir, name), "rb") as b:
+                self.assertEqual(a.read(), b.read(), name)
+        all_peaks = pd.read_csv(path_utils.join(second_dir, "all.peaks"), sep="\t")
+        self.assertEqual(sorted(filenames), sorted(all_peaks["File"].unique()))
+
+    def test_run_with_cache_and_plots_turned_on(self):
+        self.properties["n_workers"] = "1"
+        self.properties["cache"] = "True"
+        self.properties["cache_dir"] = path_utils.join(self.tmp_dir, "cache")
+        self.properties["plot_mode"] = "off"
+        filenames = self.filenames[:1]
+        list(BatchDeconvolver(filenames=filenames, experiment_label="first", properties=self.properties).run())
+        self.assertFalse(path_utils.exists(path_utils.join(self.tmp_dir, "first", "signal_01.pdf")))
+
+        # Plotted results are not in the cache yet, rendered inline or deferred they are the same
+        self.properties["plot_mode"] = "inline"
+        second = BatchDeconvolver(filenames=filenames, experiment_label="second", properties=self.properties)
+        self.assertEqual([False], [status.get("cached", False) for _, _, status in second.run()])
+        self.assertTrue(path_utils.exists(path_utils.join(self.tmp_dir, "second", "signal_01.pdf")))
+        self.properties["plot_mode"] = "deferred"
+        third = BatchDeconvolver(filenames=filenames, experiment_label="third", properties=self.properties)
+        self.assertEqual([True], [status.get("cached", False) for _, _, status in third.run()])
+        self.assertTrue(path_utils.exists(path_utils.join(self.tmp_dir, "third", "signal_01.pdf")))
+
+    def test_run_with_timings_and_profile(self):
+        self.properties["n_workers"] = "2"
+        self.properties["method"] = "least_squares"
+        self.properties["profile"] = "True"
+        batch = BatchDeconvolver(filenames=self.filenames[:2], experiment_label="experiment",
+                                 properties=self.properties)
+        for _, _, status in batch.run():
+            self.assertEqual({"build", "parse", "fit", "components", "write", "plot", "aggregate"},
+                             set(status["timings"]))
+            self.assertGreater(status["fit_statistics"]["nfev"], 0)
+            self.assertTrue(path_utils.exists(status["profile_file"]))
+        with open(path_utils.join(self.tmp_dir, "experiment", "timings.jsonl"), "r") as file:
+            records = [json.loads(line) for line in file.readlines()]
+        self.assertEqual(sorted(self.filenames[:2]), sorted(record["file"] for record in records))
+        summary = batch.timing_summary()
+        self.assertEqual(2, summary["n_files"])
+        self.assertEqual(sum(record["fit_statistics"]["nfev"] for record in records), summary["nfev"])
+        self.assertAlmostEqual(sum(record["timings"]["fit"]["wall"] for record in records),
+                               summary["timings"]["fit"]["wall"])
+
+    def test_unknown_warm_start(self):
+        self.assertRaises(ValueError, BatchDeconvolver, filenames=self.filenames, experiment_label="experiment",
+                          properties={"warm_start": "next"})
+
+    def test_deconvolve_command(self):
+        runner = CliRunner()
+        result = runner.invoke(deconvolve, [
+            "--properties-file", path_utils.join(SAMPLE_DATA_DIR, "model.properties"),
+            "--input", self.tmp_dir,
+            "--experiment-label", "experiment",
+            "--n-workers", "1",
+            "--skip-plotting-results"
+        ])
+        self.assertEqual(0, result.exit_code)
+        records = [json.loads(line) for line in result.stdout.splitlines()]
+        self.assertEqual("started", records[0]["event"])
+        self.assertEqual(len(self.filenames), len([r for r in records if r["event"] == "file"]))
+        self.assertEqual(0, records[-1]["n_failed"])
+
+    def test_deconvolve_command_fails(self):
+        with open(path_utils.join(self.tmp_dir, "broken.dpt"), "w") as file:
+            file.write("not,a\nsignal,file\n")
+        runner = CliRunner()
+        result = runner.invoke(deconvolve, [
+            "--properties-file", path_utils.join(SAMPLE_DATA_DIR, "model.properties"),
+            "--input", path_utils.join(self.tmp_dir, "broken.dpt"),
+            "--experiment-label", "experiment"
+        ])
+        self.assertEqual(1, result.exit_code)
+        records = [json.loads(line) for line in result.stdout.splitlines()]
+        self.assertEqual(1, records[-1]["n_failed"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import os.path as path_utils
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from click.testing import CliRunner
+
+from src.logic import ellipses
+from src.logic.ellipses import (avg_z_rings, extrapolate, extrapolate_ellipse, format_avg_z_rings, inside_ellipse,
+                               load_diameter, nearest_index, sum_and_count_inside_ellipses)
+from src.logic.grid_matrix import load_grid, load_matrix
+
+SAMPLE_DATA_DIR = path_utils.join(path_utils.dirname(path_utils.realpath(__file__)),
+                                  "..", "..", "sample_data", "ellipses")
+
+
+class NearestIndexTest(unittest.TestCase):
+
+    def assert_same_as_argmin(self, samples, values):
+        with np.errstate(invalid="ignore"):
+            expected = np.argmin(np.abs(samples[:, np.newaxis, np.newaxis] - values), axis=0)
+            np.testing.assert_array_equal(expected, nearest_index(samples, values))
+
+    def test_symmetric_samples(self):
+        # Like the profilometer files, values half way between samples are ties
+        samples = np.arange(-1170.0, 1171.0, 65.0)
+        grid_x, grid_y = np.mgrid[-1170:1170:(50 * 1j), -975:975:(40 * 1j)]
+        self.assert_same_as_argmin(samples, np.sign(grid_x) * np.sqrt(grid_x ** 2 + grid_y ** 2))
+        self.assert_same_as_argmin(samples, np.arange(-1300.0, 1300.0, 32.5).reshape(4, -1))
+
+    def test_unsorted_samples_with_duplicates(self):
+        rng = np.random.default_rng(0)
+        for _ in range(100):
+            samples = rng.integers(-5, 5, rng.integers(1, 20)).astype(float)
+            values = (rng.integers(-24, 24, 60) * 0.25).reshape(6, 10)
+            self.assert_same_as_argmin(samples, values)
+
+    def test_ties_from_rounding(self):
+        samples = np.array([3.0, 1.0 + 2 ** -51, 1.0, 1.0 + 2 ** -52])
+        self.assert_same_as_argmin(samples, np.array([[1e10, -1e10], [1.0, 2.0]]))
+
+    def test_special_values(self):
+        samples = np.array([2.0, -1.0, 0.0, np.inf])
+        self.assert_same_as_argmin(samples, np.array([[np.nan, np.inf], [-np.inf, -0.0]]))
+        self.assert_same_as_argmin(np.array([1.0, np.nan, 0.0]), np.array([[0.2, 0.8]]))
+
+
+class RingsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.grid_x = np.mgrid[-1170:1170:(90 * 1j)][:, np.newaxis]
+        self.grid_y = np.mgrid[-975:975:(70 * 1j)][np.newaxis, :]
+        self.grid_z = np.random.default_rng(0).normal(size=(90, 70))
+        self.radii_ratio = 1170.0 / 975.0
+
+    def assert_same_as_masks(self, long_radii):
+        sums, counts = sum_and_count_inside_ellipses(self.grid_x, self.grid_y, self.grid_z, long_radii,
+                                                     self.radii_ratio)
+        for i, r1 in enumerate(long_radii):
+            mask = np.broadcast_to(inside_ellipse(self.grid_x, self.grid_y, r1, self.radii_ratio),
+                                   self.grid_z.shape)
+            self.assertEqual(np.count_nonzero(mask), counts[i])
+            self.assertAlmostEqual(np.sum(self.grid_z[mask]), sums[i], places=9)
+
+    def test_sum_and_count_inside_ellipses(self):
+        # Radii of the sample file, many grid points lie exactly on their ellipses
+        self.assert_same_as_masks(np.arange(65.0, 1171.0, 65.0))
+
+    def test_unsorted_and_repeated_radii(self):
+        self.assert_same_as_masks(np.array([650.0, 65.0, 975.0, 65.0, 1300.0, 0.5]))
+        self.assert_same_as_masks(np.array([]))
+
+    def test_avg_z_rings(self):
+        long_diameter = np.array([[-65.0, 1.0], [0.0, 1.0], [65.0, 1.0], [130.0, 0.0], [195.0, 2.0], [260.0, 2.0]])
+        rings = avg_z_rings(self.grid_x, self.grid_y, self.grid_z, long_diameter, self.radii_ratio)
+        self.assertEqual([0, 1, 2], [ring["ring"] for ring in rings])
+        self.assertEqual([65.0, 195.0, 260.0], [ring["r1"] for ring in rings])
+        sums, counts = sum_and_count_inside_ellipses(self.grid_x, self.grid_y, self.grid_z, [65.0, 195.0, 260.0],
+                                                     self.radii_ratio)
+        self.assertEqual(counts[2] - counts[1], rings[2]["count_z"])
+        self.assertAlmostEqual((sums[2] - sums[1]) / (counts[2] - counts[1]), rings[2]["avg_z"])
+
+
+class ExtrapolateEllipseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def extrapolate(self, name, *options):
+        output_file = path_utils.join(self.tmp_dir, name)
+        result = CliRunner().invoke(extrapolate_ellipse, [
+            "--long-diameter-file", path_utils.join(SAMPLE_DATA_DIR, "coated_63_long.tsv"),
+            "--short-diameter-file", path_utils.join(SAMPLE_DATA_DIR, "coated_63_short.tsv"),
+            "--output-file", output_file,
+            "--plot-file", path_utils.join(self.tmp_dir, "output.png"),
+            "--skip-plotting-results",
+            "--skip-showing-results",
+            *options
+        ])
+        self.assertEqual(0, result.exit_code, result.output)
+        return output_file, result.stdout
+
+    def test_chunked_grid(self):
+        output_file, rings = self.extrapolate("output.dpt", "--grid-x", "60", "--grid-y", "60")
+        with mock.patch.object(ellipses, "GRID_CHUNK_POINTS", 7 * 60):
+            chunked_output_file, chunked_rings = self.extrapolate("chunked.dpt", "--grid-x", "60", "--grid-y", "60")
+        with open(output_file, "rb") as output, open(chunked_output_file, "rb") as chunked_output:
+            self.assertEqual(output.read(), chunked_output.read())
+        self.assertEqual(rings, chunked_rings)
+
+    def test_extrapolate(self):
+        long_diameter_file = path_utils.join(SAMPLE_DATA_DIR, "coated_63_long.tsv")
+        short_diameter_file = path_utils.join(SAMPLE_DATA_DIR, "coated_63_short.tsv")
+        output_file, rings = self.extrapolate("output.dpt", "--grid-x", "40", "--grid-y", "40")
+        result = extrapolate(load_diameter(long_diameter_file), load_diameter(short_diameter_file),
+                             grid_x_points=40, grid_y_points=40)
+        xs, ys, grid_z = load_grid(output_file)
+        np.testing.assert_array_equal(xs, result["xs"])
+        np.testing.assert_array_equal(ys, result["ys"])
+        np.testing.assert_array_equal(grid_z, result["grid_z"])
+        self.assertEqual(rings, format_avg_z_rings(long_diameter_file, short_diameter_file, result["rings"]))
+
+    def test_binary_format_extension(self):
+        output_file, _ = self.extrapolate("output.dpt", "--grid-x", "30", "--grid-y", "20", "--output-format", "npy",
+                                          "--skip-printing-rings")
+        self.assertFalse(path_utils.exists(output_file))
+        xs, ys, grid_z = load_grid(path_utils.join(self.tmp_dir, "output.npy"))
+        self.assertEqual((30, 20), grid_z.shape)
+
+    def test_grid_layout(self):
+        # Square dpt grids keep the original layout, x values in the header row and y values in the header
+        # column, other grids and npy grids have x values in the header column and y values in the header row
+        for grid_x, grid_y, output_format, x_in_header_row in ((20, 20, "dpt", True), (30, 20, "dpt", False),
+                                                               (20, 20, "npy", False), (30, 20, "npy", False)):
+            output_file, _ = self.extrapolate("output.dpt", "--grid-x", str(grid_x), "--grid-y", str(grid_y),
+                                              "--output-format", output_format, "--skip-printing-rings")
+            matrix = load_matrix(path_utils.join(self.tmp_dir, f"output.{output_format}"))
+            self.assertEqual((grid_x + 1, grid_y + 1), matrix.shape)
+            header_row, header_column = matrix[0, 1:], matrix[1:, 0]
+            xs, ys = (header_row, header_column) if x_in_header_row else (header_column, header_row)
+            np.testing.assert_allclose(np.linspace(-1170.0, 1170.0, grid_x), xs)
+            np.testing.assert_allclose(np.linspace(-975.0, 975.0, grid_y), ys)
+
+
+if __name__ == '__main__':
+    unittest.main()
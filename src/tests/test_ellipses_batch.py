@@ -0,0 +1,70 @@
+import json
+import os
+import os.path as path_utils
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+from click.testing import CliRunner
+
+from src.logic.ellipses import extrapolate, load_diameter
+from src.logic.ellipses_batch import extrapolate_ellipses, find_diameter_pairs
+
+SAMPLE_DATA_DIR = path_utils.join(path_utils.dirname(path_utils.realpath(__file__)),
+                                  "..", "..", "sample_data", "ellipses")
+
+
+class EllipsesBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for name in os.listdir(SAMPLE_DATA_DIR):
+            shutil.copy(path_utils.join(SAMPLE_DATA_DIR, name), self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_find_pairs_in_directory(self):
+        pairs = find_diameter_pairs([self.tmp_dir])
+        self.assertEqual(["coated_63", "coated_85"], [pair["name"] for pair in pairs])
+        self.assertEqual(path_utils.join(self.tmp_dir, "coated_85_short.tsv"), pairs[1]["short diameter"])
+
+    def test_find_pairs_in_manifest(self):
+        manifest = path_utils.join(self.tmp_dir, "manifest.txt")
+        with open(manifest, "w") as file:
+            file.write("coated_85_long.tsv\tcoated_63_short.tsv\tmixed\n\ncoated_63_long.tsv\tcoated_63_short.tsv\n")
+        pairs = find_diameter_pairs(manifest=manifest)
+        self.assertEqual(["mixed", "coated_63"], [pair["name"] for pair in pairs])
+        self.assertEqual(path_utils.join(self.tmp_dir, "coated_85_long.tsv"), pairs[0]["long diameter"])
+
+    def test_missing_short_diameter_file(self):
+        os.remove(path_utils.join(self.tmp_dir, "coated_85_short.tsv"))
+        self.assertRaises(ValueError, find_diameter_pairs, [self.tmp_dir])
+
+    def test_extrapolate_ellipses_command(self):
+        output_dir = path_utils.join(self.tmp_dir, "experiment")
+        result = CliRunner().invoke(extrapolate_ellipses, [
+            "--input", self.tmp_dir,
+            "--output-dir", output_dir,
+            "--grid-x", "40",
+            "--grid-y", "30",
+            "--n-workers", "2",
+            "--skip-plotting-results"
+        ])
+        self.assertEqual(0, result.exit_code, result.output)
+        records = [json.loads(line) for line in result.stdout.splitlines()]
+        self.assertEqual(0, records[-1]["n_failed"])
+        self.assertEqual(["coated_63.dpt", "coated_85.dpt", "rings.tsv"], sorted(os.listdir(output_dir)))
+
+        rings = pd.read_csv(path_utils.join(output_dir, "rings.tsv"), sep="\t")
+        expected = extrapolate(load_diameter(path_utils.join(self.tmp_dir, "coated_85_long.tsv")),
+                               load_diameter(path_utils.join(self.tmp_dir, "coated_85_short.tsv")),
+                               grid_x_points=40, grid_y_points=30)["rings"]
+        coated_85 = rings[rings["name"] == "coated_85"]
+        self.assertEqual([ring["count_z"] for ring in expected], coated_85["count_z"].tolist())
+        self.assertEqual(["coated_63", "coated_85"], rings["name"].unique().tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os.path as path_utils
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.logic.deconvolution import Deconvolver
+from src.logic.fit_output import load_fit, output_file_name, write_fit
+
+
+class FitOutputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        d = Deconvolver()
+        self.x = np.linspace(0.0, 10.0, 51)
+        self.components = np.vstack([np.exp(-(self.x - 3.0) ** 2), 1.0 / (1.0 + (self.x - 7.0) ** 2)])
+        self.background = np.full_like(self.x, 0.5)
+        self.fit = self.components.sum(axis=0) + self.background
+        self.peaks = d.init_peaks()
+        for i, center in enumerate([3.0, 7.0]):
+            d.add_peak(peaks=self.peaks, index=f"%_{i + 1}", peak_type="Gaussian", center=center, height=1.0,
+                       area=2.0, fwhm=1.5, parameters=f"1.0 {center} ?", file="signal.dpt")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assert_round_trip(self, output_format, background):
+        path = path_utils.join(self.tmp_dir, output_file_name("signal", output_format))
+        write_fit(path=path, output_format=output_format, x=self.x, signal=self.fit, fit=self.fit,
+                  components=self.components, component_names=["gauss_peak1", "lorentz_peak1"],
+                  peaks=self.peaks, fit_report="[[Fit Statistics]]", background=background)
+        fit = load_fit(path)
+        np.testing.assert_array_equal(self.x, fit["x"])
+        np.testing.assert_array_equal(self.fit, fit["fit"])
+        np.testing.assert_array_equal(self.components, fit["components"])
+        self.assertEqual(["gauss_peak1", "lorentz_peak1"], fit["component_names"])
+        self.assertEqual(self.peaks["Center"], fit["peaks"]["Center"].tolist())
+        self.assertEqual(self.peaks["File"], fit["peaks"]["File"].tolist())
+        self.assertEqual("[[Fit Statistics]]", fit["fit_report"])
+        if background is None:
+            self.assertIsNone(fit["background"])
+        else:
+            np.testing.assert_array_equal(background, fit["background"])
+
+    def test_npz_round_trip(self):
+        self.assert_round_trip("npz", self.background)
+        self.assert_round_trip("npz", None)
+
+    def test_parquet_round_trip(self):
+        try:
+            import pyarrow
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+        self.assert_round_trip("parquet", self.background)
+        self.assert_round_trip("parquet", None)
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, output_file_name, "signal", "hdf5")
+        self.assertRaises(ValueError, load_fit, path_utils.join(self.tmp_dir, "signal.fit.dpt"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+
+from src.logic.deconvolution import Deconvolver
+
+
+class FitTemplateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.d = Deconvolver()
+        self.properties = {
+            "method": "leastsq",
+            "n_gauss": "1",
+            "n_lorentz": "1",
+            "include_background": "True",
+            "gauss_peak1_mu_min": "2.0",
+            "gauss_peak1_mu_max": "3.0",
+            "lorentz_peak1_sigma_max": "4.0"
+        }
+
+    def test_fit_template_is_cached(self):
+        template = self.d.fit_template(self.properties)
+        self.assertIs(template, self.d.fit_template(dict(self.properties)))
+        self.assertIsNot(template, self.d.fit_template(dict(self.properties, n_gauss="2")))
+
+    def test_typed_properties(self):
+        template = self.d.fit_template(self.properties)
+        self.assertEqual("leastsq", template.method)
+        self.assertEqual(1, template.n_gauss)
+        self.assertEqual(1, template.n_lorentz)
+        self.assertTrue(template.include_background)
+        self.assertEqual("\t+", template.input_format_separator)
+
+    def test_make_params(self):
+        template = self.d.fit_template(self.properties)
+        params = template.make_params(np.array([1.0, 5.0, 9.0]), np.array([-1.0, 2.0, 0.5]))
+        self.assertEqual((-1.0, 2.0), (params["bkg_c"].min, params["bkg_c"].max))
+        self.assertEqual((2.0, 3.0), (params["gauss_peak1_center"].min, params["gauss_peak1_center"].max))
+        self.assertEqual((1.0, 9.0), (params["lorentz_peak1_center"].min, params["lorentz_peak1_center"].max))
+        self.assertEqual(1.0, params["lorentz_peak1_center"].value)
+        self.assertEqual(4.0, params["lorentz_peak1_sigma"].max)
+
+    def test_make_params_returns_copies(self):
+        template = self.d.fit_template(self.properties)
+        params = template.make_params(np.array([1.0, 9.0]), np.array([0.0, 1.0]))
+        params["gauss_peak1_amplitude"].value = 50.0
+        params = template.make_params(np.array([1.0, 9.0]), np.array([0.0, 1.0]))
+        self.assertEqual(0.0, params["gauss_peak1_amplitude"].value)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os.path as path_utils
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.logic.grid_matrix import create_grid_matrix, load_grid, load_matrix, matrix_file_name, save_matrix
+
+
+class GridMatrixTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.xs = np.linspace(-1170.0, 1170.0, 7)
+        self.ys = np.linspace(-975.0, 975.0, 5)
+        self.z = np.random.default_rng(0).normal(size=(7, 5)) * 1e3
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assert_round_trip(self, name, output_format, xs, ys):
+        path = path_utils.join(self.tmp_dir, name)
+        z = self.z[:len(xs), :len(ys)]
+        matrix = create_grid_matrix(path, output_format, xs, ys)
+        matrix[1:, 1:] = z
+        save_matrix(path, output_format, matrix)
+        del matrix
+        # Square dpt grids keep the original layout, x values in the header row
+        header_row, header_column = (xs, ys) if output_format == "dpt" and len(xs) == len(ys) else (ys, xs)
+        np.testing.assert_array_equal(np.vstack([np.concatenate([[0.0], header_row]),
+                                                 np.column_stack([header_column, z])]),
+                                      load_matrix(path))
+        loaded_xs, loaded_ys, loaded_z = load_grid(path)
+        np.testing.assert_array_equal(xs, loaded_xs)
+        np.testing.assert_array_equal(ys, loaded_ys)
+        np.testing.assert_array_equal(z, loaded_z)
+
+    def test_round_trip(self):
+        for output_format in ("dpt", "npy", "raw"):
+            self.assert_round_trip(f"grid.{output_format}", output_format, self.xs, self.ys)
+            self.assert_round_trip(f"square.{output_format}", output_format, self.xs[:5], self.ys)
+
+    def test_matrix_file_name(self):
+        self.assertEqual("out.dpt", matrix_file_name("out.dpt", "dpt"))
+        self.assertEqual("out.txt", matrix_file_name("out.txt", "dpt"))
+        self.assertEqual("dir.d/out.npy", matrix_file_name("dir.d/out.dpt", "npy"))
+        self.assertEqual("out.npy", matrix_file_name("out.npy", "npy"))
+        self.assertEqual("out.raw", matrix_file_name("out", "raw"))
+
+    def test_load_npy_without_extension(self):
+        path = path_utils.join(self.tmp_dir, "grid.dpt")
+        np.save(path_utils.join(self.tmp_dir, "grid.npy"), self.z)
+        shutil.move(path_utils.join(self.tmp_dir, "grid.npy"), path)
+        np.testing.assert_array_equal(self.z, load_matrix(path))
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, create_grid_matrix, path_utils.join(self.tmp_dir, "grid.h5"), "h5", self.xs,
+                          self.ys)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+
+import numpy as np
+
+from src.logic.deconvolution import Deconvolver
+from src.logic.initial_guess import detect_peaks, guess_values
+
+
+def wide_properties(method, centers, initial_guess):
+    properties = {"method": method,
+                  "n_gauss": str(len(centers)),
+                  "initial_guess": initial_guess,
+                  "gauss_peak_amp_min_default": "0",
+                  "gauss_peak_amp_max_default": "100",
+                  "gauss_peak_sigma_min_default": "1",
+                  "gauss_peak_sigma_max_default": "20"}
+    for i, center in enumerate(centers, start=1):
+        properties[f"gauss_peak{i}_mu_min"] = str(center - 15)
+        properties[f"gauss_peak{i}_mu_max"] = str(center + 15)
+    return properties
+
+
+class InitialGuessTest(unittest.TestCase):
+
+    def setUp(self):
+        # Separate peaks, and a pair of overlapping peaks, on a descending x axis
+        self.centers = [1630.0, 1660.0, 1672.0, 1710.0, 1740.0, 1770.0]
+        self.sigmas = [5.0, 6.0, 4.0, 8.0, 5.0, 7.0]
+        self.amplitudes = [3.0, 5.0, 2.0, 8.0, 4.0, 6.0]
+        self.x = np.linspace(1800.0, 1600.0, 600)
+        self.signal = sum(Deconvolver.gaussian(self.x, a, c, s)
+                          for a, c, s in zip(self.amplitudes, self.centers, self.sigmas))
+        self.signal = self.signal + np.random.default_rng(1).normal(0.0, 0.002, len(self.x))
+
+    def test_detect_peaks(self):
+        baseline, centers, heights, half_widths = detect_peaks(self.x, self.signal, None, 0.05)
+        self.assertAlmostEqual(0.0, baseline, places=2)
+        for center, sigma in zip(self.centers, self.sigmas):
+            closest = np.argmin(np.abs(centers - center))
+            # Overlapping peaks shift and narrow each other
+            self.assertAlmostEqual(center, centers[closest], delta=2.0)
+            self.assertAlmostEqual(sigma, half_widths[closest], delta=0.3 * sigma)
+        self.assertTrue(np.all(heights > 0))
+
+    def test_detect_peaks_of_flat_signal(self):
+        _, centers, _, _ = detect_peaks(self.x, np.zeros_like(self.x), None, 0.05)
+        self.assertEqual(0, len(centers))
+
+    def test_guess_values(self):
+        template = Deconvolver.fit_template(wide_properties("leastsq", self.centers, "auto"))
+        params = template.make_params(self.x, self.signal)
+        values = template.initial_values(self.x, self.signal, params)
+        # Every peak gets a center in its bounds, and amplitudes add up to the area of the signal
+        for i in range(len(self.centers)):
+            center = values[f"gauss_peak{i + 1}_center"]
+            self.assertTrue(params[f"gauss_peak{i + 1}_center"].min <= center <= params[f"gauss_peak{i + 1}_center"].max)
+        total = sum(values[f"gauss_peak{i + 1}_amplitude"] for i in range(len(self.centers)))
+        self.assertAlmostEqual(sum(self.amplitudes), total, delta=0.05 * sum(self.amplitudes))
+
+    def test_guess_values_keep_explicit_values(self):
+        properties = wide_properties("leastsq", self.centers, "auto")
+        properties["gauss_peak1_amp_value"] = "2.5"
+        template = Deconvolver.fit_template(properties)
+        params = template.make_params(self.x, self.signal)
+        values = template.initial_values(self.x, self.signal, params)
+        self.assertNotIn("gauss_peak1_amplitude", values)
+        self.assertIn("gauss_peak1_center", values)
+        self.assertIsNone(Deconvolver.fit_template(wide_properties("leastsq", self.centers, "none"))
+                          .initial_values(self.x, self.signal, params))
+
+    def test_guess_values_without_candidates(self):
+        template = Deconvolver.fit_template(wide_properties("leastsq", [1700.0], "auto"))
+        params = template.make_params(self.x, self.signal)
+        values = guess_values(self.x, np.zeros_like(self.x), params, 1, 0, None, 0.05)
+        self.assertEqual(1700.0, values["gauss_peak1_center"])
+        self.assertEqual(0.0, values["gauss_peak1_amplitude"])
+
+    def test_leastsq_converges_from_guess(self):
+        chisqr = {}
+        for initial_guess in ("none", "auto"):
+            template = Deconvolver.fit_template(wide_properties("leastsq", self.centers, initial_guess))
+            params = template.make_params(self.x, self.signal)
+            values = template.initial_values(self.x, self.signal, params)
+            if values is not None:
+                Deconvolver.seed_params(params, values)
+            chisqr[initial_guess] = template.model.fit(data=self.signal, x=self.x, params=params,
+                                                       method="leastsq").chisqr
+        # Starting from the minimum of every limit leastsq gets stuck, noise alone is about 0.0024
+        self.assertGreater(chisqr["none"], 0.1)
+        self.assertLess(chisqr["auto"], 0.003)
+
+    def test_unknown_initial_guess(self):
+        self.assertRaises(ValueError, Deconvolver.fit_template,
+                          wide_properties("leastsq", self.centers, "derivative"))
+
+
+if __name__ == '__main__':
+    unittest.main()
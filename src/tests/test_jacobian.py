@@ -0,0 +1,78 @@
+import unittest
+
+import numpy as np
+from lmfit import Parameters
+from lmfit.models import ConstantModel, GaussianModel, LorentzianModel
+
+from src.logic.jacobian import jacobian_fit_kws, move_off_bounds, sum_of_peaks_jacobian
+
+
+class JacobianTest(unittest.TestCase):
+
+    def setUp(self):
+        self.x = np.linspace(0.0, 20.0, 201)
+        self.model = (ConstantModel(prefix="bkg_")
+                      + GaussianModel(prefix="gauss_peak1_")
+                      + LorentzianModel(prefix="lorentz_peak1_"))
+        self.params = self.model.make_params(bkg_c=dict(value=0.5, min=0.0, max=1.0),
+                                             gauss_peak1_amplitude=dict(value=3.0, min=0.0, max=10.0),
+                                             gauss_peak1_center=dict(value=7.0, min=0.0, max=20.0),
+                                             gauss_peak1_sigma=dict(value=1.5, min=0.1, max=5.0),
+                                             lorentz_peak1_amplitude=dict(value=2.0, min=0.0, max=10.0),
+                                             lorentz_peak1_center=dict(value=12.0, min=0.0, max=20.0),
+                                             lorentz_peak1_sigma=dict(value=0.8, min=0.1, max=5.0))
+        self.data = self.model.eval(self.params, x=self.x) + 0.1
+
+    def residual(self, params):
+        return self.data - self.model.eval(params, x=self.x)
+
+    def test_sum_of_peaks_jacobian(self):
+        jacobian = sum_of_peaks_jacobian(self.params, self.data, None, x=self.x)
+        names = [name for name, param in self.params.items() if param.vary and not param.expr]
+        self.assertEqual((len(self.x), len(names)), jacobian.shape)
+        for column, name in enumerate(names):
+            params = self.params.copy()
+            value = params[name].value
+            step = 1e-6 * max(1.0, abs(value))
+            params[name].value = value + step
+            upper = self.residual(params)
+            params[name].value = value - step
+            lower = self.residual(params)
+            np.testing.assert_allclose((upper - lower) / (2 * step), jacobian[:, column], atol=1e-7)
+
+    def test_sum_of_peaks_jacobian_skips_fixed_parameters(self):
+        self.params["bkg_c"].vary = False
+        jacobian = sum_of_peaks_jacobian(self.params, self.data, None, x=self.x)
+        self.assertEqual(6, jacobian.shape[1])
+
+    def test_move_off_bounds(self):
+        params = Parameters()
+        params.add("a", value=0.0, min=0.0, max=1.0)
+        params.add("b", value=1.0, min=0.0, max=1.0)
+        params.add("c", value=0.5, min=0.0, max=1.0)
+        move_off_bounds(params)
+        self.assertGreater(params["a"].value, 0.0)
+        self.assertLess(params["b"].value, 1.0)
+        self.assertEqual(0.5, params["c"].value)
+
+    def test_jacobian_fit_kws(self):
+        self.assertEqual({}, jacobian_fit_kws("differential_evolution", "numeric"))
+        self.assertEqual({"Dfun": sum_of_peaks_jacobian}, jacobian_fit_kws("least_squares", "analytic"))
+        self.assertRaises(ValueError, jacobian_fit_kws, "differential_evolution", "analytic")
+        self.assertRaises(ValueError, jacobian_fit_kws, "leastsq", "symbolic")
+
+    def test_fit_with_analytic_jacobian(self):
+        for method in ("leastsq", "least_squares"):
+            params = self.params.copy()
+            params["gauss_peak1_center"].value = 6.0
+            params["lorentz_peak1_sigma"].value = 1.5
+            if method == "leastsq":
+                move_off_bounds(params)
+            result = self.model.fit(self.data, params=params, x=self.x, method=method,
+                                    fit_kws=jacobian_fit_kws(method, "analytic"))
+            self.assertAlmostEqual(7.0, result.best_values["gauss_peak1_center"], places=4)
+            self.assertAlmostEqual(0.6, result.best_values["bkg_c"], places=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
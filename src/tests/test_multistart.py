@@ -0,0 +1,143 @@
+import os
+import os.path as path_utils
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src.logic.deconvolution import Deconvolver
+from src.logic import multistart
+from src.logic.multistart import latin_hypercube_starts, run_starts, starts_executor
+
+
+def distance_to(target, start):
+    # Module level, so that it can be pickled and sent to a worker process
+    return (start["a"] - target) ** 2, dict(start), 1
+
+
+def slow_distance(target, output_dir, start):
+    # Marks every finished start with a file, the first one finishes first
+    time.sleep(0.05 if start["a"] == 0 else 0.5)
+    open(path_utils.join(output_dir, f"{start['a']}.done"), "w").close()
+    return (start["a"] - target) ** 2, dict(start), 1
+
+
+def process_id(start):
+    return 0.0, {"pid": os.getpid()}, 1
+
+
+def wide_properties(method, centers):
+    properties = {"input_format_separator": ",",
+                  "method": method,
+                  "n_gauss": str(len(centers)),
+                  "gauss_peak_amp_min_default": "0",
+                  "gauss_peak_amp_max_default": "100",
+                  "gauss_peak_sigma_min_default": "1",
+                  "gauss_peak_sigma_max_default": "20"}
+    for i, center in enumerate(centers, start=1):
+        properties[f"gauss_peak{i}_mu_min"] = str(center - 15)
+        properties[f"gauss_peak{i}_mu_max"] = str(center + 15)
+    return properties
+
+
+class MultistartTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.centers = [1630.0, 1660.0, 1672.0, 1710.0, 1740.0, 1770.0]
+        sigmas = [5.0, 6.0, 4.0, 8.0, 5.0, 7.0]
+        amplitudes = [3.0, 5.0, 2.0, 8.0, 4.0, 6.0]
+        self.x = np.linspace(1800.0, 1600.0, 600)
+        self.signal = sum(Deconvolver.gaussian(self.x, a, c, s) for a, c, s in zip(amplitudes, self.centers, sigmas))
+        self.signal = self.signal + np.random.default_rng(1).normal(0.0, 0.002, len(self.x))
+        self.signal_file = path_utils.join(self.tmp_dir, "signal.dpt")
+        np.savetxt(self.signal_file, np.column_stack([self.x, self.signal]), delimiter=",")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_latin_hypercube_starts(self):
+        template = Deconvolver.fit_template(wide_properties("multistart", self.centers))
+        params = template.make_params(self.x, self.signal)
+        starts = latin_hypercube_starts(params, 9, seed=0)
+        self.assertEqual(9, len(starts))
+        self.assertEqual({name: param.value for name, param in params.items() if param.vary and not param.expr},
+                         starts[0])
+        self.assertNotIn("bkg_c", starts[0])
+        for name in starts[0]:
+            values = np.array([start[name] for start in starts[1:]])
+            self.assertTrue(np.all((values >= params[name].min) & (values <= params[name].max)))
+            # Every sampled start falls into a different eighth of the range of every parameter
+            strata = np.floor(8 * (values - params[name].min) / (params[name].max - params[name].min))
+            self.assertEqual(8, len(np.unique(strata)))
+        self.assertEqual(starts, latin_hypercube_starts(params, 9, seed=0))
+        self.assertEqual(1, len(latin_hypercube_starts(params, 1, seed=0)))
+
+    def test_run_starts(self):
+        starts = [{"a": float(a)} for a in range(10)]
+        self.assertEqual(10, len(run_starts(distance_to, (3.0,), starts)))
+        # Stops at the first start reaching the target, or after the first one past the time limit
+        self.assertEqual(4, len(run_starts(distance_to, (3.0,), starts, target_chisqr=0.0)))
+        self.assertEqual(1, len(run_starts(distance_to, (3.0,), starts, time_limit=0.0)))
+        solutions = run_starts(distance_to, (3.0,), starts, n_workers=2)
+        self.assertEqual(sorted(range(10)), sorted(int(values["a"]) for _, values, _ in solutions))
+
+    def test_run_starts_waits_for_running_starts(self):
+        output_dir = path_utils.join(self.tmp_dir, "starts")
+        os.makedirs(output_dir)
+        starts = [{"a": float(a)} for a in range(6)]
+        solutions = run_starts(slow_distance, (0.0, output_dir), starts, n_workers=2, target_chisqr=0.0)
+        self.assertEqual(0.0, min(chisqr for chisqr, _, _ in solutions))
+        # No start runs on after it returned, and the ones not started yet never run
+        finished = sorted(os.listdir(output_dir))
+        time.sleep(1.0)
+        self.assertEqual(finished, sorted(os.listdir(output_dir)))
+        self.assertLess(len(finished), len(starts))
+
+    def test_run_starts_reuses_pool(self):
+        starts = [{"a": float(a)} for a in range(4)]
+        run_starts(distance_to, (3.0,), starts, n_workers=2)
+        executor = starts_executor(2)
+        run_starts(distance_to, (3.0,), starts, n_workers=2)
+        self.assertIs(executor, starts_executor(2))
+
+    def test_run_starts_in_process(self):
+        starts = [{"a": float(a)} for a in range(4)]
+        with mock.patch.object(multistart, "parallel_starts", False):
+            solutions = run_starts(process_id, (), starts, n_workers=2)
+        self.assertEqual({os.getpid()}, {values["pid"] for _, values, _ in solutions})
+
+    def test_deconvolve_multistart(self):
+        deconvolver = Deconvolver()
+        chisqr = {}
+        for method in ("leastsq", "multistart"):
+            properties = wide_properties(method, self.centers)
+            properties["multistart_n_starts"] = "8"
+            status = deconvolver.deconvolve_single_file(self.signal_file, method, properties, plot_peaks=False,
+                                                        aggregate=False)
+            self.assertEqual(0, status["exit_code"], status.get("error_message"))
+            fit = deconvolver.evaluate_components(self.x, status["best_values"], len(self.centers), 0).sum(axis=0)
+            chisqr[method] = np.sum((fit - self.signal) ** 2)
+        # leastsq from the minimum of every limit gets stuck, noise alone is about 0.0024
+        self.assertGreater(chisqr["leastsq"], 0.1)
+        self.assertLess(chisqr["multistart"], 0.003)
+        self.assertEqual(8, status["fit_statistics"]["n_starts"])
+        with open(path_utils.join(self.tmp_dir, "multistart", "signal.model.txt")) as file:
+            report = file.read()
+        self.assertIn("[[Multistart]]", report)
+        self.assertIn("starts finished:   8 of 8", report)
+
+    def test_invalid_properties(self):
+        properties = wide_properties("multistart", self.centers)
+        properties["multistart_method"] = "multistart"
+        self.assertRaises(ValueError, Deconvolver.fit_template, properties)
+        properties = wide_properties("multistart", self.centers)
+        properties["windowing"] = "bounds"
+        self.assertRaises(ValueError, Deconvolver.fit_template, properties)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import os.path as path_utils
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from src.logic.deconvolution import Deconvolver
+from src.logic.peak_index import PeakIndex, open_peak_index
+
+
+class PeakIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.d = Deconvolver()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def peaks(self, file, n=2):
+        peaks = self.d.init_peaks()
+        for i in range(n):
+            self.d.add_peak(peaks=peaks, index=f"%_{i + 1}", peak_type="Gaussian", center=float(i), height=1.0,
+                            area=2.0, fwhm=1.5, parameters=f"1.0 {i} ?", file=file)
+        return peaks
+
+    def read_all_peaks(self):
+        return pd.read_csv(path_utils.join(self.tmp_dir, "all.peaks"), sep="\t")
+
+    def test_add_once(self):
+        index = PeakIndex(self.tmp_dir, "\t")
+        self.assertTrue(index.add("a.dpt", self.peaks("a.dpt")))
+        self.assertTrue(index.add("b.dpt", self.peaks("b.dpt")))
+        self.assertFalse(index.add("a.dpt", self.peaks("a.dpt")))
+        self.assertIn("a.dpt", index)
+        self.assertEqual(["a.dpt", "a.dpt", "b.dpt", "b.dpt"], self.read_all_peaks()["File"].tolist())
+
+    def test_reopen_existing_file(self):
+        PeakIndex(self.tmp_dir, "\t").add("a.dpt", self.peaks("a.dpt"))
+        index = PeakIndex(self.tmp_dir, "\t")
+        self.assertFalse(index.add("a.dpt", self.peaks("a.dpt")))
+        self.assertTrue(index.add("b.dpt", self.peaks("b.dpt")))
+        self.assertEqual(4, len(self.read_all_peaks()))
+
+    def test_removed_file_is_written_again(self):
+        index = PeakIndex(self.tmp_dir, "\t")
+        index.add("a.dpt", self.peaks("a.dpt"))
+        os.remove(path_utils.join(self.tmp_dir, "all.peaks"))
+        self.assertTrue(index.add("a.dpt", self.peaks("a.dpt")))
+        self.assertEqual(2, len(self.read_all_peaks()))
+
+    def test_concurrent_writers(self):
+        files = [f"signal_{i}.dpt" for i in range(50)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda f: open_peak_index(self.tmp_dir, "\t").add(f, self.peaks(f)), files + files))
+        all_peaks = self.read_all_peaks()
+        self.assertEqual(2 * len(files), len(all_peaks))
+        self.assertEqual(sorted(files), sorted(all_peaks["File"].unique()))
+
+
+if __name__ == '__main__':
+    unittest.main()
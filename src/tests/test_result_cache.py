@@ -0,0 +1,95 @@
+import os
+import os.path as path_utils
+import shutil
+import tempfile
+import time
+import unittest
+
+from src.logic.result_cache import ResultCache, normalized_properties
+
+
+def entries_size(entries):
+    return sum(size for _, size, _ in entries)
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = ResultCache(path_utils.join(self.tmp_dir, "cache"), max_size=2500)
+        self.signal_file = path_utils.join(self.tmp_dir, "signal.dpt")
+        with open(self.signal_file, "w") as file:
+            file.write("1.0,2.0\n")
+        self.output_dir = path_utils.join(self.tmp_dir, "experiment")
+        os.makedirs(self.output_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def store(self, key, size):
+        with open(path_utils.join(self.output_dir, "signal.fit.dpt"), "wb") as file:
+            file.write(b"x" * size)
+        self.cache.store(key, self.output_dir, ["signal.fit.dpt"], {"peaks": {"File": [self.signal_file]},
+                                                                     "best_values": {"a": 1.0}})
+
+    def test_normalized_properties(self):
+        self.assertEqual({"a": "1", "method": "leastsq"},
+                         normalized_properties({"method ": " leastsq", "n_workers": "4", "a": "1", "cache": "True"}))
+
+    def test_key(self):
+        key = self.cache.key(self.signal_file, {"method": "leastsq", "n_workers": "1"}, True)
+        self.assertEqual(key, self.cache.key(self.signal_file, {"n_workers": "8", "method": "leastsq "}, True))
+        self.assertNotEqual(key, self.cache.key(self.signal_file, {"method": "least_squares"}, True))
+        self.assertNotEqual(key, self.cache.key(self.signal_file, {"method": "leastsq"}, False))
+        self.assertNotEqual(key, self.cache.key(self.signal_file, {"method": "leastsq"}, True, {"a": 1.0}))
+        with open(self.signal_file, "a") as file:
+            file.write("2.0,3.0\n")
+        self.assertNotEqual(key, self.cache.key(self.signal_file, {"method": "leastsq"}, True))
+
+    def test_store_and_load(self):
+        self.assertIsNone(self.cache.load("ab" * 32, self.output_dir))
+        self.store("ab" * 32, 10)
+        other_dir = path_utils.join(self.tmp_dir, "other")
+        os.makedirs(other_dir)
+        status = self.cache.load("ab" * 32, other_dir)
+        self.assertEqual({"exit_code": 0, "output_dir": other_dir, "peaks": {"File": [self.signal_file]},
+                          "best_values": {"a": 1.0}, "cached": True}, status)
+        with open(path_utils.join(other_dir, "signal.fit.dpt"), "rb") as file:
+            self.assertEqual(b"x" * 10, file.read())
+
+    def test_evicts_least_recently_used(self):
+        self.store("aa" * 32, 1000)
+        time.sleep(0.05)
+        self.store("bb" * 32, 1000)
+        time.sleep(0.05)
+        self.assertIsNotNone(self.cache.load("aa" * 32, self.output_dir))
+        time.sleep(0.05)
+        self.store("cc" * 32, 1000)
+        self.assertLessEqual(self.cache.size(), 2500)
+        self.assertIsNone(self.cache.load("bb" * 32, self.output_dir))
+        self.assertIsNotNone(self.cache.load("aa" * 32, self.output_dir))
+        self.assertIsNotNone(self.cache.load("cc" * 32, self.output_dir))
+
+    def test_scans_only_when_full(self):
+        scans = []
+        entries = self.cache.entries
+
+        def counted_entries():
+            scans.append(1)
+            return entries()
+
+        self.cache.entries = counted_entries
+        self.store("aa" * 32, 500)
+        self.store("bb" * 32, 500)
+        self.store("aa" * 32, 600)
+        self.assertEqual(1, len(scans))
+        self.assertEqual(entries_size(entries()), self.cache.total_size)
+        # Crossing the limit scans again, and frees entries below it
+        self.store("cc" * 32, 1500)
+        self.assertEqual(2, len(scans))
+        self.assertLessEqual(self.cache.total_size, 2250)
+        self.assertEqual(entries_size(entries()), self.cache.total_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
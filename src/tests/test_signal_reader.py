@@ -0,0 +1,63 @@
+import os.path as path_utils
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.logic.signal_reader import SignalReader
+
+DEFAULT_SEPARATOR = "\\ +|\\t+|,"
+
+
+class SignalReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content):
+        path = path_utils.join(self.tmp_dir, name)
+        with open(path, "w") as file:
+            file.write(content)
+        return path
+
+    def assert_same_as_regex(self, reader, path):
+        x, y = reader.read(path)
+        expected_x, expected_y = reader.read_with_regex(path)
+        np.testing.assert_array_equal(expected_x, x)
+        np.testing.assert_array_equal(expected_y, y)
+        self.assertTrue(x.flags["C_CONTIGUOUS"] and y.flags["C_CONTIGUOUS"])
+        self.assertEqual(np.float64, x.dtype)
+
+    def test_detect_comma(self):
+        reader = SignalReader(DEFAULT_SEPARATOR, False)
+        path = self.write("signal.dpt", "1800.43125,0.00482\n1798.89167,-0.00041\n")
+        self.assert_same_as_regex(reader, path)
+        self.assertTrue(reader.fast)
+        self.assertEqual(",", reader.fast_separator)
+
+    def test_detect_whitespace(self):
+        reader = SignalReader(DEFAULT_SEPARATOR, True)
+        path = self.write("signal.dpt", "wave intensity\n1.0  2.5\n2.0\t\t3.5\n")
+        self.assert_same_as_regex(reader, path)
+        self.assertTrue(reader.fast)
+        self.assertIsNone(reader.fast_separator)
+
+    def test_no_plain_separator(self):
+        reader = SignalReader("\\t+|;", False)
+        path = self.write("signal.dpt", "1.0;2.5\n2.0\t3.5\n")
+        self.assert_same_as_regex(reader, path)
+        self.assertFalse(reader.fast)
+
+    def test_fall_back_to_regex(self):
+        reader = SignalReader(DEFAULT_SEPARATOR, False)
+        self.assert_same_as_regex(reader, self.write("first.dpt", "1.0,2.5\n2.0,3.5\n"))
+        self.assert_same_as_regex(reader, self.write("second.dpt", "1.0,2.5\n2.0\t3.5\n"))
+        self.assertTrue(reader.fast)
+
+
+if __name__ == '__main__':
+    unittest.main()
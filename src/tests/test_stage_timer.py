@@ -0,0 +1,42 @@
+import time
+import unittest
+
+from src.logic.stage_timer import StageTimer, format_total_timings, total_timings
+
+
+class StageTimerTest(unittest.TestCase):
+
+    def test_stages_add_up(self):
+        timer = StageTimer()
+        for _ in range(2):
+            with timer.stage("write"):
+                time.sleep(0.01)
+        with self.assertRaises(ValueError):
+            with timer.stage("fit"):
+                raise ValueError("failed fit")
+        timings = timer.as_dict()
+        self.assertEqual({"write", "fit"}, set(timings))
+        self.assertGreaterEqual(timings["write"]["wall"], 0.02)
+        self.assertGreaterEqual(timings["write"]["cpu"], 0.0)
+
+    def test_continues_timings(self):
+        timer = StageTimer({"fit": {"wall": 1.0, "cpu": 0.5}})
+        timer.add("fit", 1.0, 0.5)
+        timer.add("aggregate", 0.1, 0.1)
+        self.assertEqual({"fit": {"wall": 2.0, "cpu": 1.0}, "aggregate": {"wall": 0.1, "cpu": 0.1}}, timer.as_dict())
+
+    def test_total_timings(self):
+        statuses = [{"timings": {"fit": {"wall": 3.0, "cpu": 2.0}}, "fit_statistics": {"nfev": 10}},
+                    {"timings": {"fit": {"wall": 1.0, "cpu": 1.0}, "write": {"wall": 4.0, "cpu": 0.5}}},
+                    {"exit_code": 1},
+                    {"exit_code": 1, "timings": {}, "fit_statistics": None}]
+        totals = total_timings(statuses)
+        self.assertEqual({"n_files": 3, "nfev": 10, "timings": {"fit": {"wall": 4.0, "cpu": 3.0},
+                                                                 "write": {"wall": 4.0, "cpu": 0.5}}}, totals)
+        lines = format_total_timings(totals).splitlines()
+        self.assertEqual("timings of 3 file(s), 10 function evaluations:", lines[0])
+        self.assertTrue(lines[1].startswith("fit") and lines[1].endswith("50.0%"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+
+import numpy as np
+
+from src.logic.deconvolution import Deconvolver
+from src.logic.windowing import (auto_windows, bound_windows, fit_windows, merge_intervals, partition, peak_prefixes,
+                                 signal_runs)
+
+
+def grouped_properties(centers, sigmas, windowing):
+    properties = {"method": "least_squares",
+                  "n_gauss": str(len(centers)),
+                  "include_background": "False",
+                  "gauss_peak_amp_min_default": "0",
+                  "gauss_peak_amp_max_default": "100",
+                  "windowing": windowing}
+    for i, (center, sigma) in enumerate(zip(centers, sigmas), start=1):
+        properties[f"gauss_peak{i}_mu_min"] = str(center - 2.0)
+        properties[f"gauss_peak{i}_mu_max"] = str(center + 2.0)
+        properties[f"gauss_peak{i}_sigma_min"] = str(sigma * 0.8)
+        properties[f"gauss_peak{i}_sigma_max"] = str(sigma * 1.2)
+    return properties
+
+
+class WindowingTest(unittest.TestCase):
+
+    def setUp(self):
+        # Three groups of two overlapping peaks, far apart from each other, on a descending x axis
+        self.centers = [100.0, 110.0, 300.0, 312.0, 500.0, 508.0]
+        self.sigmas = [4.0, 3.0, 5.0, 4.0, 3.0, 4.0]
+        amplitudes = [10.0, 6.0, 8.0, 12.0, 5.0, 9.0]
+        self.x = np.linspace(600.0, 0.0, 1200)
+        self.signal = sum(Deconvolver.gaussian(self.x, a, c, s)
+                          for a, c, s in zip(amplitudes, self.centers, self.sigmas))
+        self.signal = self.signal + np.random.default_rng(0).normal(0.0, 0.001, len(self.x))
+
+    def template_and_params(self, windowing):
+        template = Deconvolver.fit_template(grouped_properties(self.centers, self.sigmas, windowing))
+        return template, template.make_params(self.x, self.signal)
+
+    def test_signal_runs(self):
+        is_signal = np.array([0, 1, 1, 0, 1, 0, 0, 0, 1, 1], dtype=bool)
+        self.assertEqual([(1, 3), (4, 5), (8, 10)], signal_runs(is_signal, 1))
+        self.assertEqual([(1, 5), (8, 10)], signal_runs(is_signal, 2))
+        self.assertEqual([(1, 10)], signal_runs(is_signal, 4))
+        self.assertEqual([], signal_runs(np.zeros(5, dtype=bool), 2))
+
+    def test_merge_intervals(self):
+        merged = merge_intervals([(5.0, 8.0, ["b"]), (0.0, 2.0, ["a"]), (7.0, 9.0, ["c"]), (1.0, 1.5, ["d"])])
+        self.assertEqual([(0.0, 2.0, ["a", "d"]), (5.0, 9.0, ["b", "c"])], merged)
+        np.testing.assert_array_equal([0, 0, 1, 1], partition(np.array([-1.0, 3.4, 3.6, 10.0]), merged))
+
+    def test_bound_windows(self):
+        template, params = self.template_and_params("bounds")
+        windows = template.windows(self.x, self.signal, params)
+        self.assertEqual([["gauss_peak1_", "gauss_peak2_"], ["gauss_peak3_", "gauss_peak4_"],
+                          ["gauss_peak5_", "gauss_peak6_"]], [prefixes for _, _, prefixes in windows])
+        # Margins of 3 sigmas make the third window reach the second
+        windows = bound_windows(params, peak_prefixes(6, 0), 40.0)
+        self.assertEqual(1, len(windows))
+
+    def test_auto_windows(self):
+        template, params = self.template_and_params("auto")
+        windows = template.windows(self.x, self.signal, params)
+        self.assertEqual([["gauss_peak1_", "gauss_peak2_"], ["gauss_peak3_", "gauss_peak4_"],
+                          ["gauss_peak5_", "gauss_peak6_"]], [prefixes for _, _, prefixes in windows])
+        # A flat signal has no gaps
+        windows = auto_windows(self.x, np.zeros_like(self.x), params, peak_prefixes(6, 0), 5.0, 5)
+        self.assertEqual([(-np.inf, np.inf, peak_prefixes(6, 0))], windows)
+
+    def test_fit_windows_same_as_single_fit(self):
+        template, params = self.template_and_params("bounds")
+        expected = template.model.fit(data=self.signal, x=self.x, params=params.copy(), method="least_squares")
+        windows = template.windows(self.x, self.signal, params)
+        result = fit_windows(template.model, params, self.x, self.signal, windows, method="least_squares")
+        self.assertEqual(3, result.n_windows)
+        for name in expected.best_values:
+            self.assertAlmostEqual(expected.best_values[name], result.best_values[name], places=4, msg=name)
+        np.testing.assert_allclose(expected.best_fit, result.best_fit, atol=1e-4)
+        self.assertEqual(sum(r.nfev for r in result.results), result.nfev)
+        self.assertEqual(3, result.fit_report().count("[[Window "))
+
+    def test_windowing_needs_no_background(self):
+        properties = grouped_properties(self.centers, self.sigmas, "bounds")
+        properties["include_background"] = "True"
+        self.assertRaises(ValueError, Deconvolver.fit_template, properties)
+        properties = grouped_properties(self.centers, self.sigmas, "sliding")
+        self.assertRaises(ValueError, Deconvolver.fit_template, properties)
+
+
+if __name__ == '__main__':
+    unittest.main()
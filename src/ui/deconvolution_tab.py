@@ -6,7 +6,8 @@ from tkinter import filedialog as fd
 
 import customtkinter as ctk
 
-from src.logic.deconvolution import Deconvolver
+from src.logic.deconvolution_batch import BatchDeconvolver
+from src.logic.stage_timer import format_total_timings
 from src.ui.progress_textbox import ProgressTextbox
 from src.ui.properties_frame import PropertiesFrame
 
@@ -14,7 +15,6 @@ from src.ui.properties_frame import PropertiesFrame
 class DeconvolutionTab:
     def __init__(self, frame: ctk.CTkFrame):
         self.frame = frame
-        self.deconvolver = Deconvolver()
 
         dir_path = os.path.dirname(os.path.realpath(__file__))
         self.default_properties_file = os.path.join(
@@ -85,6 +85,7 @@ class DeconvolutionTab:
         self.experiment_uuid = None
         self.experiment_label = None
         self.experiment_checkpoint = None
+        self.experiment_batch = None
         self.reset_experiment()
 
     def load_default_signal_files(self):
@@ -135,6 +136,7 @@ class DeconvolutionTab:
         self.experiment_uuid = None
         self.experiment_label = None
         self.experiment_checkpoint = None
+        self.experiment_batch = None
         self.start_button.configure(text="Start")
 
     def start_experiment(self, experiment_label, experiment_uuid):
@@ -163,37 +165,47 @@ class DeconvolutionTab:
         self.experiment_uuid = None
         self.experiment_label = None
         self.experiment_checkpoint = None
+        self.experiment_batch = None
         self.start_button.configure(text="Start")
 
     def is_experiment_current(self, experiment_uuid):
         return self.experiment_uuid == experiment_uuid
 
     def run(self, experiment_label, experiment_uuid, filenames, first_index, last_index):
-        properties = self.model_selection_frame.extract_properties()
+        if self.experiment_batch is None:
+            properties = self.model_selection_frame.extract_properties()
+            try:
+                self.experiment_batch = BatchDeconvolver(filenames=filenames,
+                                                         experiment_label=experiment_label,
+                                                         properties=properties)
+            except Exception as e:
+                self.progress_textbox.log_error_progress_line(str(e))
+                self.finish_experiment()
+                return
+        experiment_batch = self.experiment_batch
         deconvolution_status = None
-        for i in range(first_index, last_index):
+        for i, filename, deconvolution_status in experiment_batch.run(
+                first_index=first_index,
+                last_index=last_index,
+                is_current=lambda: self.is_experiment_current(experiment_uuid)):
             if self.is_experiment_current(experiment_uuid):
-                filename = filenames[i]
-                deconvolution_status = self.deconvolver.deconvolve_single_file(
-                    signal_file_abs_path=filename,
-                    experiment_label=experiment_label,
-                    properties=properties)
-                if self.is_experiment_current(experiment_uuid):
-                    if deconvolution_status.get("exit_code") == 0:
-                        self.progress_textbox.log_ok_progress_line("{filename}".format(
-                            filename=filename
-                        ))
-                    else:
-                        self.progress_textbox.log_error_progress_line("{filename}".format(
-                            filename=filename
-                        ))
-                        self.progress_textbox.log_info_progress_line(
-                            deconvolution_status.get("error_message").strip())
-                    self.progress_label.configure(
-                        text=f"Progress: {round((i + 1) / len(filenames) * 100, 2)}%")
-                    self.experiment_checkpoint = i
+                if deconvolution_status.get("exit_code") == 0:
+                    self.progress_textbox.log_ok_progress_line("{filename}{cached}".format(
+                        filename=filename,
+                        cached=" (cached)" if deconvolution_status.get("cached") else ""
+                    ))
+                else:
+                    self.progress_textbox.log_error_progress_line("{filename}".format(
+                        filename=filename
+                    ))
+                    self.progress_textbox.log_info_progress_line(
+                        deconvolution_status.get("error_message").strip())
+                self.progress_label.configure(
+                    text=f"Progress: {round(len(experiment_batch.completed) / len(filenames) * 100, 2)}%")
+                self.experiment_checkpoint = experiment_batch.checkpoint
         if self.is_experiment_current(experiment_uuid):
             self.progress_textbox.log_info_progress_line("{exp} finished".format(exp=experiment_label))
+            self.progress_textbox.log_info_progress_line(format_total_timings(experiment_batch.timing_summary()))
             if deconvolution_status is not None:
                 self.progress_textbox.log_experiment_hyperlink_line(deconvolution_status.get("output_dir"))
             self.finish_experiment()
@@ -222,7 +234,7 @@ class DeconvolutionTab:
                 "{exp} resumed".format(exp=experiment_label))
             filenames = self.extract_file_names()
             if len(filenames) > 0:
-                first_index = 1
+                first_index = 0
                 if self.experiment_checkpoint is not None:
                     first_index = self.experiment_checkpoint + 1
                 self.run(filenames=filenames,
@@ -7,9 +7,10 @@ from threading import Thread
 from tkinter import filedialog as fd
 
 import customtkinter as ctk
-from click.testing import CliRunner
+from matplotlib.figure import Figure
 
-from src.logic.ellipses import extrapolate_ellipse
+from src.logic.ellipses import extrapolate, format_avg_z_rings, load_diameter, plot_extrapolation
+from src.logic.ellipses_batch import extrapolate_pairs, find_diameter_pairs, save_ring_table
 from src.ui.progress_textbox import ProgressTextbox
 from src.ui.properties_frame import PropertiesFrame
 
@@ -18,6 +19,8 @@ class EllipsesTab:
     def __init__(self, frame: ctk.CTkFrame):
         self.frame = frame
         self.diameter_files = {"long diameter": "N/A", "short diameter": "N/A"}
+        # Pairs of files of a directory, extrapolated instead of diameter_files when selected
+        self.diameter_pairs = []
 
         dir_path = os.path.dirname(os.path.realpath(__file__))
         self.default_properties_file = os.path.join(
@@ -68,6 +71,12 @@ class EllipsesTab:
                                                                    args=["short diameter"]).start())
         self.select_short_diameter_file_button.pack(pady=12, padx=10)
 
+        self.select_diameter_directory_button = ctk.CTkButton(master=self.signal_selection_frame,
+                                                              text="Diameter files directory...",
+                                                              command=lambda: Thread(
+                                                                  target=self.select_diameter_directory).start())
+        self.select_diameter_directory_button.pack(pady=12, padx=10)
+
         self.clear_selection_button = ctk.CTkButton(master=self.signal_selection_frame,
                                                     text="Clear selection",
                                                     command=lambda: Thread(target=self.clear_files).start())
@@ -101,20 +110,41 @@ class EllipsesTab:
         if filename is not None:
             self.signal_files_textbox.delete("1.0", ctk.END)
             self.diameter_files[label] = filename
+            self.diameter_pairs = []
             self.signal_files_textbox.insert(ctk.END, json.dumps(self.diameter_files, indent=4))
 
+    def select_diameter_directory(self):
+        directory = fd.askdirectory(title="Open directory", initialdir="")
+        if directory:
+            try:
+                pairs = find_diameter_pairs([directory])
+            except ValueError as e:
+                self.progress_textbox.log_error_progress_line(str(e))
+                return
+            if len(pairs) == 0:
+                self.progress_textbox.log_error_progress_line(
+                    "No *_long.tsv and *_short.tsv file pairs in {dir}".format(dir=directory))
+                return
+            self.signal_files_textbox.delete("1.0", ctk.END)
+            self.diameter_pairs = pairs
+            self.signal_files_textbox.insert(ctk.END, json.dumps(self.diameter_pairs, indent=4))
+
     def load_default_signal_files(self):
         with open(self.default_signal_files, "r") as file:
             for line in file.readlines():
                 self.signal_files_textbox.insert(ctk.END, line)
             tmp = json.loads(self.signal_files_textbox.get("1.0", ctk.END))
-            self.diameter_files["long diameter"] = tmp["long diameter"]
-            self.diameter_files["short diameter"] = tmp["short diameter"]
+            if isinstance(tmp, list):
+                self.diameter_pairs = tmp
+            else:
+                self.diameter_files["long diameter"] = tmp["long diameter"]
+                self.diameter_files["short diameter"] = tmp["short diameter"]
 
     def clear_files(self):
         self.signal_files_textbox.delete(1.0, ctk.END)
         self.diameter_files["long diameter"] = "N/A"
         self.diameter_files["short diameter"] = "N/A"
+        self.diameter_pairs = []
         self.signal_files_textbox.insert(ctk.END, json.dumps(self.diameter_files, indent=4))
 
     def save_signal_files(self):
@@ -129,6 +159,10 @@ class EllipsesTab:
                 self.start_experiment(experiment_label, experiment_uuid)
                 self.progress_textbox.log_info_progress_line("{exp} started".format(exp=experiment_label))
 
+                if len(self.diameter_pairs) > 0:
+                    self.start_pairs(experiment_label)
+                    return
+
                 # Prepare experiment
                 if self.diameter_files["long diameter"] == "N/A":
                     raise Exception("Long diameter file not selected")
@@ -142,29 +176,57 @@ class EllipsesTab:
                 properties = self.model_selection_frame.extract_properties()
                 output_file_name = properties["output_file_name"] or "output.png"
                 plot_file_name = properties["plot_file_name"] or "output.png"
+                grid_x = int(properties.get("grid_x") or "500")
+                grid_y = int(properties.get("grid_y") or "500")
+                output_format = properties.get("output_format") or "dpt"
 
                 # Run experiment
-                runner = CliRunner()
-                result = runner.invoke(extrapolate_ellipse, [
-                    '--long-diameter-file', self.diameter_files["long diameter"],
-                    '--short-diameter-file', self.diameter_files["short diameter"],
-                    '--output-file', path_utils.join(output_dir, output_file_name),
-                    '--plot-file', path_utils.join(output_dir, plot_file_name),
-                    '--skip-showing-results'
-                ])
+                result = extrapolate(long_diameter=load_diameter(self.diameter_files["long diameter"]),
+                                     short_diameter=load_diameter(self.diameter_files["short diameter"]),
+                                     grid_x_points=grid_x,
+                                     grid_y_points=grid_y,
+                                     output_file=path_utils.join(output_dir, output_file_name),
+                                     output_format=output_format)
+                figure = Figure()
+                plot_extrapolation(figure, result)
+                figure.savefig(path_utils.join(output_dir, plot_file_name))
 
                 # Report experiment
-                if result.exit_code == 0:
-                    self.progress_textbox.log_info_progress_line("{exp} finished".format(exp=experiment_label))
-                    self.progress_textbox.log_info_progress_line("results:\n" + result.stdout)
-                    self.progress_textbox.log_experiment_hyperlink_line(output_dir)
-                else:
-                    self.progress_textbox.log_error_progress_line("\n" + result.stdout)
+                self.progress_textbox.log_info_progress_line("{exp} finished".format(exp=experiment_label))
+                self.progress_textbox.log_info_progress_line(
+                    "results:\n" + format_avg_z_rings(self.diameter_files["long diameter"],
+                                                      self.diameter_files["short diameter"],
+                                                      result["rings"]))
+                self.progress_textbox.log_experiment_hyperlink_line(output_dir)
                 self.finish_experiment()
         except Exception as e:
             self.progress_textbox.log_error_progress_line(str(e))
             self.finish_experiment()
 
+    def start_pairs(self, experiment_label):
+        output_dir = path_utils.join(path_utils.dirname(self.diameter_pairs[0]["long diameter"]), experiment_label)
+        properties = self.model_selection_frame.extract_properties()
+        statuses = {}
+        for i, pair, status in extrapolate_pairs(pairs=self.diameter_pairs,
+                                                 output_dir=output_dir,
+                                                 grid_x_points=int(properties.get("grid_x") or "500"),
+                                                 grid_y_points=int(properties.get("grid_y") or "500"),
+                                                 output_format=properties.get("output_format") or "dpt"):
+            statuses[i] = status
+            if status["exit_code"] == 0:
+                self.progress_textbox.log_ok_progress_line(
+                    "{name} finished ({n}/{total})".format(name=pair["name"], n=len(statuses),
+                                                           total=len(self.diameter_pairs)))
+                self.progress_textbox.log_info_progress_line(
+                    "results:\n" + format_avg_z_rings(pair["long diameter"], pair["short diameter"], status["rings"]))
+            else:
+                self.progress_textbox.log_error_progress_line(
+                    "{name} failed: {error}".format(name=pair["name"], error=status["error_message"]))
+        save_ring_table(output_dir, self.diameter_pairs, statuses)
+        self.progress_textbox.log_info_progress_line("{exp} finished".format(exp=experiment_label))
+        self.progress_textbox.log_experiment_hyperlink_line(output_dir)
+        self.finish_experiment()
+
     def on_closing(self):
         self.model_selection_frame.save_default_properties()
         self.save_signal_files()